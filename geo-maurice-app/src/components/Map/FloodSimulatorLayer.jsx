@@ -1,5 +1,235 @@
 import React, { useEffect, useRef, useState } from 'react';
 import { useMap, ImageOverlay } from 'react-leaflet';
+import L from 'leaflet';
+
+// SQRT Decoding table: Height = (Pixel / 255.0)^2 * maxH
+const decodeTable = (maxH) => {
+    const decode = new Float32Array(256);
+    for (let v = 0; v < 256; v++) decode[v] = (v / 255.0) * (v / 255.0) * maxH;
+    return decode;
+};
+
+/**
+ * Pixel decoders of the raster encoding (metadata.encoding, see
+ * scripts/flood_encoding.py): land mask, value tested against the water
+ * level, height for the water depth and population density on 0-255.
+ * The decoded canvas pixels are RGBA whatever the image channels.
+ */
+const makeCodec = (metadata, mode) => {
+    const maxH = metadata.max_height;
+    const sqrt8 = decodeTable(maxH);
+    // Value > 250 (Safe / >50m) -> Skip
+    const safe = sqrt8[250];
+
+    if (metadata.encoding === 'rg16') {
+        const k = maxH / (65534 * 65534);
+        const height16 = (d, i) => {
+            const c = ((d[i] << 8) | d[i + 1]) - 1;
+            return c * c * k;
+        };
+        return {
+            safe,
+            land: (d, i) => (d[i] | d[i + 1]) !== 0,
+            flood: height16,
+            // Sea mode: 8-bit sqrt elevation in blue
+            height: mode === 'sea' ? (d, i) => sqrt8[d[i + 2]] : height16,
+            population: (d, i) => (((d[i] << 8) | d[i + 1]) - 1) / 65534 * 255
+        };
+    }
+
+    if (metadata.encoding === 'gray') {
+        const gray = new Float32Array(256);
+        for (let v = 1; v < 256; v++) gray[v] = ((v - 1) / 254) * ((v - 1) / 254) * maxH;
+        const height8 = (d, i) => gray[d[i]];
+        return {
+            safe,
+            land: (d, i) => d[i] !== 0,
+            flood: height8,
+            height: height8,
+            population: (d, i) => (d[i] - 1) / 254 * 255
+        };
+    }
+
+    // sqrt (legacy): height in red, land in alpha. Sea mode: the green channel
+    // holds the sea level at which the pixel gets connected to the ocean
+    // (inland depressions stay dry until they spill)
+    const floodChannel = (mode === 'sea' && metadata.sea_onset === 'green') ? 1 : 0;
+    return {
+        safe,
+        land: (d, i) => d[i + 3] !== 0,
+        flood: (d, i) => sqrt8[d[i + floodChannel]],
+        height: (d, i) => sqrt8[d[i]],
+        population: (d, i) => d[i]
+    };
+};
+
+/**
+ * Shades the flooded pixels of a decoded source buffer into `outData`, for
+ * a full raster or a single tile.
+ */
+const shadeFlood = (srcData, popData, outData, level, usePop, codec) => {
+    for (let i = 0; i < srcData.length; i += 4) {
+        // Mask 0 (Ocean) or above the safe height -> Skip
+        if (!codec.land(srcData, i)) {
+            outData[i + 3] = 0;
+            continue;
+        }
+
+        const heightM = codec.height(srcData, i);
+        if (heightM > codec.safe) {
+            outData[i + 3] = 0;
+            continue;
+        }
+
+        if (codec.flood(srcData, i) <= level) {
+            // FLOODED
+
+            // Calculate visualization params
+            const depth = level - heightM;
+            // Deeper = more opaque/darker usually
+            const depthRatio = Math.min(1, depth / 10.0); // 0-10m ramp
+
+            // Base water color (Blue-ish)
+            let red = 41;
+            let green = 128;
+            let blue = 185;
+            let alpha; // Declare alpha here
+
+            // Population Impact Logic
+            if (usePop && popData) {
+                const popVal = codec.population(popData, i); // Density 0-255
+
+                if (popVal > 1) { // Threshold for "inhabited"
+                    // High Impact: Shift to Red/alert color
+                    // Mix Blue and Red based on density
+                    const ratio = Math.min(1, popVal / 100.0); // Saturation ramp
+
+                    red = 41 + (231 - 41) * ratio;   // Mix towards #e74c3c
+                    green = 128 + (76 - 128) * ratio;
+                    blue = 185 + (60 - 185) * ratio;
+
+                    // Opacity dependent on population (more people = more visible)
+                    alpha = Math.max(160, 60 + (ratio * 195));
+                } else {
+                    // Unpopulated zone -> Faintly visible (Ghost Water)
+                    // User requested not to disappear completely
+                    alpha = 50;
+                }
+            } else {
+                // Standard Mode (No Population Weighting)
+                // User requested "transparent", not "total opacity"
+                // Reduced range from 140-255 to 100-180
+                alpha = 100 + (depthRatio * 80);
+            }
+
+            outData[i] = red;
+            outData[i + 1] = green;
+            outData[i + 2] = blue;
+            outData[i + 3] = alpha;
+
+        } else {
+            // Dry
+            outData[i + 3] = 0;
+        }
+    }
+};
+
+const loadPixels = (src, width, height) => new Promise((resolve) => {
+    const img = new Image();
+    img.crossOrigin = "Anonymous";
+    img.onload = () => {
+        const c = document.createElement('canvas');
+        c.width = width;
+        c.height = height;
+        const ctx = c.getContext('2d');
+        ctx.drawImage(img, 0, 0);
+        resolve(ctx.getImageData(0, 0, width, height).data);
+    };
+    img.onerror = (e) => {
+        console.warn(`Failed to load ${src}`, e);
+        resolve(null); // Resolve null to not block others
+    };
+    img.src = src;
+});
+
+/**
+ * Tiled flood simulator: only the populated tiles in view are fetched (see
+ * tiles.json), each one is shaded like the full raster.
+ */
+const FloodTileLayer = ({ manifest, baseUrl, metadata, floodLevel, riskMode, populationWeighting }) => {
+    const map = useMap();
+    const layerRef = useRef(null);
+    const paramsRef = useRef(null);
+    paramsRef.current = { level: floodLevel, mode: riskMode, usePop: populationWeighting };
+
+    useEffect(() => {
+        const size = manifest.tile_size;
+        const codecs = { river: makeCodec(metadata, 'river'), sea: makeCodec(metadata, 'sea') };
+        const populated = {};
+        for (const [name, layer] of Object.entries(manifest.layers)) {
+            populated[name] = new Set(Object.entries(layer.tiles).flatMap(
+                ([z, tiles]) => tiles.map(([x, y]) => `${z}/${x}/${y}`)));
+        }
+
+        // Decoded pixels of every fetched tile, reused when the level changes
+        const cache = new Map();
+        const loadTile = (name, coords) => {
+            const key = `${coords.z}/${coords.x}/${coords.y}`;
+            if (!populated[name] || !populated[name].has(key)) return Promise.resolve(null);
+            if (!cache.has(`${name}/${key}`)) {
+                const url = baseUrl + L.Util.template(manifest.layers[name].url, coords);
+                cache.set(`${name}/${key}`, loadPixels(url, size, size));
+            }
+            return cache.get(`${name}/${key}`);
+        };
+
+        const FloodGrid = L.GridLayer.extend({
+            createTile(coords, done) {
+                const tile = document.createElement('canvas');
+                tile.width = size;
+                tile.height = size;
+
+                const { level, mode, usePop } = paramsRef.current;
+                const source = mode === 'sea' ? 'sea' : 'flood';
+                Promise.all([
+                    level > 0 ? loadTile(source, coords) : null,
+                    usePop ? loadTile('population', coords) : null
+                ]).then(([srcData, popData]) => {
+                    if (srcData) {
+                        const ctx = tile.getContext('2d');
+                        const out = ctx.createImageData(size, size);
+                        shadeFlood(srcData, popData, out.data, level, usePop,
+                            mode === 'sea' ? codecs.sea : codecs.river);
+                        ctx.putImageData(out, 0, 0);
+                    }
+                    done(null, tile);
+                });
+                return tile;
+            }
+        });
+
+        layerRef.current = new FloodGrid({
+            tileSize: size,
+            minNativeZoom: manifest.minzoom,
+            maxNativeZoom: manifest.maxzoom,
+            bounds: manifest.bounds,
+            pane: 'overlayPane',
+            zIndex: 500
+        }).addTo(map);
+
+        return () => {
+            map.removeLayer(layerRef.current);
+            layerRef.current = null;
+        };
+    }, [map, manifest, baseUrl, metadata]);
+
+    // Re-shade the tiles in view (their pixels are cached)
+    useEffect(() => {
+        if (layerRef.current) layerRef.current.redraw();
+    }, [floodLevel, riskMode, populationWeighting]);
+
+    return null;
+};
 
 /**
  * Renders a client-side dynamic flood model with Sea Level Rise and Population Impact modes.
@@ -13,6 +243,7 @@ const FloodSimulatorLayer = ({ floodLevel, riskMode = 'river', populationWeighti
     const [imageUrl, setImageUrl] = useState(null);
     const [bounds, setBounds] = useState(null);
     const [metadata, setMetadata] = useState(null);
+    const [tiles, setTiles] = useState(null);
 
     // Off-screen canvas buffers
     const buffersRef = useRef({
@@ -27,7 +258,7 @@ const FloodSimulatorLayer = ({ floodLevel, riskMode = 'river', populationWeighti
 
         const loadBuffs = async () => {
             // Avoid reloading if already present (naive check)
-            if (buffersRef.current.hand && buffersRef.current.sea && buffersRef.current.pop) return;
+            if (tiles || (buffersRef.current.hand && buffersRef.current.sea && buffersRef.current.pop)) return;
 
             try {
                 // Fetch stats
@@ -37,32 +268,26 @@ const FloodSimulatorLayer = ({ floodLevel, riskMode = 'river', populationWeighti
                 setMetadata(meta);
                 setBounds(meta.bounds);
 
+                // Tile pyramid: only the tiles in view are loaded
+                if (meta.tiles) {
+                    const tilesRes = await fetch(`/data/hazards/${meta.tiles}`);
+                    if (tilesRes.ok) {
+                        const baseUrl = `/data/hazards/${meta.tiles.split('/').slice(0, -1).join('/')}/`;
+                        setTiles({ manifest: await tilesRes.json(), baseUrl });
+                        return;
+                    }
+                }
+
                 const w = meta.width;
                 const h = meta.height;
+                const loadImageData = (src) => loadPixels(src, w, h);
 
-                const loadImageData = (src) => new Promise((resolve, reject) => {
-                    const img = new Image();
-                    img.src = src;
-                    img.crossOrigin = "Anonymous";
-                    img.onload = () => {
-                        const c = document.createElement('canvas');
-                        c.width = w;
-                        c.height = h;
-                        const ctx = c.getContext('2d');
-                        ctx.drawImage(img, 0, 0);
-                        resolve(ctx.getImageData(0, 0, w, h).data);
-                    };
-                    img.onerror = (e) => {
-                        console.warn(`Failed to load ${src}`, e);
-                        resolve(null); // Resolve null to not block others
-                    };
-                });
-
-                // Load all concurrently
+                // Load all concurrently (file names depend on the image format)
+                const files = meta.files || {};
                 const [handData, seaData, popData] = await Promise.all([
-                    loadImageData('/data/hazards/flood_hand.png'),
-                    loadImageData('/data/hazards/sea_level.png'),
-                    loadImageData('/data/hazards/flood_population.png')
+                    loadImageData(`/data/hazards/${files.flood || 'flood_hand.png'}`),
+                    loadImageData(`/data/hazards/${files.sea || 'sea_level.png'}`),
+                    loadImageData(`/data/hazards/${files.population || 'flood_population.png'}`)
                 ]);
 
                 buffersRef.current = {
@@ -84,10 +309,10 @@ const FloodSimulatorLayer = ({ floodLevel, riskMode = 'river', populationWeighti
 
     // 2. Dynamic Update
     useEffect(() => {
-        if (visible && metadata) {
+        if (visible && metadata && !tiles) {
             updateCanvas(floodLevel, riskMode, populationWeighting);
         }
-    }, [floodLevel, riskMode, populationWeighting, visible, metadata]);
+    }, [floodLevel, riskMode, populationWeighting, visible, metadata, tiles]);
 
     const updateCanvas = (level, mode, usePop) => {
         const bufs = buffersRef.current;
@@ -107,7 +332,7 @@ const FloodSimulatorLayer = ({ floodLevel, riskMode = 'river', populationWeighti
 
         const width = metadata.width;
         const height = metadata.height;
-        const maxH = metadata.max_height;
+        const codec = makeCodec(metadata, mode);
 
         const outCanvas = document.createElement('canvas');
         outCanvas.width = width;
@@ -116,77 +341,25 @@ const FloodSimulatorLayer = ({ floodLevel, riskMode = 'river', populationWeighti
         const outImgData = ctx.createImageData(width, height);
         const outData = outImgData.data;
 
-        for (let i = 0; i < srcData.length; i += 4) {
-            const r = srcData[i];     // Height
-            const a = srcData[i + 3]; // Mask (Land)
-
-            // Mask 0 (Ocean) or Value > 250 (Safe / >50m) -> Skip
-            if (a === 0 || r > 250) {
-                outData[i + 3] = 0;
-                continue;
-            }
-
-            // SQRT Decoding
-            // Height = (Pixel / 255.0)^2 * 820.0
-            const valNorm = r / 255.0;
-            const heightM = (valNorm * valNorm) * maxH;
-
-            if (heightM <= level) {
-                // FLOODED
-
-                // Calculate visualization params
-                const depth = level - heightM;
-                // Deeper = more opaque/darker usually
-                const depthRatio = Math.min(1, depth / 10.0); // 0-10m ramp
-
-                // Base water color (Blue-ish)
-                let red = 41;
-                let green = 128;
-                let blue = 185;
-                let alpha; // Declare alpha here
-
-                // Population Impact Logic
-                if (usePop && popData) {
-                    const popVal = popData[i]; // Density 0-255
-
-                    if (popVal > 1) { // Threshold for "inhabited"
-                        // High Impact: Shift to Red/alert color
-                        // Mix Blue and Red based on density
-                        const ratio = Math.min(1, popVal / 100.0); // Saturation ramp
-
-                        red = 41 + (231 - 41) * ratio;   // Mix towards #e74c3c
-                        green = 128 + (76 - 128) * ratio;
-                        blue = 185 + (60 - 185) * ratio;
-
-                        // Opacity dependent on population (more people = more visible)
-                        alpha = Math.max(160, 60 + (ratio * 195));
-                    } else {
-                        // Unpopulated zone -> Faintly visible (Ghost Water)
-                        // User requested not to disappear completely
-                        alpha = 50;
-                    }
-                } else {
-                    // Standard Mode (No Population Weighting)
-                    // User requested "transparent", not "total opacity"
-                    // Reduced range from 140-255 to 100-180
-                    alpha = 100 + (depthRatio * 80);
-                }
-
-                outData[i] = red;
-                outData[i + 1] = green;
-                outData[i + 2] = blue;
-                outData[i + 3] = alpha;
-
-            } else {
-                // Dry
-                outData[i + 3] = 0;
-            }
-        }
+        shadeFlood(srcData, popData, outData, level, usePop, codec);
 
         ctx.putImageData(outImgData, 0, 0);
         setImageUrl(outCanvas.toDataURL());
     };
 
+    if (visible && tiles && metadata) {
+        return (
+            <FloodTileLayer
+                manifest={tiles.manifest}
+                baseUrl={tiles.baseUrl}
+                floodLevel={floodLevel}
+                riskMode={riskMode}
+                populationWeighting={populationWeighting}
+                metadata={metadata}
+            />
+        );
+    }
+
     if (!visible || !imageUrl || !bounds) return null;
 
     return <ImageOverlay url={imageUrl} bounds={bounds} zIndex={500} />;
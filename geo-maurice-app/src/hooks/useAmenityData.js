@@ -1,6 +1,7 @@
 import { useState, useEffect } from 'react';
 import KDBush from 'kdbush';
 import { GROUPS } from '../config/amenities';
+import { loadGrid } from '../utils/grid';
 
 export function useAmenityData() {
     const [data, setData] = useState({});
@@ -24,11 +25,8 @@ export function useAmenityData() {
 
             // Fetch Population Data
             try {
-                const popRes = await fetch('/data/population.json');
-                if (popRes.ok) {
-                    const popJson = await popRes.json();
-                    if (isMounted) setPopulationData(popJson);
-                }
+                const popGrid = await loadGrid('population');
+                if (popGrid && isMounted) setPopulationData(popGrid);
             } catch (e) {
                 console.warn("Failed to load population data", e);
             } finally {
@@ -38,11 +36,8 @@ export function useAmenityData() {
 
             // Fetch Roads Friction Data
             try {
-                const roadsRes = await fetch('/data/roads_friction.json');
-                if (roadsRes.ok) {
-                    const roadsJson = await roadsRes.json();
-                    if (isMounted) setRoadsFrictionData(roadsJson);
-                }
+                const roadsGrid = await loadGrid('roads_friction');
+                if (roadsGrid && isMounted) setRoadsFrictionData(roadsGrid);
             } catch (e) {
                 console.warn("Failed to load roads friction data", e);
             }
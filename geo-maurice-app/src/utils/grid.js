@@ -0,0 +1,52 @@
+// Loader for the grids produced by the Python scripts (population, roads friction).
+// Binary `.grid` layout (see scripts/grid_io.py):
+//   8 bytes magic "GMGRID1\n", uint32 LE header length, JSON header,
+//   raw little-endian payload (float32 or uint16), row 0 = minLat.
+
+const MAGIC = 'GMGRID1\n';
+
+export function parseGrid(buffer) {
+    const bytes = new Uint8Array(buffer);
+    const magic = new TextDecoder().decode(bytes.subarray(0, MAGIC.length));
+    if (magic !== MAGIC) {
+        throw new Error('Not a grid file');
+    }
+
+    const view = new DataView(buffer);
+    const headerLength = view.getUint32(MAGIC.length, true);
+    const headerStart = MAGIC.length + 4;
+    const header = JSON.parse(new TextDecoder().decode(bytes.subarray(headerStart, headerStart + headerLength)));
+    const offset = headerStart + headerLength;
+    const size = header.width * header.height;
+
+    let values;
+    if (header.dtype === 'uint16') {
+        // Quantized payload: value = raw * scale + offset
+        const raw = new Uint16Array(buffer, offset, size);
+        values = new Float32Array(size);
+        for (let k = 0; k < size; k++) {
+            values[k] = raw[k] * header.scale + header.offset;
+        }
+    } else {
+        // Payload is 16-byte aligned, the typed array is a view without copy
+        values = new Float32Array(buffer, offset, size);
+    }
+
+    return { ...header, values };
+}
+
+// Fetch `/data/<name>.grid`, falling back to the legacy `/data/<name>.json`.
+export async function loadGrid(name) {
+    const binRes = await fetch(`/data/${name}.grid`);
+    if (binRes.ok) {
+        try {
+            return parseGrid(await binRes.arrayBuffer());
+        } catch (e) {
+            console.warn(`Invalid binary grid for ${name}, trying JSON`, e);
+        }
+    }
+
+    const jsonRes = await fetch(`/data/${name}.json`);
+    if (!jsonRes.ok) return null;
+    return jsonRes.json();
+}
@@ -1,3 +1,4 @@
+// Same grid as scripts/grid_regions.py (GRID_BBOX)
 export const GRID_BBOX = {
     minLat: -20.60, // South of Mauritius
     maxLat: -19.40, // Expanded further North for Rodrigues
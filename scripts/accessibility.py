@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+Offline accessibility engine: travel-cost rasters per amenity.
+
+For each amenity (osm/<amenity>.geojson) and each friction setting, a
+multi-source Dijkstra (scipy.sparse.csgraph) over the 8-connected friction
+grid gives the travel cost in meters from every cell to the nearest amenity.
+This is the search done by calculateHeatmap() in heatmap.js, done once per
+island region instead of in the browser on every profile change.
+
+The friction model is the one of heatmap.js, it depends on the source
+(population or roads) and on the profile road factor:
+- roads: 1 + (road_friction - 1) * (road_factor - 1) / 4
+- population: 1 + (road_factor - 1) * (1 - min(1, sqrt(pop) / 5))
+
+Outputs: accessibility/<source>_rf<road_factor>/<amenity>.<region>.grid
+(cost in meters, float32, see grid_io.py) and an index.json per setting.
+
+After an incremental road update, --roads-changes <report> (the changed
+tiles accumulated by fetch_roads_friction.py) only recomputes the 'roads'
+rasters of the regions with changed tiles, and clears the report once
+consumed. Every setting records the fingerprint of its other inputs (the
+amenity files, and the population grids for the population source): when
+they changed, all its regions are recomputed whatever the report.
+"""
+
+import argparse
+import json
+import time
+import numpy as np
+from pathlib import Path
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+from content_hash import fingerprint
+from grid_io import read_grid, grid_values, save_grid_outputs
+from grid_regions import PUBLIC_DATA_DIR, region_grids, locate
+from raster_store import has_band, read_band, store_path
+
+OSM_DIR = PUBLIC_DATA_DIR / "osm"
+ACCESS_DIR = PUBLIC_DATA_DIR / "accessibility"
+POPULATION_BASE = PUBLIC_DATA_DIR / "population"
+ROADS_BASE = PUBLIC_DATA_DIR / "roads_friction"
+
+METERS_PER_DEGREE = 111139
+FRICTION_SOURCES = ('population', 'roads')
+
+# Road factors of the bundled profiles (public/data/profiles)
+ROAD_FACTORS = [1.0, 1.5, 2.0, 2.5]
+
+# Costs are capped, beyond this distance every decay function is ~0
+MAX_COST_M = 500000.0
+
+# Default road friction off the roads grid (same as heatmap.js)
+MAX_FRICTION = 5.0
+
+# 8-connected neighbours (dy, dx)
+NEIGHBORS = [(0, -1), (0, 1), (-1, 0), (1, 0), (-1, -1), (-1, 1), (1, -1), (1, 1)]
+
+
+def friction_key(source, road_factor):
+    return f"{source}_rf{road_factor:g}"
+
+
+def load_region_grid(base_path, region):
+    """
+    Values of the band `<base>` of the region store (full precision), else
+    decoded from `<base>.<region>.grid`. None if missing.
+    """
+    store = store_path(f"app_{region['name']}")
+    if has_band(store, Path(base_path).name):
+        return np.flipud(read_band(store, Path(base_path).name)).astype(np.float32)
+
+    path = Path(base_path).with_name(f"{Path(base_path).name}.{region['name']}.grid")
+    if not path.exists():
+        return None
+    header, raw = read_grid(path)
+    return np.asarray(grid_values(header, raw), dtype=np.float32)
+
+
+def friction_field(source, road_factor, population, roads=None):
+    """Per-cell friction multiplier, as in heatmap.js."""
+    if source == 'roads':
+        if roads is None:
+            raise FileNotFoundError("Roads friction grid is required for the 'roads' source")
+        road_val = np.where(roads > 0, roads, MAX_FRICTION)
+        return (1.0 + (road_val - 1.0) * (road_factor - 1.0) / 4.0).astype(np.float32)
+
+    pop_ratio = np.minimum(1.0, np.sqrt(np.maximum(population, 0)) / 5.0)
+    return (1.0 + (road_factor - 1.0) * (1.0 - pop_ratio)).astype(np.float32)
+
+
+def step_costs(region):
+    """Cell size in meters (lon, lat) at the middle of the region."""
+    mid_lat = (region['minLat'] + region['maxLat']) / 2
+    cost_y = METERS_PER_DEGREE * region['step']
+    cost_x = cost_y * np.cos(np.radians(mid_lat))
+    return cost_x, cost_y
+
+
+def build_graph(friction, cost_x, cost_y):
+    """
+    Directed 8-connected graph of the grid. Moving into a cell costs the
+    step length times the friction of that cell.
+    """
+    height, width = friction.shape
+    n = height * width
+    idx = np.arange(n, dtype=np.int32).reshape(height, width)
+    flat_friction = friction.ravel()
+
+    rows, cols, data = [], [], []
+    for dy, dx in NEIGHBORS:
+        src = idx[max(0, -dy):height - max(0, dy), max(0, -dx):width - max(0, dx)].ravel()
+        dst = idx[max(0, dy):height - max(0, -dy), max(0, dx):width - max(0, -dx)].ravel()
+        length = np.hypot(cost_x * dx, cost_y * dy)
+        rows.append(src)
+        cols.append(dst)
+        data.append(length * flat_friction[dst])
+
+    return csr_matrix(
+        (np.concatenate(data), (np.concatenate(rows), np.concatenate(cols))),
+        shape=(n, n)
+    )
+
+
+def load_sources(amenity, osm_dir=OSM_DIR):
+    """Source cells of an amenity, {region name: sorted flat indices}."""
+    path = Path(osm_dir) / f"{amenity}.geojson"
+    if not path.exists():
+        return {}
+
+    with open(path, "r", encoding="utf-8") as f:
+        features = json.load(f).get("features", [])
+
+    widths = {r['name']: r['width'] for r in region_grids()}
+    sources = {}
+    for feat in features:
+        lon, lat = feat['geometry']['coordinates'][:2]
+        located = locate(lat, lon)
+        if located is None:
+            continue
+        name, x, y = located
+        sources.setdefault(name, set()).add(y * widths[name] + x)
+
+    return {name: np.array(sorted(cells), dtype=np.int32) for name, cells in sources.items()}
+
+
+def travel_cost(graph, sources, shape, limit=MAX_COST_M):
+    """Multi-source Dijkstra: cost in meters to the nearest source (capped)."""
+    if len(sources) == 0:
+        return np.full(shape, limit, dtype=np.float32)
+
+    dist = dijkstra(graph, directed=True, indices=sources, min_only=True, limit=limit)
+    dist = np.minimum(dist, limit).astype(np.float32)
+    return dist.reshape(shape)
+
+
+def list_amenities(osm_dir=OSM_DIR):
+    return sorted(p.stem for p in Path(osm_dir).glob("*.geojson"))
+
+
+def changed_regions(report_path):
+    """
+    Regions with changed tiles in a road change report, None after a full
+    rebuild or without a report (every region).
+    """
+    if not Path(report_path).exists():
+        return None
+    with open(report_path, "r") as f:
+        report = json.load(f)
+    if report.get("full"):
+        return None
+    return {name for name, tiles in report["regions"].items() if tiles}
+
+
+def clear_changes(report_path):
+    """Empty a consumed road change report: the rasters are up to date with the roads."""
+    path = Path(report_path)
+    if not path.exists():
+        return
+    with open(path, "r") as f:
+        report = json.load(f)
+    report.update(full=False, regions={})
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"✔ Cleared the road change report {path}")
+
+
+def inputs_fingerprint(amenities, source, osm_dir=OSM_DIR):
+    """Fingerprint of the inputs of a friction setting other than the roads grids."""
+    files = [Path(osm_dir) / f"{amenity}.geojson" for amenity in amenities]
+    if source == 'population':
+        files += sorted(POPULATION_BASE.parent.glob(f"{POPULATION_BASE.name}*.grid"))
+    return fingerprint([f for f in files if f.exists()], source)
+
+
+def compute_cost_rasters(amenities, source='population', road_factor=1.0,
+                         output_dir=ACCESS_DIR, dtype='float32', regions=None):
+    """
+    Compute and save the travel-cost rasters of the amenities for one
+    friction setting, only for the `regions` (names) if given: the rasters
+    of the other regions are kept, unless the amenities or the population
+    changed since they were computed. Returns the path of the written
+    index.json.
+    """
+    key = friction_key(source, road_factor)
+    out_dir = Path(output_dir) / key
+    out_dir.mkdir(parents=True, exist_ok=True)
+    print(f"\n--- Friction: {key} ---")
+
+    sources_by_amenity = {a: load_sources(a) for a in amenities}
+    index = {
+        "frictionSource": source,
+        "roadFactor": road_factor,
+        "maxCost": MAX_COST_M,
+        "regions": [r['name'] for r in region_grids()],
+        "amenities": {},
+        "inputs": inputs_fingerprint(amenities, source),
+    }
+
+    # Keep the entries of the amenities computed by a previous run
+    index_path = out_dir / "index.json"
+    previous = {}
+    if index_path.exists():
+        with open(index_path, "r") as f:
+            previous = json.load(f)
+        index["amenities"].update({a: v for a, v in previous.get("amenities", {}).items() if a not in amenities})
+    if regions is not None and previous.get("inputs") != index["inputs"]:
+        print("Amenities or population changed: every region recomputed")
+        regions = None
+
+    for region in region_grids():
+        if regions is not None and region['name'] not in regions:
+            print(f"Region {region['name']}: unchanged, kept")
+            continue
+        population = load_region_grid(POPULATION_BASE, region)
+        roads = load_region_grid(ROADS_BASE, region)
+        shape = (region['height'], region['width'])
+        if population is None:
+            population = np.zeros(shape, dtype=np.float32)
+
+        t0 = time.time()
+        friction = friction_field(source, road_factor, population=population, roads=roads)
+        graph = build_graph(friction, *step_costs(region))
+        print(f"Region {region['name']}: graph {graph.shape[0]} nodes, {graph.nnz} edges ({time.time() - t0:.2f}s)")
+
+        for amenity in amenities:
+            cells = sources_by_amenity[amenity].get(region['name'], np.array([], dtype=np.int32))
+            t0 = time.time()
+            cost = travel_cost(graph, cells, shape)
+            save_grid_outputs(out_dir / f"{amenity}.{region['name']}.grid", cost, region,
+                              max_score=MAX_COST_M, fmt='binary', dtype=dtype,
+                              region=region['name'], x0=region['x0'], y0=region['y0'])
+
+            print(f"  {amenity}: {len(cells)} sources ({time.time() - t0:.2f}s)")
+
+    for amenity in amenities:
+        index["amenities"][amenity] = {
+            "sources": int(sum(len(cells) for cells in sources_by_amenity[amenity].values()))
+        }
+
+    with open(index_path, "w") as f:
+        json.dump(index, f, indent=2)
+    print(f"✔ Saved cost rasters to {out_dir}")
+    return index_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute per-amenity travel-cost rasters")
+    parser.add_argument("--amenities", nargs="*", default=None,
+                        help="Amenity types (default: every osm/*.geojson)")
+    parser.add_argument("--friction-source", choices=FRICTION_SOURCES, nargs="+",
+                        default=['population'], help="Friction model(s), as in the app")
+    parser.add_argument("--road-factor", type=float, nargs="+", default=ROAD_FACTORS,
+                        help="Profile road factor(s)")
+    parser.add_argument("--dtype", choices=['float32', 'uint16'], default='float32',
+                        help="Cost raster payload type, uint16 quantizes the costs")
+    parser.add_argument("--roads-changes", type=Path, default=None, metavar="REPORT",
+                        help="Road change report (data/osm/roads_changes.json): only recompute the 'roads' "
+                             "rasters of the regions whose friction changed, then clear the report")
+    args = parser.parse_args()
+
+    amenities = args.amenities or list_amenities()
+    print(f"=== Travel-cost rasters for {len(amenities)} amenities ===")
+
+    road_regions = changed_regions(args.roads_changes) if args.roads_changes else None
+    for source in args.friction_source:
+        # The population rasters do not depend on the roads
+        regions = None
+        if args.roads_changes:
+            regions = road_regions if source == 'roads' else set()
+        for road_factor in args.road_factor:
+            compute_cost_rasters(amenities, source, road_factor, dtype=args.dtype, regions=regions)
+    # Consumed by the 'roads' rasters only
+    if args.roads_changes and 'roads' in args.friction_source:
+        clear_changes(args.roads_changes)
+
+    print("\nDone!")
@@ -75,3 +75,15 @@ tourism_amenities = [
     "pub",
     "ice_cream"
 ]
+
+
+ALL_AMENITY_GROUPS = {
+    "health": health_amenities,
+    "security": security_amenities,
+    "education": education_amenities,
+    "public": public_amenities,
+    "transport": transport_amenities,
+    "hygiene": hygiene_amenities,
+    "commercial": commercial_amenities,
+    "tourism": tourism_amenities
+}
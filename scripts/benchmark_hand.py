@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the HAND engines on the DEM band of the flood store:
+- edt: elevation above the Euclidean-nearest river pixel, smoothed
+- flow: elevation above the drain reached along the D8 flow paths of the
+  depression-filled DEM (priority-flood)
+
+Prints the time of each engine and how much they agree on land: HAND
+differences and share of pixels in the same risk class.
+"""
+
+import argparse
+import time
+import numpy as np
+import rasterio
+
+from generate_flood_model import (HAZARDS_DIR, RIVER_TYPES, STORE, classify_risk, hand_from_dem, list_dem_files,
+                                  load_geometries, merge_dem, rasterize_mask)
+from priority_flood import flood_tree, flow_hand, ocean_mask
+from raster_store import band_path, has_band
+
+
+def timed(label, func, *args):
+    t0 = time.time()
+    result = func(*args)
+    elapsed = time.time() - t0
+    print(f"  {label:<28} {elapsed:7.2f}s")
+    return result, elapsed
+
+
+def benchmark(zoom=None, store=STORE):
+    if not has_band(store, "dem"):
+        dem_files = list_dem_files(zoom)
+        if not dem_files:
+            print("❌ No DEM files found. Run fetch_dem.py first.")
+            return
+        merge_dem(dem_files, store)
+
+    with rasterio.open(band_path(store, "dem")) as src:
+        dem = src.read(1)
+        transform, crs = src.transform, src.crs
+
+    rivers = load_geometries(HAZARDS_DIR / "flood.geojson", crs, RIVER_TYPES)
+    river_mask = rasterize_mask(rivers, dem.shape, transform)
+    print(f"=== HAND benchmark: {dem.shape[1]}x{dem.shape[0]} cells, {river_mask.sum()} river pixels ===")
+
+    print("edt:")
+    (hand_edt, _), t_edt = timed("EDT + gaussian", hand_from_dem, dem, river_mask)
+
+    print("flow:")
+    outlets, t_ocean = timed("ocean mask", ocean_mask, dem)
+    tree, t_tree = timed("priority-flood (tree)", flood_tree, dem, outlets)
+    hand_flow, t_hand = timed("HAND along flow paths", flow_hand, tree, dem, river_mask)
+    t_flow = t_ocean + t_tree + t_hand
+    print(f"  {'total':<28} {t_flow:7.2f}s ({len(tree['cells'])} land cells)")
+
+    land = dem > 0
+    diff = np.abs(hand_edt - hand_flow)[land]
+    no_mask = np.ones(dem.shape, dtype=np.uint8)
+    same_class = classify_risk(hand_edt, dem, no_mask) == classify_risk(hand_flow, dem, no_mask)
+    print("agreement on land:")
+    print(f"  median |diff| {np.median(diff):.2f} m, p90 {np.percentile(diff, 90):.2f} m")
+    print(f"  same risk class: {same_class[land].mean() * 100:.1f}% of the pixels")
+    print(f"  flow / edt time: {t_flow / t_edt:.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the EDT and flow-path HAND engines")
+    parser.add_argument("--zoom", type=int, default=None, help="DEM zoom level (default: highest available)")
+    args = parser.parse_args()
+
+    benchmark(zoom=args.zoom)
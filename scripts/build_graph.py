@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""
+Incremental build of the data: runs only the scripts whose inputs changed.
+
+Every stage of STAGES is one script with its input and output files (glob
+patterns). A stage depends on the stages whose outputs match its inputs, so
+the stages run in dependency order. Its fingerprint is the SHA-256 of:
+- the source of the script and of the local modules it imports
+- its arguments
+- the content of every input file
+and a stage is only rerun when its fingerprint differs from the last
+successful run, or when an output is missing. Since the inputs are hashed by
+content, a stage whose upstream rerun gave identical files is not rerun.
+The file hashes are cached by (size, mtime), so unchanged files (DEM tiles,
+cost rasters) are not read again.
+
+The fetch stages (remote=True) read OpenStreetMap, AWS and WorldPop: their
+inputs cannot be hashed locally, they run when their outputs are missing,
+their script changed, or with --refresh (outputs fetched before the first
+build are adopted as they are).
+
+The stages run concurrently in a thread pool (each one is a subprocess): a
+stage starts as soon as its upstream stages are done, within --jobs
+stages at a time and the per-host limits of HOST_LIMITS (the fetch stages
+sharing the Overpass instance, the CPU-bound local stages one at a time).
+A cold build then takes about as long as its slowest chain (DEM ->
+flood model) rather than the sum of the stages. The output lines of each
+stage are prefixed with its name.
+
+State: data/build/state.json (fingerprints and file hashes).
+"""
+
+import argparse
+import fnmatch
+import json
+import os
+import re
+import shlex
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+
+from content_hash import fingerprint
+from telemetry import add_telemetry_arguments, record, run_from_args, stage
+
+BASE_DIR = Path(__file__).parent.parent
+SCRIPTS_DIR = Path(__file__).parent
+DATA_DIR = BASE_DIR / "data"
+PUBLIC_DATA_DIR = BASE_DIR / "geo-maurice-app" / "public" / "data"
+HAZARDS_DIR = PUBLIC_DATA_DIR / "hazards"
+OSM_DIR = PUBLIC_DATA_DIR / "osm"
+ACCESS_DIR = PUBLIC_DATA_DIR / "accessibility"
+STATE_FILE = DATA_DIR / "build" / "state.json"
+ROADS_CHANGES_FILE = DATA_DIR / "osm" / "roads_changes.json"
+
+# Stages running at the same time, and per host: the public Overpass
+# instance gives 2 slots per IP, which one fetch stage already fills with
+# its concurrent queries (overpass_scheduler.py); the local stages each use
+# every core
+DEFAULT_JOBS = 4
+HOST_LIMITS = {"overpass": 1, "local": 1}
+DEFAULT_HOST_LIMIT = 2
+
+STAGES = {
+    "dem": {
+        "script": "fetch_dem.py",
+        "hosts": ["s3.amazonaws.com"],
+        "remote": True,
+        "outputs": [HAZARDS_DIR / "mauritius_dem_z12_*.tif"],
+    },
+    "hazards": {
+        "script": "fetch_hazards.py",
+        "hosts": ["overpass"],
+        "remote": True,
+        "osm": True,
+        "outputs": [HAZARDS_DIR / "flood.geojson"],
+    },
+    "osm": {
+        "script": "fetch_osm.py",
+        "hosts": ["overpass"],
+        "remote": True,
+        "osm": True,
+        "outputs": [OSM_DIR / "*.geojson"],
+    },
+    "population": {
+        "script": "fetch_population.py",
+        "hosts": ["data.worldpop.org"],
+        "remote": True,
+        "outputs": [DATA_DIR / "population_2020_1km.tif", PUBLIC_DATA_DIR / "population*.grid"],
+    },
+    "roads": {
+        "script": "fetch_roads_friction.py",
+        "hosts": ["overpass"],
+        "remote": True,
+        "osm": True,
+        "outputs": [PUBLIC_DATA_DIR / "roads_friction*.grid", DATA_DIR / "osm" / "roads.geojson"],
+    },
+    "flood": {
+        "script": "generate_flood_model.py",
+        "hosts": ["local"],
+        "inputs": [HAZARDS_DIR / "mauritius_dem_z*_*.tif", HAZARDS_DIR / "flood.geojson",
+                   PUBLIC_DATA_DIR / "districts_mauritius.geojson", DATA_DIR / "population_2020_1km.tif",
+                   OSM_DIR / "*.geojson"],
+        "outputs": [HAZARDS_DIR / "flood_metadata.json", HAZARDS_DIR / "flood_exposure.json"],
+    },
+    "accessibility": {
+        "script": "accessibility.py",
+        # Only the regions whose roads changed since the last run (or every
+        # region when the amenities or the population changed)
+        "args": ["--roads-changes", str(ROADS_CHANGES_FILE.relative_to(BASE_DIR))],
+        "hosts": ["local"],
+        "inputs": [PUBLIC_DATA_DIR / "population*.grid", PUBLIC_DATA_DIR / "roads_friction*.grid",
+                   OSM_DIR / "*.geojson"],
+        "outputs": [ACCESS_DIR / "*" / "index.json"],
+    },
+    "profiles": {
+        "script": "render_profiles.py",
+        "hosts": ["local"],
+        "inputs": [ACCESS_DIR / "*" / "index.json", PUBLIC_DATA_DIR / "profiles" / "*.json",
+                   PUBLIC_DATA_DIR / "population*.grid"],
+        "outputs": [PUBLIC_DATA_DIR / "scores" / "index.json"],
+    },
+}
+
+IMPORT_RE = re.compile(r"^\s*(?:from\s+(\w+)\s+import|import\s+(\w+))", re.MULTILINE)
+
+
+def load_state(path=STATE_FILE):
+    if not Path(path).exists():
+        return {"stages": {}, "files": {}}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_state(state, path=STATE_FILE):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, path)
+
+
+def expand(patterns):
+    """Existing files matching the glob patterns, sorted."""
+    files = set()
+    for pattern in patterns:
+        files.update(p for p in BASE_DIR.glob(str(Path(pattern).relative_to(BASE_DIR))) if p.is_file())
+    return sorted(files)
+
+
+def local_modules(script, scripts_dir=SCRIPTS_DIR):
+    """The script and the modules of scripts/ it imports, recursively."""
+    seen = []
+    pending = [Path(scripts_dir) / script]
+    while pending:
+        path = pending.pop()
+        if path in seen:
+            continue
+        seen.append(path)
+        for match in IMPORT_RE.finditer(path.read_text(encoding="utf-8")):
+            module = Path(scripts_dir) / f"{match.group(1) or match.group(2)}.py"
+            if module.exists():
+                pending.append(module)
+    return sorted(seen)
+
+
+def depends_on(stage_a, stage_b, stages=STAGES):
+    """True if an input of stage_a matches an output of stage_b."""
+    return any(fnmatch.fnmatch(str(out), str(inp)) or fnmatch.fnmatch(str(inp), str(out))
+               for inp in stages[stage_a].get("inputs", []) for out in stages[stage_b]["outputs"])
+
+
+def build_order(targets, stages=STAGES):
+    """The targets and their upstream stages, in dependency order."""
+    order = []
+
+    def visit(name, path=()):
+        if name in path:
+            raise ValueError(f"Dependency cycle: {' -> '.join(path + (name,))}")
+        if name in order:
+            return
+        for other in stages:
+            if other != name and depends_on(name, other, stages):
+                visit(other, path + (name,))
+        order.append(name)
+
+    for name in targets:
+        visit(name)
+    return order
+
+
+def stage_fingerprint(name, state, stages=STAGES):
+    entry = stages[name]
+    return fingerprint(local_modules(entry["script"]) + expand(entry.get("inputs", [])),
+                       name, entry.get("args", []), cache=state["files"])
+
+
+def stale_reason(name, digest, state, refresh=False, force=(), stages=STAGES):
+    """Why a stage has to run, None if it is up to date."""
+    entry = stages[name]
+    if name in force:
+        return "forced"
+    if refresh and entry.get("remote"):
+        return "refresh"
+    missing = [str(p) for p in entry["outputs"] if not expand([p])]
+    if missing:
+        return f"missing {Path(missing[0]).name}"
+    previous = state["stages"].get(name)
+    if previous is None:
+        # Outputs of a fetch made before the first build are kept as they are
+        return None if entry.get("remote") else "never built"
+    if previous["fingerprint"] != digest:
+        return "inputs changed"
+    return None
+
+
+def run_stage(name, extra_args=(), stages=STAGES):
+    """Run the script of a stage, its output lines prefixed by the stage name. Returns the exit code."""
+    entry = stages[name]
+    command = [sys.executable, str(SCRIPTS_DIR / entry["script"]), *entry.get("args", []), *extra_args]
+    print(f"▶ {name}: {' '.join(command[1:])}", flush=True)
+    with stage(name) as span:
+        with subprocess.Popen(command, cwd=BASE_DIR, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+                              env=dict(os.environ, PYTHONUNBUFFERED="1")) as process:
+            for line in process.stdout:
+                print(f"[{name}] {line}", end="", flush=True)
+        record(span, returncode=process.returncode)
+    return process.returncode
+
+
+def host_limits(overrides=(), defaults=HOST_LIMITS):
+    """{host: max concurrent stages} from "host=N" strings."""
+    limits = dict(defaults)
+    for item in overrides:
+        host, _, value = item.partition("=")
+        limits[host] = int(value)
+    return limits
+
+
+def build(targets=None, refresh=False, force=(), dry_run=False, osm_args=(), jobs=DEFAULT_JOBS, limits=None,
+          stages=STAGES):
+    """
+    Run the stale stages needed by `targets` (default: all), concurrently.
+    A stage is checked as soon as all its upstream stages are done (its
+    inputs are final), and started if a job slot and a slot on each of its
+    hosts are free. A failed stage skips its downstream stages only.
+    Returns {stage: status}.
+    """
+    order = build_order(targets or list(stages), stages)
+    upstream = {name: [other for other in order if other != name and depends_on(name, other, stages)]
+                for name in order}
+    limits = limits or HOST_LIMITS
+    state = load_state()
+    status = {}
+    running = {}
+    pending = list(order)
+    t0 = time.time()
+
+    def host_free(name):
+        busy = [host for other in running.values() for host in stages[other].get("hosts", [])]
+        return all(busy.count(host) < limits.get(host, DEFAULT_HOST_LIMIT) for host in stages[name].get("hosts", []))
+
+    def schedule(executor):
+        """Settle or start the stages whose upstream stages are done, until nothing changes."""
+        changed = True
+        while changed:
+            changed = False
+            for name in list(pending):
+                done = [status.get(other) for other in upstream[name]]
+                if any(value in ("failed", "skipped") for value in done):
+                    print(f"⚠️ {name}: skipped, an upstream stage failed")
+                    status[name] = "skipped"
+                elif all(value in ("ran", "up to date") for value in done):
+                    digest = stage_fingerprint(name, state, stages)
+                    reason = stale_reason(name, digest, state, refresh, force, stages)
+                    if reason is None and dry_run and any(status[other] == "ran" for other in upstream[name]):
+                        reason = "after " + ", ".join(o for o in upstream[name] if status[o] == "ran")
+                    if reason is None:
+                        print(f"✔ {name}: up to date")
+                        status[name] = "up to date"
+                        if name not in state["stages"] and not dry_run:
+                            state["stages"][name] = {"fingerprint": digest}
+                            save_state(state)
+                    elif dry_run:
+                        print(f"{name}: {reason}")
+                        status[name] = "ran"
+                    elif len(running) < jobs and host_free(name):
+                        print(f"{name}: {reason}")
+                        future = executor.submit(run_stage, name, osm_args if stages[name].get("osm") else (), stages)
+                        running[future] = name
+                    else:
+                        continue
+                else:
+                    continue
+                pending.remove(name)
+                changed = True
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        schedule(executor)
+        while running:
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                code = future.result()
+                if code != 0:
+                    print(f"❌ Stage {name} failed (exit code {code})")
+                    status[name] = "failed"
+                    continue
+                # The outputs may be inputs of the next stages: hashed after the run
+                state["stages"][name] = {"fingerprint": stage_fingerprint(name, state, stages)}
+                save_state(state)
+                status[name] = "ran"
+            schedule(executor)
+
+    ran = [name for name in order if status.get(name) == "ran"]
+    print(f"{'Would run' if dry_run else 'Ran'} {len(ran)}/{len(order)} stages "
+          f"in {time.time() - t0:.1f}s: {', '.join(ran) or 'none'}")
+    failed = [name for name in order if status.get(name) in ("failed", "skipped")]
+    if failed:
+        raise SystemExit(f"❌ Not built: {', '.join(failed)}")
+    return status
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the data stages whose inputs changed")
+    parser.add_argument("targets", nargs="*", metavar="STAGE",
+                        help=f"Stages to bring up to date, with their upstream stages (default: all): "
+                             f"{', '.join(STAGES)}")
+    parser.add_argument("--force", nargs="+", default=[], choices=list(STAGES), metavar="STAGE",
+                        help="Rerun these stages even if up to date")
+    parser.add_argument("--refresh", action="store_true",
+                        help="Rerun the fetch stages (remote data may have changed)")
+    parser.add_argument("--dry-run", action="store_true", help="Only list the stages that would run")
+    parser.add_argument("--osm-flags", default="",
+                        help="Options passed to the OSM fetch scripts (e.g. \"--offline\")")
+    parser.add_argument("--jobs", type=int, default=DEFAULT_JOBS,
+                        help="Stages running at the same time (default: %(default)s)")
+    parser.add_argument("--host-limit", nargs="+", default=[], metavar="HOST=N",
+                        help=f"Concurrent stages per host (default: {HOST_LIMITS}, {DEFAULT_HOST_LIMIT} otherwise)")
+    parser.add_argument("--list", action="store_true", help="List the stages and their dependencies")
+    add_telemetry_arguments(parser)
+    args = parser.parse_args()
+    unknown = [name for name in args.targets if name not in STAGES]
+    if unknown:
+        parser.error(f"unknown stage(s): {', '.join(unknown)}")
+
+    if args.list:
+        for name in STAGES:
+            upstream = [other for other in STAGES if other != name and depends_on(name, other)]
+            print(f"{name:<14} {STAGES[name]['script']:<26} {', '.join(STAGES[name]['hosts']):<18} "
+                  f"<- {', '.join(upstream) or '-'}")
+    else:
+        with run_from_args("build_graph", args):
+            build(args.targets, refresh=args.refresh, force=args.force, dry_run=args.dry_run,
+                  osm_args=shlex.split(args.osm_flags), jobs=args.jobs, limits=host_limits(args.host_limit))
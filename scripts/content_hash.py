@@ -0,0 +1,45 @@
+"""
+Content hashes of files, shared by the build runner (build_graph.py) and the
+cached bands of the raster store (generate_flood_model.py).
+
+Kept apart from build_graph.py: a stage fingerprint covers the source of
+the local modules its script imports, so a script importing the runner
+would be rebuilt whenever the stage table changes.
+"""
+
+import hashlib
+import json
+from pathlib import Path
+
+BASE_DIR = Path(__file__).parent.parent
+HASH_CHUNK = 1 << 20
+
+
+def file_digest(path, cache=None):
+    """SHA-256 of a file, reused from `cache` ({path: [size, mtime_ns, sha]}) if unchanged."""
+    path = Path(path)
+    info = path.stat()
+    key = str(path)
+    if cache is not None and cache.get(key, [None, None])[:2] == [info.st_size, info.st_mtime_ns]:
+        return cache[key][2]
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            digest.update(chunk)
+    if cache is not None:
+        cache[key] = [info.st_size, info.st_mtime_ns, digest.hexdigest()]
+    return digest.hexdigest()
+
+
+def fingerprint(files, *extra, cache=None):
+    """Content hash of files (with their paths relative to the repo) and extra values."""
+    digest = hashlib.sha256()
+    for value in extra:
+        digest.update(json.dumps(value, sort_keys=True, default=str).encode())
+    for path in files:
+        path = Path(path)
+        name = str(path.relative_to(BASE_DIR)) if path.is_relative_to(BASE_DIR) else str(path)
+        digest.update(name.encode())
+        digest.update(file_digest(path, cache).encode() if path.exists() else b"missing")
+    return digest.hexdigest()
@@ -2,14 +2,7 @@ import json
 import math
 from pathlib import Path
 
-# Grid BBox from heatmap.js
-GRID_BBOX = {
-    'minLat': -20.60,
-    'maxLat': -19.40,
-    'minLon': 57.20,
-    'maxLon': 63.60,
-    'step': 0.002
-}
+from grid_regions import GRID_BBOX, locate
 
 def check_points():
     file_path = Path("geo-maurice-app/public/data/osm/clinic.geojson")
@@ -51,6 +44,8 @@ def check_points():
         
         if is_inside:
             valid_count += 1
+            if locate(lat, lon) is None:
+                print(f"Point outside island regions: {feat.get('properties', {}).get('name')} ({lat}, {lon})")
         else:
             invalid_count += 1
             print(f"Point OUTSIDE: {feat.get('properties', {}).get('name')} ({lat}, {lon}) -> Index ({x}, {y})")
@@ -1,5 +1,13 @@
+import argparse
+import os
 import requests
+import rasterio
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from telemetry import add_telemetry_arguments, record, run_from_args, stage
 
 # Mauritius approximates:
 # Zoom level 10 seems appropriate for a whole island overview
@@ -9,50 +17,154 @@ from pathlib import Path
 
 import math
 
+# Tile source. Can be pointed to a local HTTP server serving the same
+# {z}/{x}/{y}.tif layout (e.g. `python -m http.server`, or the stand-in of
+# test_fetch_dem.py) for testing.
+TILE_URL = "https://s3.amazonaws.com/elevation-tiles-prod/geotiff/{z}/{x}/{y}.tif"
+OUTPUT_DIR = Path(__file__).parent.parent / "geo-maurice-app" / "public" / "data" / "hazards"
+
+# Mauritius Bounds
+DEM_BOUNDS = {
+    'minLat': -20.55,
+    'maxLat': -19.95,
+    'minLon': 57.30,
+    'maxLon': 57.85,
+}
+
+DEFAULT_WORKERS = 8
+
+
 def latlon_to_tile(lat, lon, zoom):
     n = 2.0 ** zoom
     xtile = int((lon + 180.0) / 360.0 * n)
     ytile = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
     return (xtile, ytile)
 
-def fetch_dem():
-    print("Fetching High-Res DEM (Elevation) Data for Mauritius (Zoom 12)...")
-    
-    # Mauritius Bounds
-    min_lat, max_lat = -20.55, -19.95
-    min_lon, max_lon = 57.30, 57.85
-    zoom = 12
-    
-    min_x, min_y = latlon_to_tile(max_lat, min_lon, zoom) # Top Left
-    max_x, max_y = latlon_to_tile(min_lat, max_lon, zoom) # Bottom Right
-    
-    print(f"Tile Range: X[{min_x}-{max_x}], Y[{min_y}-{max_y}]")
-    
-    for x in range(min_x, max_x + 1):
-        for y in range(min_y, max_y + 1):
-            url = f"https://s3.amazonaws.com/elevation-tiles-prod/geotiff/{zoom}/{x}/{y}.tif"
-            filename = f"mauritius_dem_z{zoom}_{x}_{y}.tif"
-            output_path = Path(__file__).parent.parent / "geo-maurice-app" / "public" / "data" / "hazards" / filename
-            
-            if output_path.exists():
-                print(f"Skipping {filename} (already exists)")
-                continue
-                
-            print(f"Downloading tile {x}/{y}...")
-            
-            try:
-                response = requests.get(url, stream=True)
-                if response.status_code == 200:
-                    with open(output_path, 'wb') as f:
-                        for chunk in response.iter_content(chunk_size=8192):
-                            f.write(chunk)
-                    print(f"✔ Saved {filename}")
-                else:
-                    print(f"Failed to download {url}: HTTP {response.status_code}")
-            except Exception as e:
-                print(f"Error downloading {x}/{y}: {e}")
-            
-    print("\nHigh-res DEM download complete. Now run 'generate_flood_model.py' to update the risk map.")
+
+def tile_range(zoom, bounds=DEM_BOUNDS):
+    """List the (x, y) tiles covering the bounds at the given zoom."""
+    min_x, min_y = latlon_to_tile(bounds['maxLat'], bounds['minLon'], zoom) # Top Left
+    max_x, max_y = latlon_to_tile(bounds['minLat'], bounds['maxLon'], zoom) # Bottom Right
+    return [(x, y) for x in range(min_x, max_x + 1) for y in range(min_y, max_y + 1)]
+
+
+def tile_filename(zoom, x, y):
+    return f"mauritius_dem_z{zoom}_{x}_{y}.tif"
+
+
+def make_session(pool_size=DEFAULT_WORKERS, retries=3):
+    """HTTP session with a connection pool sized for the worker pool."""
+    session = requests.Session()
+    retry = Retry(
+        total=retries,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=["GET"],
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def is_valid_tile(path):
+    """Check that a tile is a readable GeoTIFF by opening its header."""
+    try:
+        with rasterio.open(path) as src:
+            return src.count >= 1 and src.width > 0 and src.height > 0 and src.crs is not None
+    except Exception:
+        return False
+
+
+def download_tile(session, url, output_path, timeout=60):
+    """
+    Download one tile atomically: stream to a temporary file next to the
+    target, validate it, then rename. A killed run only leaves a `.part` file.
+    Returns "skipped", "downloaded" or an error message.
+    """
+    if output_path.exists():
+        if is_valid_tile(output_path):
+            return "skipped"
+        print(f"Corrupted tile {output_path.name}, downloading again")
+        output_path.unlink()
+
+    tmp_path = output_path.with_name(output_path.name + ".part")
+    try:
+        with session.get(url, stream=True, timeout=timeout) as response:
+            if response.status_code != 200:
+                return f"HTTP {response.status_code}"
+
+            expected = response.headers.get("Content-Length")
+            with open(tmp_path, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=65536):
+                    f.write(chunk)
+            # Content-Length counts the bytes on the wire (before gzip decoding)
+            received = response.raw.tell()
+
+        if expected is not None and received != int(expected):
+            return f"truncated ({received}/{expected} bytes)"
+        if not is_valid_tile(tmp_path):
+            return "invalid GeoTIFF"
+
+        os.replace(tmp_path, output_path)
+        return "downloaded"
+    except Exception as e:
+        return str(e)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+
+def fetch_dem(zoom=12, workers=DEFAULT_WORKERS, tile_url=TILE_URL, output_dir=OUTPUT_DIR):
+    print(f"Fetching High-Res DEM (Elevation) Data for Mauritius (Zoom {zoom})...")
+
+    tiles = tile_range(zoom)
+    xs = [x for x, _ in tiles]
+    ys = [y for _, y in tiles]
+    print(f"Tile Range: X[{min(xs)}-{max(xs)}], Y[{min(ys)}-{max(ys)}] ({len(tiles)} tiles, {workers} workers)")
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    session = make_session(pool_size=workers)
+    counts = {"downloaded": 0, "skipped": 0, "failed": 0}
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        for x, y in tiles:
+            url = tile_url.format(z=zoom, x=x, y=y)
+            output_path = output_dir / tile_filename(zoom, x, y)
+            futures[executor.submit(download_tile, session, url, output_path)] = (x, y, url)
+
+        for future in as_completed(futures):
+            x, y, url = futures[future]
+            status = future.result()
+            if status == "downloaded":
+                counts["downloaded"] += 1
+                print(f"✔ Saved tile {x}/{y}")
+            elif status == "skipped":
+                counts["skipped"] += 1
+            else:
+                counts["failed"] += 1
+                print(f"Failed to download {url}: {status}")
+
+    session.close()
+    print(f"\nDownloaded {counts['downloaded']}, skipped {counts['skipped']} (already valid), failed {counts['failed']}.")
+    print("High-res DEM download complete. Now run 'generate_flood_model.py' to update the risk map.")
+    return counts
+
 
 if __name__ == "__main__":
-    fetch_dem()
+    parser = argparse.ArgumentParser(description="Download DEM tiles for Mauritius")
+    parser.add_argument("--zoom", type=int, default=12, help="Tile zoom level (12, 13 or 14)")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Concurrent downloads")
+    parser.add_argument("--tile-url", default=TILE_URL,
+                        help="Tile URL template with {z}/{x}/{y} (e.g. a local test server)")
+    add_telemetry_arguments(parser)
+    args = parser.parse_args()
+
+    with run_from_args("fetch_dem", args):
+        with stage("download_tiles") as span:
+            counts = fetch_dem(zoom=args.zoom, workers=args.workers, tile_url=args.tile_url)
+            tiles = OUTPUT_DIR.glob(tile_filename(args.zoom, "*", "*"))
+            record(span, **counts, tiles_bytes=sum(path.stat().st_size for path in tiles))
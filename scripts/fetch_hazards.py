@@ -1,156 +1,155 @@
+import argparse
 import json
-import requests
 from pathlib import Path
-from OSMPythonTools.nominatim import Nominatim
-from OSMPythonTools.overpass import Overpass, overpassQueryBuilder
 
-def query_overpass_direct(query):
-    url = "https://overpass-api.de/api/interpreter"
-    response = requests.post(url, data={'data': query}, timeout=120)
-    response.raise_for_status()
-    return response.json()
+from osm_cache import CachedOverpass, resolve_area_id, query_all, add_cache_arguments, configure_cache_from_args
+from osm_sync import (add_incremental_argument, element_key, fetch_changes, key_order, last_sync, merge, osm_base,
+                      save_sync, union_query)
+from telemetry import add_telemetry_arguments, record, run_from_args, stage
 
-def fetch_hazards():
+OUTPUT_FILE = Path(__file__).parent.parent / "geo-maurice-app" / "public" / "data" / "hazards" / "flood.geojson"
+
+# 1. Flowing water (LineString)
+WATERWAY_FILTERS = [(element_type, '["waterway"~"^(river|stream)$"]') for element_type in ('way', 'relation')]
+
+# 2. Static water (union)
+STATIC_WATER_FILTERS = [
+    (element_type, selector)
+    for element_type in ('way', 'relation')
+    for selector in ('["water"="lake"]', '["natural"="water"]', '["landuse"="reservoir"]',
+                     '["natural"="wetland"]', '["landuse"="basin"]')
+]
+
+
+def waterway_feature(el):
+    geom = el.geometry()
+    if not geom or geom['type'] != 'LineString':
+        return None
+    return {
+        "type": "Feature",
+        "properties": {
+            "name": el.tag('name') or "Cours d'eau",
+            "risk_level": "Medium",
+            "type": "waterway",
+            "osm_id": element_key(el)
+        },
+        "geometry": geom
+    }
+
+
+def static_water_feature(el):
+    geom = el.geometry()
+    if not geom: # OSMPythonTools parses geometry for us!
+        return None
+    tags = el.tags()
+    name = tags.get('name', 'Plan d\'eau')
+    subtype = "lake"
+    if tags.get('natural') == 'wetland': subtype = "wetland"
+    elif tags.get('landuse') == 'reservoir': subtype = "reservoir"
+
+    return {
+        "type": "Feature",
+        "properties": {
+            "name": name,
+            "risk_level": "High",
+            "type": subtype,
+            "osm_id": element_key(el)
+        },
+        "geometry": geom
+    }
+
+
+# Feature of an element, per group of filters
+GROUPS = {
+    "waterways": (WATERWAY_FILTERS, waterway_feature),
+    "static_water": (STATIC_WATER_FILTERS, static_water_feature),
+}
+
+
+def plain(feature):
+    """Feature as read back from flood.geojson (plain lists and dicts)."""
+    return json.loads(json.dumps(feature)) if feature is not None else None
+
+
+def load_features(path=OUTPUT_FILE):
+    """Saved features per group {group: {osm_id: feature}}."""
+    with open(path, "r", encoding="utf-8") as f:
+        features = json.load(f)["features"]
+    stores = {name: {} for name in GROUPS}
+    for feature in features:
+        name = "waterways" if feature["properties"]["type"] == "waterway" else "static_water"
+        stores[name][feature["properties"]["osm_id"]] = feature
+    return stores
+
+
+def fetch_hazards(incremental=False):
     print("Fetching Flood Risk Data (Rivers/Wetlands)...")
     
-    nominatim = Nominatim()
-    areaId = nominatim.query('Mauritius').areaId()
-    overpass = Overpass()
-
-    # 1. Flowing water (LineString)
-    query_water = overpassQueryBuilder(
-        area=areaId,
-        elementType=['way', 'relation'],
-        selector=['"waterway"="river"', '"waterway"="stream"'],
-        out='geom'
-    )
-
-    # 2. Static water (Direct Query for robust Union)
-    ql = f"""
-    [out:json][timeout:90];
-    area({areaId})->.searchArea;
-    (
-      way["water"="lake"](area.searchArea);
-      way["natural"="water"](area.searchArea);
-      way["landuse"="reservoir"](area.searchArea);
-      way["natural"="wetland"](area.searchArea);
-      way["landuse"="basin"](area.searchArea);
-      relation["water"="lake"](area.searchArea);
-      relation["natural"="water"](area.searchArea);
-      relation["landuse"="reservoir"](area.searchArea);
-      relation["natural"="wetland"](area.searchArea);
-      relation["landuse"="basin"](area.searchArea);
-    );
-    out geom;
-    """
-
-    features = []
-
-    try:
-        print("Querying rivers/streams...")
-        res_water = overpass.query(query_water, timeout=60)
-        
-        for el in res_water.elements():
-            geom = el.geometry()
-            if geom and geom['type'] == 'LineString':
-                features.append({
-                    "type": "Feature",
-                    "properties": {
-                        "name": el.tag('name') or "Cours d'eau",
-                        "risk_level": "Medium",
-                        "type": "waterway"
-                    },
-                    "geometry": geom
-                })
-        print(f"Found {len(res_water.elements())} water segments.")
-
-    except Exception as e:
-        print(f"Error fetching waterways: {e}")
-
-    try:
-        print("Querying static water (Lakes/Wetlands) via raw API...")
-        data = query_overpass_direct(ql)
-        
-        count = 0
-        for el in data.get('elements', []):
-            if 'geometry' in el:
-                # Overpass geom is list of dicts {lat, lon}, need to convert to coordinates list?
-                # Ah, out geom gives 'geometry' key in result but format depends on library or raw
-                # Raw JSON from Overpass with [out:geom] structure:
-                # way: 'geometry': [{'lat':..., 'lon':...}, ...]
-                # relation: complex members
-                
-                # Handling raw geometry from requests is tedious. 
-                # Alternative: Use OSMPythonTools overpass object simply but WITHOUT query builder for the UNION
-                # The library `overpass.query(ql)` supports raw string too! 
-                # The issue before was double header.
-                pass
-                
-        # Actually... let's retry `overpass.query(ql)` but ensuring QL string has NO headers
-        # The library ADDS [out:json][timeout:25]. If we omit them, it might work.
-        pass
-    except Exception:
-        pass
-        
-    # REDOING logic: use library but clean raw string
-    clean_ql = f"""
-    area({areaId})->.searchArea;
-    (
-      way["water"="lake"](area.searchArea);
-      way["natural"="water"](area.searchArea);
-      way["landuse"="reservoir"](area.searchArea);
-      way["natural"="wetland"](area.searchArea);
-      way["landuse"="basin"](area.searchArea);
-      relation["water"="lake"](area.searchArea);
-      relation["natural"="water"](area.searchArea);
-      relation["landuse"="reservoir"](area.searchArea);
-      relation["natural"="wetland"](area.searchArea);
-      relation["landuse"="basin"](area.searchArea);
-    );
-    out geom;
-    """
-    
-    try:
-        print("Querying static water (Union)...")
-        # Ensure sufficient timeout passed to run() if wrapping
-        res_static = overpass.query(clean_ql, timeout=120)
-        
-        count = 0
-        for el in res_static.elements():
-            geom = el.geometry()
-            if geom: # OSMPythonTools parses geometry for us!
-                tags = el.tags()
-                name = tags.get('name', 'Plan d\'eau')
-                subtype = "lake"
-                if tags.get('natural') == 'wetland': subtype = "wetland"
-                elif tags.get('landuse') == 'reservoir': subtype = "reservoir"
-                
-                features.append({
-                    "type": "Feature",
-                    "properties": {
-                        "name": name,
-                        "risk_level": "High",
-                        "type": subtype
-                    },
-                    "geometry": geom
-                })
-                count += 1
-        print(f"Found {count} static water bodies.")
-    except Exception as e:
-        print(f"Error fetching static water: {e}")
+    with stage("resolve_area"):
+        areaId = resolve_area_id()
+    overpass = CachedOverpass()
+
+    since = last_sync("hazards") if incremental and OUTPUT_FILE.exists() else None
+    if since:
+        # Only the elements changed since the last sync, merged into flood.geojson
+        print(f"Querying the water features changed since {since}...")
+        with stage("sync") as span:
+            stores = load_features()
+            changes, timestamp = fetch_changes(overpass, areaId, {name: filters for name, (filters, _) in GROUPS.items()},
+                                               since, out='geom', timeout=120)
+            touched = 0
+            for name, (elements, current) in changes.items():
+                to_feature = GROUPS[name][1]
+                changed = {element_key(el): plain(to_feature(el)) for el in elements}
+                touched += len(merge(stores[name], changed, current))
+            record(span, changed=touched)
+        print(f"{touched} water features changed.")
+
+        if not touched:
+            print(f"✔ {OUTPUT_FILE} unchanged")
+            save_sync("hazards", timestamp)
+            return
+    else:
+        # Both queries run concurrently through the Overpass scheduler. A
+        # failure aborts the run: a flood.geojson without rivers or lakes is
+        # worse than keeping the previous one.
+        print("Querying rivers/streams and static water (Lakes/Wetlands)...")
+        with stage("overpass") as span:
+            results = query_all(overpass, [union_query(areaId, filters, out='geom') for filters, _ in GROUPS.values()],
+                                timeout=120)
+            timestamp = osm_base(results)
+            stores = {}
+            for (name, (_, to_feature)), result in zip(GROUPS.items(), results):
+                features = (to_feature(el) for el in result.elements())
+                stores[name] = {f["properties"]["osm_id"]: f for f in features if f is not None}
+            record(span, **{name: result.elements() for name, result in zip(GROUPS, results)})
 
+    print(f"Found {len(stores['waterways'])} water segments.")
+    print(f"Found {len(stores['static_water'])} static water bodies.")
+
+    features = [store[key] for store in stores.values() for key in sorted(store, key=key_order)]
     geojson = {
         "type": "FeatureCollection",
         "features": features
     }
 
-    output_path = Path(__file__).parent.parent / "geo-maurice-app" / "public" / "data" / "hazards" / "flood.geojson"
-    output_path.parent.mkdir(parents=True, exist_ok=True)
+    OUTPUT_FILE.parent.mkdir(parents=True, exist_ok=True)
 
-    with open(output_path, "w", encoding="utf-8") as f:
-        json.dump(geojson, f, ensure_ascii=False)
+    with stage("save") as span:
+        with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
+            json.dump(geojson, f, ensure_ascii=False)
+        record(span, features=features, geojson_bytes=OUTPUT_FILE)
+    save_sync("hazards", timestamp)
     
-    print(f"Saved {len(features)} risk features to {output_path}")
+    print(f"Saved {len(features)} risk features to {OUTPUT_FILE}")
 
 if __name__ == "__main__":
-    fetch_hazards()
+    parser = argparse.ArgumentParser(description="Fetch flood hazard features (rivers, lakes, wetlands)")
+    add_cache_arguments(parser)
+    add_incremental_argument(parser)
+    add_telemetry_arguments(parser)
+    args = parser.parse_args()
+    configure_cache_from_args(args)
+
+    with run_from_args("fetch_hazards", args):
+        fetch_hazards(incremental=args.incremental)
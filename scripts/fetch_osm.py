@@ -1,75 +1,47 @@
 ##
 #%%
-import os
 import json
+import argparse
 from pathlib import Path
-from OSMPythonTools.nominatim import Nominatim
-from OSMPythonTools.overpass import Overpass, overpassQueryBuilder
+from OSMPythonTools.overpass import overpassQueryBuilder
 
+from amenities import ALL_AMENITY_GROUPS
+from osm_cache import CachedOverpass, resolve_area_id, query_all, add_cache_arguments, configure_cache_from_args
+from osm_sync import (add_incremental_argument, element_key, fetch_changes, key_order, last_sync, merge, osm_base,
+                      save_sync)
+from telemetry import add_telemetry_arguments, record, run_from_args, stage
 
-# ============================================================
-# 1) Définition des catégories d’amenities
-# ============================================================
+OSM_DIR = Path(__file__).parent.parent / "geo-maurice-app" / "public" / "data" / "osm"
 
-health_amenities = [
-    "hospital", "clinic", "doctors", "dentist", "pharmacy",
-    "nursing_home", "social_facility", "first_aid", "blood_donation"
-]
-
-security_amenities = [
-    "police", "fire_station", "ambulance_station",
-    "rescue_station", "lifeguard", "lifeguard_tower"
-]
-
-education_amenities = [
-    "school", "kindergarten", "college", "university", "library"
-]
-
-public_amenities = [
-    "townhall", "courthouse", "embassy", "community_centre",
-    "public_building", "government", "post_office", "post_box"
-]
-
-transport_amenities = [
-    "bus_station", "bus_stop", "taxi", "ferry_terminal",
-    "fuel", "charging_station", "parking",
-    "bicycle_parking", "motorcycle_parking"
-]
-
-hygiene_amenities = [
-    "drinking_water", "toilets", "shower", "water_point",
-    "waste_disposal", "recycling"
-]
-
-commercial_amenities = [
-    "marketplace", "bank", "atm", "vending_machine", "money_transfer"
-]
-
-tourism_amenities = [
-    "restaurant", "fast_food", "cafe", "bar", "pub", "ice_cream"
-]
-
-
-ALL_AMENITY_GROUPS = {
-    "health": health_amenities,
-    "security": security_amenities,
-    "education": education_amenities,
-    "public": public_amenities,
-    "transport": transport_amenities,
-    "hygiene": hygiene_amenities,
-    "commercial": commercial_amenities,
-    "tourism": tourism_amenities
-}
 
+# ============================================================
+# 1) Catégories d’amenities : amenities.py (ALL_AMENITY_GROUPS)
+# ============================================================
 
 # ============================================================
-# 2) Fonction d'extraction Overpass (ta fonction, inchangée)
+# 2) Extraction Overpass : une requête groupée nwr["amenity"~"^(…)$"] par paquet de types
 # ============================================================
 
-def fetch_points_mauritius(point):
+def element_to_point(el):
+    """Convert an Overpass element to a point dict, or None without center."""
+    lat = el.centerLat()
+    lon = el.centerLon()
+    if lat is None or lon is None:
+        return None
+
+    return {
+        "id": el.id(),
+        "type": el.type(),
+        "name": el.tag('name') or "Unknown",
+        "lat": lat,
+        "lon": lon
+    }
+
+
+def fetch_points_mauritius(point, areaId=None):
     """Fetch OSM elements with amenity=point in Mauritius."""
-    nominatim = Nominatim()
-    areaId = nominatim.query('Mauritius').areaId()
+    if areaId is None:
+        areaId = resolve_area_id()
 
     query = overpassQueryBuilder(
         area=areaId,
@@ -78,26 +50,119 @@ def fetch_points_mauritius(point):
         out='center'
     )
 
-    overpass = Overpass()
+    overpass = CachedOverpass()
     result = overpass.query(query)
 
     points = []
     for el in result.elements():
-        lat = el.centerLat()
-        lon = el.centerLon()
-        if lat is None or lon is None:
-            continue
+        p = element_to_point(el)
+        if p is not None:
+            points.append(p)
 
-        name = el.tag('name') or "Unknown"
+    return points
 
-        points.append({
-            "id": el.id(),
-            "name": name,
-            "lat": lat,
-            "lon": lon
-        })
 
-    return points
+def build_batch_query(areaId, amenities):
+    """
+    Build a single Overpass union query matching every amenity in the list.
+    The amenity values are OSM tag values (no regex metacharacters).
+    """
+    pattern = "|".join(amenities)
+    return f"""
+    area({areaId})->.searchArea;
+    (
+      nwr["amenity"~"^({pattern})$"](area.searchArea);
+    );
+    out center;
+    """
+
+
+def fetch_all_points_mauritius(amenities, areaId=None, chunk_size=None, timeout=180):
+    """
+    Fetch every amenity of the list with one Overpass round trip
+    (or one per chunk of `chunk_size` amenities).
+
+    Returns a dict {amenity: [points]} with an entry for each requested amenity,
+    so that empty categories are reported like in the per-amenity loop, and
+    the OSM base timestamp of the data.
+    """
+    if areaId is None:
+        areaId = resolve_area_id()
+
+    amenities = list(amenities)
+    if not chunk_size:
+        chunk_size = len(amenities)
+
+    overpass = CachedOverpass()
+    points_by_amenity = {a: [] for a in amenities}
+
+    queries = [build_batch_query(areaId, amenities[i:i + chunk_size])
+               for i in range(0, len(amenities), chunk_size)]
+
+    # Chunks run concurrently through the Overpass scheduler
+    results = query_all(overpass, queries, timeout=timeout)
+    for result in results:
+        for el in result.elements():
+            amenity = el.tag('amenity')
+            if amenity not in points_by_amenity:
+                continue
+            p = element_to_point(el)
+            if p is not None:
+                points_by_amenity[amenity].append(p)
+
+    return points_by_amenity, osm_base(results)
+
+
+def load_points(amenities, base_dir=OSM_DIR):
+    """Saved points {"<type>/<id>": (amenity, point)} of the amenity files."""
+    store = {}
+    for amenity in amenities:
+        file_path = Path(base_dir) / f"{amenity}.geojson"
+        if not file_path.exists():
+            continue
+        with open(file_path, "r", encoding="utf-8") as f:
+            features = json.load(f)["features"]
+        for feature in features:
+            props = feature["properties"]
+            lon, lat = feature["geometry"]["coordinates"]
+            point = {"id": props["id"], "type": props["osm_type"], "name": props["name"], "lat": lat, "lon": lon}
+            store[f"{point['type']}/{point['id']}"] = (amenity, point)
+    return store
+
+
+def sync_points_mauritius(amenities, since, areaId=None, base_dir=OSM_DIR):
+    """
+    Merge the amenities changed in OSM since `since` into the saved files.
+    Returns {amenity: [points]}, the amenities whose points changed and the
+    OSM base timestamp.
+    """
+    if areaId is None:
+        areaId = resolve_area_id()
+
+    amenities = list(amenities)
+    store = load_points(amenities, base_dir)
+    filters = [('nwr', f'["amenity"~"^({"|".join(amenities)})$"]')]
+    changes, timestamp = fetch_changes(CachedOverpass(), areaId, {"amenities": filters}, since, out='center')
+    elements, current = changes["amenities"]
+
+    changed = {}
+    for el in elements:
+        p = element_to_point(el)
+        amenity = el.tag('amenity')
+        changed[element_key(el)] = (amenity, p) if p is not None and amenity in amenities else None
+    touched = merge(store, changed, current)
+
+    affected = {old[0] for old in touched.values() if old is not None}
+    affected |= {store[key][0] for key in touched if key in store}
+    print(f"{len(elements)} changed elements, {len(touched)} points updated in {len(affected)} amenity files.")
+
+    points_by_amenity = {a: [] for a in amenities}
+    for amenity, p in store.values():
+        points_by_amenity[amenity].append(p)
+    for pts in points_by_amenity.values():
+        # Same order as the Overpass output of a full fetch
+        pts.sort(key=lambda p: key_order(f"{p['type']}/{p['id']}"))
+    return points_by_amenity, affected, timestamp
 
 
 # ============================================================
@@ -115,7 +180,7 @@ def save_points(point, points, base_dir=None):
         
     if base_dir is None:
         # Default to ../geo-maurice-app/public/data/osm relative to this script
-        base_dir = Path(__file__).parent.parent / "geo-maurice-app" / "public" / "data" / "osm"
+        base_dir = OSM_DIR
         
     folder = Path(base_dir) 
     folder.mkdir(parents=True, exist_ok=True)
@@ -137,6 +202,7 @@ def save_points(point, points, base_dir=None):
             },
             "properties": {
                 "id": p["id"],
+                "osm_type": p["type"],
                 "name": p["name"],
                 "amenity": point
             }
@@ -152,21 +218,105 @@ def save_points(point, points, base_dir=None):
 # 4) Script principal
 # ============================================================
 
-if __name__ == "__main__":
-    print("\n=== Fetching OSM amenities for Mauritius ===\n")
+def fetch_batched(chunk_size=None, incremental=False):
+    """
+    Fetch all amenity groups in one batched query and save per-amenity files.
+    Incremental: only the changes since the last sync, and only the amenity
+    files they affect are rewritten. The sync starts from the saved files:
+    when one is missing (other than the amenities without points at the
+    last sync), the fetch is full.
+    """
+    all_amenities = [a for amenity_list in ALL_AMENITY_GROUPS.values() for a in amenity_list]
+
+    since = last_sync("amenities") if incremental else None
+    if since:
+        empty = set(last_sync("amenities_empty") or [])
+        missing = [a for a in all_amenities if a not in empty and not (OSM_DIR / f"{a}.geojson").exists()]
+        if missing:
+            print(f"⚠️ Missing amenity files ({', '.join(missing)}), full fetch")
+            since = None
+    if since:
+        print(f"Fetching the changes of {len(all_amenities)} amenity types since {since}...")
+        with stage("sync_amenities") as span:
+            points_by_amenity, affected, timestamp = sync_points_mauritius(all_amenities, since)
+            record(span, amenities=all_amenities, affected=affected)
+    else:
+        print(f"Fetching {len(all_amenities)} amenity types in batch...")
+        with stage("fetch_amenities") as span:
+            points_by_amenity, timestamp = fetch_all_points_mauritius(all_amenities, chunk_size=chunk_size)
+            affected = set(all_amenities)
+            record(span, amenities=all_amenities, points=sum(len(pts) for pts in points_by_amenity.values()))
+
+    with stage("save"):
+        for group_name, amenity_list in ALL_AMENITY_GROUPS.items():
+            if not affected.intersection(amenity_list):
+                continue
+            print(f"\n--- Category: {group_name} ---")
+
+            for point in amenity_list:
+                if point not in affected:
+                    continue
+                pts = points_by_amenity[point]
+                print(f"'{point}': {len(pts)} found.")
+                save_points(point, pts)
+                if not pts and since and (OSM_DIR / f"{point}.geojson").exists():
+                    # The last points of the amenity were removed from OSM
+                    (OSM_DIR / f"{point}.geojson").unlink()
+                    print(f"✔ Removed {OSM_DIR / f'{point}.geojson'}")
+    save_sync("amenities", timestamp)
+    # Amenities without points have no file: not missing at the next sync
+    save_sync("amenities_empty", [a for a in all_amenities if not (OSM_DIR / f"{a}.geojson").exists()])
+
+
+def fetch_one_by_one():
+    """Legacy mode: one Overpass query per amenity type."""
+    areaId = resolve_area_id()
+    failed = []
 
     for group_name, amenity_list in ALL_AMENITY_GROUPS.items():
         print(f"\n--- Category: {group_name} ---")
 
-        for point in amenity_list:
-            print(f"Fetching '{point}'...", end=" ")
+        with stage(f"fetch_{group_name}") as span:
+            found = 0
+            for point in amenity_list:
+                print(f"Fetching '{point}'...", end=" ")
 
-            try:
-                pts = fetch_points_mauritius(point)
-                print(f"{len(pts)} found.")
-                save_points(point, pts)
+                try:
+                    pts = fetch_points_mauritius(point, areaId=areaId)
+                    print(f"{len(pts)} found.")
+                    save_points(point, pts)
+                    found += len(pts)
+
+                except Exception as e:
+                    print(f"ERROR → {e}")
+                    failed.append(point)
+            record(span, amenities=amenity_list, points=found)
+
+    if failed:
+        # Keep the previous files of the failed amenities, but fail the run
+        raise SystemExit(f"❌ {len(failed)} amenity queries failed: {', '.join(failed)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fetch OSM amenities for Mauritius")
+    parser.add_argument("--per-amenity", action="store_true",
+                        help="One query per amenity type (legacy, slow)")
+    parser.add_argument("--chunk-size", type=int, default=None,
+                        help="Split the batched query into chunks of N amenity types")
+    add_cache_arguments(parser)
+    add_incremental_argument(parser)
+    add_telemetry_arguments(parser)
+    args = parser.parse_args()
+    if args.incremental and args.per_amenity:
+        parser.error("--incremental only applies to the batched query")
+    configure_cache_from_args(args)
+
+    print("\n=== Fetching OSM amenities for Mauritius ===\n")
 
-            except Exception as e:
-                print(f"ERROR → {e}")
+    with run_from_args("fetch_osm", args):
+        if args.per_amenity:
+            fetch_one_by_one()
+        else:
+            fetch_batched(chunk_size=args.chunk_size, incremental=args.incremental)
 
 # %%
@@ -7,6 +7,8 @@ import requests
 from OSMPythonTools.nominatim import Nominatim
 from OSMPythonTools.overpass import Overpass, overpassQueryBuilder
 
+from telemetry import record, run, stage
+
 def fetch_points_mauritius(point):
     # 1. Résolution de "Mauritius" → areaId OSM
     nominatim = Nominatim()
@@ -54,7 +56,9 @@ if __name__ == "__main__":
     #     print(h)
 
     point="pharmacy"
-    hs = fetch_points_mauritius(point)
+    with run("fetch_point_mauritus"), stage("fetch_points") as span:
+        hs = fetch_points_mauritius(point)
+        record(span, points=hs)
     print(f"Number of {point} found : {len(hs)}")
     for h in hs:
         print(h)
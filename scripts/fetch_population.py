@@ -1,9 +1,15 @@
 import os
+import argparse
 import requests
 import rasterio
-import json
 import numpy as np
 from pathlib import Path
+from rasterio.warp import reproject, Resampling
+
+from grid_io import save_grid_outputs, add_grid_arguments
+from grid_regions import (GRID_BBOX, grid_shape, grid_transform, region_grids, assemble_global,
+                          save_region_outputs)
+from telemetry import add_telemetry_arguments, record, run_from_args, stage
 
 # Configuration
 # Correct URL Pattern for UNadj 1km:
@@ -16,13 +22,10 @@ PUBLIC_DATA_DIR = Path(__file__).parent.parent / "geo-maurice-app/public/data"
 RAW_FILE = DATA_DIR / "population_2020_1km.tif"
 OUTPUT_FILE = PUBLIC_DATA_DIR / "population.json"
 
-# Bounding box of our map
-GRID_BBOX = {
-    'minLat': -20.60,
-    'maxLat': -19.40,
-    'minLon': 57.20,
-    'maxLon': 63.60,
-    'step': 0.002 # Same as heatmap.js resolution
+RESAMPLING = {
+    'nearest': Resampling.nearest,
+    'bilinear': Resampling.bilinear,
+    'sum': Resampling.sum,
 }
 
 def download_file(url, target_path):
@@ -41,86 +44,91 @@ def download_file(url, target_path):
             f.write(chunk)
     print("Download complete.")
 
-def process_raster():
+def target_grid(bbox=GRID_BBOX):
+    """Width, height and north-up transform of a grid (app grid or region).
+
+    Pixel centers sit on the grid nodes (minLon + x*step, minLat + y*step),
+    the points sampled by the app. The raster is north-up, so it must be
+    flipped to get row 0 = minLat.
+    """
+    width, height = grid_shape(bbox)
+    transform = grid_transform(bbox)
+    return width, height, transform
+
+
+def resample_population(src, resampling='nearest', bbox=GRID_BBOX):
+    """
+    Resample the population raster onto a grid in one warp.
+
+    - nearest: value of the source pixel containing each grid node
+    - bilinear: interpolated density
+    - sum: mass-conserving, each cell gets its share of the source
+      population so that totals are preserved
+    Returns a float32 array with row 0 = minLat.
+    """
+    width, height, transform = target_grid(bbox)
+    values = np.zeros((height, width), dtype=np.float32)
+
+    reproject(
+        source=rasterio.band(src, 1),
+        destination=values,
+        src_transform=src.transform,
+        src_crs=src.crs,
+        src_nodata=src.nodata,
+        dst_transform=transform,
+        dst_crs="EPSG:4326",
+        dst_nodata=0,
+        resampling=RESAMPLING[resampling]
+    )
+
+    # NoData is usually -9999
+    values[~np.isfinite(values)] = 0
+    values[values < 0] = 0
+    return np.flipud(values)
+
+
+def process_raster(resampling='nearest', fmt='both', dtype='float32'):
     print("Processing raster data...")
     OUTPUT_FILE.parent.mkdir(parents=True, exist_ok=True)
 
-    with rasterio.open(RAW_FILE) as src:
+    region_values = {}
+    with stage("resample") as span, rasterio.open(RAW_FILE) as src:
         print(f"Raster size: {src.width}x{src.height}")
         print(f"Bounds: {src.bounds}")
         
         # We need to resample/interpolate this to match our application grid
-        # Our app uses a regular grid defined by GRID_BBOX
-        
-        min_lat = GRID_BBOX['minLat']
-        max_lat = GRID_BBOX['maxLat']
-        min_lon = GRID_BBOX['minLon']
-        max_lon = GRID_BBOX['maxLon']
-        step = GRID_BBOX['step']
-        
-        width = int(np.ceil((max_lon - min_lon) / step))
-        height = int(np.ceil((max_lat - min_lat) / step))
-        
-        print(f"Target Grid: {width}x{height}")
-        
-        values = np.zeros((height, width), dtype=np.float32)
-        
-        # Inefficient but simple sampling method for now (nearest neighbor or sample at point)
-        # Iterate over our target grid and sample from raster
-        
-        # Note: Rasterio sample expects list of (x, y) coordinates
-        samples = []
-        for y in range(height):
-            # Calculate Lat for this row (Grid 0 is MinLat? No, usually MaxLat is top for images)
-            # But our loop in heatmap.js is: for (let lat = minLat; lat <= maxLat...)
-            # so row 0 is minLat.
-            
-            # For raster sampling, we just need correct coords
-            # Let's stick to our heatmap logic: index 0 is minLat
-            
-            grid_lat = min_lat + y * step 
-            
-            for x in range(width):
-                grid_lon = min_lon + x * step
-                samples.append((grid_lon, grid_lat))
-        
-        # Perform sampling
-        # rasterio.sample returns a generator of arrays
-        sampled_values = list(src.sample(samples))
-        
-        # Convert to 1D flat array matched to our grid logic
-        # sampled_values is list of [val], process nodata
-        
-        flat_values = []
-        max_val = 0
-        
-        for val in sampled_values:
-            v = val[0]
-            if v < 0: v = 0 # NoData usually -9999
-            if np.isnan(v): v = 0
-            
-            flat_values.append(float(v))
-            if v > max_val: max_val = v
-
-        output_data = {
-            "width": width,
-            "height": height,
-            "minLat": min_lat,
-            "maxLat": max_lat,
-            "minLon": min_lon,
-            "maxLon": max_lon,
-            "step": step,
-            "maxScore": float(max_val),
-            "values": flat_values # Json handles list of floats
-        }
-        
-        print(f"Max population density found: {max_val}")
-        
-        with open(OUTPUT_FILE, 'w') as f:
-            json.dump(output_data, f)
-            
-        print(f"Saved processed grid to {OUTPUT_FILE}")
+        # Only the island sub-grids are resampled, row 0 is minLat
+        for region in region_grids():
+            region_values[region['name']] = resample_population(src, resampling, region)
+            print(f"Region {region['name']}: {region['width']}x{region['height']} ({resampling})")
+        record(span, source_pixels=src.width * src.height, **region_values)
+
+    total = sum(v.sum(dtype=np.float64) for v in region_values.values())
+    print(f"Total population on grid: {total:.0f}")
+
+    max_val = float(max(v.max() for v in region_values.values()))
+    print(f"Max population density found: {max_val}")
+    
+    with stage("save") as span:
+        written = save_region_outputs(OUTPUT_FILE, region_values, max_score=max_val, dtype=dtype)
+
+        # Full GRID_BBOX envelope for the app
+        values = assemble_global(region_values, fill=0.0)
+        written += save_grid_outputs(OUTPUT_FILE, values, GRID_BBOX, max_score=max_val, fmt=fmt, dtype=dtype)
+        record(span, grid=values, bytes=sum(path.stat().st_size for path in written))
+    for path in written:
+        print(f"Saved processed grid to {path}")
 
 if __name__ == "__main__":
-    download_file(URL, RAW_FILE)
-    process_raster()
+    parser = argparse.ArgumentParser(description="Download and resample WorldPop population data")
+    parser.add_argument("--resampling", choices=sorted(RESAMPLING), default="nearest",
+                        help="nearest (default), bilinear or mass-conserving sum")
+    add_grid_arguments(parser)
+    add_telemetry_arguments(parser)
+    args = parser.parse_args()
+
+    with run_from_args("fetch_population", args):
+        with stage("download") as span:
+            download_file(URL, RAW_FILE)
+            record(span, raw_bytes=RAW_FILE)
+        process_raster(args.resampling, fmt=args.format, dtype=args.dtype)
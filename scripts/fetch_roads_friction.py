@@ -4,26 +4,33 @@ Fetch OSM road data for Mauritius and create a friction grid.
 Friction values are based on road proximity and type.
 """
 
+import argparse
 import json
 import numpy as np
 from pathlib import Path
-from OSMPythonTools.nominatim import Nominatim
-from OSMPythonTools.overpass import Overpass, overpassQueryBuilder
+from OSMPythonTools.overpass import overpassQueryBuilder
+from rasterio.features import rasterize
+from rasterio.transform import from_origin
+from rasterio.windows import Window
 from scipy.ndimage import distance_transform_edt
 
+from grid_io import patch_grid, save_grid_outputs, add_grid_arguments
+from grid_regions import GRID_BBOX, grid_shape, region_grids, region_store, assemble_global, save_region_outputs
+from osm_cache import CachedOverpass, resolve_area_id, query_all, add_cache_arguments, configure_cache_from_args
+from osm_sync import (add_incremental_argument, element_key, fetch_changes, key_order, last_sync, merge, osm_base,
+                      save_sync)
+from raster_store import has_band, read_band, store_path, write_window
+from telemetry import add_telemetry_arguments, record, run_from_args, stage
+
 # Configuration
 DATA_DIR = Path(__file__).parent.parent / "data"
 PUBLIC_DATA_DIR = Path(__file__).parent.parent / "geo-maurice-app/public/data"
 OUTPUT_FILE = PUBLIC_DATA_DIR / "roads_friction.json"
-
-# Same grid as heatmap.js and population.json
-GRID_BBOX = {
-    'minLat': -20.60,
-    'maxLat': -19.40,
-    'minLon': 57.20,
-    'maxLon': 63.60,
-    'step': 0.002  # ~200m resolution
-}
+# Road store, merged by the incremental refresh (--incremental)
+ROADS_FILE = DATA_DIR / "osm" / "roads.geojson"
+# Grid tiles changed by the last update, for the downstream caches
+CHANGES_FILE = DATA_DIR / "osm" / "roads_changes.json"
+CHANGE_TILE = 32  # pixels (~6 km)
 
 # Road types and their friction values (lower = faster travel)
 ROAD_FRICTION = {
@@ -48,164 +55,510 @@ ROAD_FRICTION = {
 # Default friction for areas far from roads
 MAX_FRICTION = 5.0
 
+# Distance at which off-road friction reaches MAX_FRICTION
+DECAY_DISTANCE = 10  # pixels (~2km)
+
+# Every road type in one selector (incremental refresh)
+ROAD_FILTERS = [('way', f'["highway"~"^({"|".join(ROAD_FRICTION)})$"]')]
+
+
+def road_from_element(element):
+    """Road record of a highway way ({'id', 'type', 'friction', 'coords'}), or None without geometry."""
+    road_type = element.tag('highway')
+    geom = element.geometry()
+    if road_type not in ROAD_FRICTION or not geom or 'coordinates' not in geom:
+        return None
+    return {
+        'id': element_key(element),
+        'type': road_type,
+        'friction': ROAD_FRICTION[road_type],
+        # plain lists, as read back from the road store
+        'coords': json.loads(json.dumps(geom['coordinates'])),
+    }
+
 
 def fetch_roads():
-    """Fetch all road segments from OSM for Mauritius."""
+    """
+    Fetch all road segments from OSM for Mauritius.
+    Returns the roads and the OSM base timestamp of the data.
+    """
     print("Fetching roads from OSM...")
     
-    nominatim = Nominatim()
-    areaId = nominatim.query('Mauritius').areaId()
+    areaId = resolve_area_id()
     
     # Query all highway types
     road_types = list(ROAD_FRICTION.keys())
     
-    overpass = Overpass()
+    overpass = CachedOverpass()
     all_roads = []
-    
-    for road_type in road_types:
-        print(f"  Fetching {road_type}...", end=" ")
-        
-        query = overpassQueryBuilder(
+
+    queries = [
+        overpassQueryBuilder(
             area=areaId,
             elementType=['way'],
             selector=f'"highway"="{road_type}"',
             out='geom'
         )
-        
-        try:
-            result = overpass.query(query, timeout=60)
-            count = 0
-            
-            for element in result.elements():
-                geom = element.geometry()
-                if geom and 'coordinates' in geom:
-                    coords = geom['coordinates']
-                    all_roads.append({
-                        'type': road_type,
-                        'friction': ROAD_FRICTION[road_type],
-                        'coords': coords
-                    })
-                    count += 1
-            
-            print(f"{count} ways")
-        except Exception as e:
-            print(f"ERROR: {e}")
-    
+        for road_type in road_types
+    ]
+
+    # Concurrent queries through the Overpass scheduler; a road class that
+    # still fails after the retries aborts the run instead of coming out empty
+    results = query_all(overpass, queries, timeout=60)
+
+    for road_type, result in zip(road_types, results):
+        count = 0
+
+        for element in result.elements():
+            road = road_from_element(element)
+            if road is not None:
+                all_roads.append(road)
+                count += 1
+
+        print(f"  {road_type}: {count} ways")
+
     print(f"Total roads fetched: {len(all_roads)}")
-    return all_roads
+    return all_roads, osm_base(results)
 
 
-def create_friction_grid(roads):
-    """Create a friction grid from road data."""
-    print("Creating friction grid...")
-    
-    min_lat = GRID_BBOX['minLat']
-    max_lat = GRID_BBOX['maxLat']
-    min_lon = GRID_BBOX['minLon']
-    max_lon = GRID_BBOX['maxLon']
-    step = GRID_BBOX['step']
-    
-    width = int(np.ceil((max_lon - min_lon) / step))
-    height = int(np.ceil((max_lat - min_lat) / step))
-    
-    print(f"Grid size: {width}x{height}")
-    
-    # Initialize with max friction (no roads)
-    friction_grid = np.full((height, width), MAX_FRICTION, dtype=np.float32)
-    
-    # Mark road pixels with their friction values
-    road_mask = np.zeros((height, width), dtype=np.uint8)
-    
-    def process_coords(coords, friction):
-        """Recursively process coordinates, handling nested structures."""
-        if not coords:
-            return
-        
-        # Check if this is a coordinate pair [lon, lat]
-        if isinstance(coords[0], (int, float)):
-            lon, lat = coords[0], coords[1]
-            x = int((lon - min_lon) / step)
-            y = int((lat - min_lat) / step)
-            
-            if 0 <= x < width and 0 <= y < height:
-                if friction < friction_grid[y, x]:
-                    friction_grid[y, x] = friction
-                road_mask[y, x] = 1
+def sync_roads(since):
+    """
+    Merge the roads changed in OSM since `since` into the road store.
+    Returns the roads, the changed ones ({id: old road or None}) and the OSM
+    base timestamp.
+    """
+    print(f"Fetching roads changed since {since}...")
+    store = {road['id']: road for road in load_roads()}
+
+    changes, timestamp = fetch_changes(CachedOverpass(), resolve_area_id(), {"roads": ROAD_FILTERS},
+                                       since, out='geom', timeout=120)
+    elements, current = changes["roads"]
+    changed = {element_key(el): road_from_element(el) for el in elements if el.type() == 'way'}
+    touched = merge(store, changed, current)
+
+    added = sum(1 for key, old in touched.items() if old is None)
+    removed = sum(1 for key in touched if key not in store)
+    print(f"  {len(elements)} changed ways: {added} added, {removed} removed, "
+          f"{len(touched) - added - removed} modified ({len(store)} roads)")
+    return list(store.values()), touched, timestamp
+
+
+def save_roads(roads, path=ROADS_FILE):
+    """Road store: GeoJSON of the roads with their OSM id, type and friction."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    geojson = {
+        "type": "FeatureCollection",
+        "features": [
+            {
+                "type": "Feature",
+                "id": road['id'],
+                "properties": {"highway": road['type'], "friction": road['friction']},
+                "geometry": {"type": "LineString" if isinstance(road['coords'][0][0], (int, float))
+                             else "MultiLineString", "coordinates": road['coords']},
+            }
+            for road in sorted(roads, key=lambda road: key_order(road['id'])) if road['coords']
+        ],
+    }
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w") as f:
+        json.dump(geojson, f, separators=(",", ":"))
+    tmp.replace(path)
+    print(f"✔ Saved {len(geojson['features'])} roads to {path}")
+
+
+def load_roads(path=ROADS_FILE):
+    with open(path, "r") as f:
+        features = json.load(f)["features"]
+    return [{'id': feature['id'], 'type': feature['properties']['highway'],
+             'friction': feature['properties']['friction'], 'coords': feature['geometry']['coordinates']}
+            for feature in features]
+
+
+def road_geometry(coords):
+    """
+    GeoJSON line geometry for road coordinates: a list of [lon, lat] pairs is a
+    LineString, deeper nesting (closed ways returned as polygons) is burned
+    as the outline rings.
+    """
+    if not coords:
+        return None
+    if isinstance(coords[0][0], (int, float)):
+        return {"type": "LineString", "coordinates": coords}
+
+    lines = []
+    stack = [coords]
+    while stack:
+        item = stack.pop()
+        if item and isinstance(item[0][0], (int, float)):
+            lines.append(item)
         else:
-            # It's a list of coordinates or nested structure
-            for item in coords:
-                if isinstance(item, (list, tuple)):
-                    process_coords(item, friction)
-    
-    for road in roads:
-        process_coords(road['coords'], road['friction'])
-    
-    print(f"Pixels with roads: {np.sum(road_mask)}")
-    
-    # Interpolate friction for pixels between roads
-    # Use distance transform to spread road influence
-    print("Interpolating friction values...")
-    
-    # Distance from each pixel to nearest road (in pixels)
-    distances = distance_transform_edt(1 - road_mask)
-    
-    # For each non-road pixel, interpolate friction based on distance
-    # Friction increases with distance from roads
-    # At ~10 pixels (~2km), friction reaches MAX_FRICTION
-    decay_distance = 10  # pixels
+            stack.extend(c for c in item if c)
+    return {"type": "MultiLineString", "coordinates": lines}
+
+
+def burn_roads(roads, bbox=GRID_BBOX):
+    """
+    Rasterize all road segments (whole lines, not only their vertices) on
+    the grid of the bbox (app grid or region).
+    Returns the friction of the road on each road pixel (MAX_FRICTION
+    elsewhere) and the road mask. Shapes are burned from the highest to the
+    lowest friction so that the fastest road wins where roads overlap.
+    """
+    min_lat = bbox['minLat']
+    min_lon = bbox['minLon']
+    step = bbox['step']
+    width, height = grid_shape(bbox)
+
+    shapes = []
+    for road in sorted(roads, key=lambda r: r['friction'], reverse=True):
+        geom = road_geometry(road['coords'])
+        if geom is not None:
+            shapes.append((geom, road['friction']))
+
+    if not shapes:
+        return (np.full((height, width), MAX_FRICTION, dtype=np.float32),
+                np.zeros((height, width), dtype=bool))
+
+    # North-up raster, flipped afterwards: row 0 of the grid is minLat
+    transform = from_origin(min_lon, min_lat + height * step, step, step)
+    burned = rasterize(
+        shapes,
+        out_shape=(height, width),
+        transform=transform,
+        fill=0,
+        dtype='float32'
+    )
+    burned = np.flipud(burned)
+
+    road_mask = burned > 0
+    road_grid = np.where(road_mask, burned, MAX_FRICTION).astype(np.float32)
+    return road_grid, road_mask
+
+
+def spread_friction(road_grid, road_mask, decay_distance=DECAY_DISTANCE):
+    """
+    Off-road friction: starts from the friction of the nearest road pixel
+    (EDT indices) and increases linearly to MAX_FRICTION at decay_distance.
+    """
+    if not road_mask.any():
+        return np.full(road_grid.shape, MAX_FRICTION, dtype=np.float32)
+
+    # Distance from each pixel to nearest road (in pixels) + its coordinates
+    distances, (near_y, near_x) = distance_transform_edt(~road_mask, return_indices=True)
+    base_friction = road_grid[near_y, near_x]
+
+    t = np.minimum(1.0, distances / decay_distance).astype(np.float32)
+    friction_grid = base_friction + t * (MAX_FRICTION - base_friction)
+    friction_grid[road_mask] = road_grid[road_mask]
+    return friction_grid.astype(np.float32)
+
+
+def create_friction_grids(roads):
+    """Create one friction grid per region ({name: grid}) from road data."""
+    print("Creating friction grids...")
     
-    for y in range(height):
-        for x in range(width):
-            if road_mask[y, x] == 0:
-                dist = distances[y, x]
-                # Find nearest road friction
-                # For simplicity, use average road friction as base
-                base_friction = 1.5  # Average road
-                
-                # Interpolate: friction increases with distance
-                t = min(1.0, dist / decay_distance)
-                friction_grid[y, x] = base_friction + t * (MAX_FRICTION - base_friction)
+    grids = {}
+    for region in region_grids():
+        print(f"Region {region['name']}: {region['width']}x{region['height']}")
+        
+        road_grid, road_mask = burn_roads(roads, region)
+        print(f"  Pixels with roads: {np.sum(road_mask)}")
+        
+        # Interpolate friction for pixels between roads
+        # Use distance transform to spread road influence
+        grids[region['name']] = spread_friction(road_grid, road_mask)
     
+    return grids
+
+
+def road_points(coords):
+    """(N, 2) array of the [lon, lat] vertices of road coordinates, whatever their nesting."""
+    geom = road_geometry(coords)
+    if geom is None:
+        return np.empty((0, 2))
+    lines = [geom['coordinates']] if geom['type'] == 'LineString' else geom['coordinates']
+    return np.array([point[:2] for line in lines for point in line], dtype=np.float64).reshape(-1, 2)
+
+
+def pixel_window(roads, bbox, pad=1):
+    """
+    Window (row0, row1, col0, col1) of the grid of the bbox (row 0 =
+    minLat) holding the pixels burned by the roads, grown by `pad` pixels
+    and clipped to the grid. None if no road crosses the grid.
+    """
+    points = [road_points(road['coords']) for road in roads]
+    points = np.concatenate(points) if points else np.empty((0, 2))
+    if not len(points):
+        return None
+
+    width, height = grid_shape(bbox)
+    cols = np.floor((points[:, 0] - bbox['minLon']) / bbox['step'])
+    rows = np.floor((points[:, 1] - bbox['minLat']) / bbox['step'])
+    row0, row1 = int(rows.min()) - pad, int(rows.max()) + 1 + pad
+    col0, col1 = int(cols.min()) - pad, int(cols.max()) + 1 + pad
+    if row1 <= 0 or col1 <= 0 or row0 >= height or col0 >= width:
+        return None
+    return max(0, row0), min(height, row1), max(0, col0), min(width, col1)
+
+
+def sub_bbox(bbox, window):
+    """Bbox of a window of a grid, on the same pixel grid."""
+    row0, row1, col0, col1 = window
+    step = bbox['step']
+    return {'minLat': bbox['minLat'] + row0 * step, 'maxLat': bbox['minLat'] + row1 * step,
+            'minLon': bbox['minLon'] + col0 * step, 'maxLon': bbox['minLon'] + col1 * step,
+            'step': step, 'width': col1 - col0, 'height': row1 - row0}
+
+
+def grow(window, pixels, shape):
+    row0, row1, col0, col1 = window
+    height, width = shape
+    return max(0, row0 - pixels), min(height, row1 + pixels), max(0, col0 - pixels), min(width, col1 + pixels)
+
+
+def change_windows(changed_roads, region, decay_distance=DECAY_DISTANCE):
+    """
+    Windows of the region grid whose friction may change with the changed
+    roads: the pixels of each road grown by decay_distance (farther, the
+    friction only depends on other roads), overlapping windows merged.
+    """
+    shape = (region['height'], region['width'])
+    reach = int(np.ceil(decay_distance)) + 1
+    windows = []
+    for road in changed_roads:
+        window = pixel_window([road], region)
+        if window is None:
+            continue
+        window = grow(window, reach, shape)
+        # Merge with the windows it overlaps, until none is left
+        overlapping = True
+        while overlapping:
+            overlapping = [w for w in windows if w[0] < window[1] and window[0] < w[1]
+                           and w[2] < window[3] and window[2] < w[3]]
+            for w in overlapping:
+                windows.remove(w)
+                window = (min(w[0], window[0]), max(w[1], window[1]), min(w[2], window[2]), max(w[3], window[3]))
+        windows.append(window)
+    return sorted(windows)
+
+
+def update_friction_grid(grid, roads, window, region, decay_distance=DECAY_DISTANCE):
+    """
+    Recompute the friction of a window of a region grid in place, `roads`
+    being the whole network. The friction of a pixel only depends on the
+    roads within decay_distance, so only the roads of the window grown by
+    decay_distance are burned and spread: same values as a full rebuild.
+    """
+    reach = int(np.ceil(decay_distance)) + 1
+    # Every road pixel that may be the nearest road of a pixel of the window
+    context = grow(window, reach + 2, grid.shape)
+    context_bbox = sub_bbox(region, context)
+    nearby = [road for road in roads if pixel_window([road], context_bbox) is not None]
+
+    road_grid, road_mask = burn_roads(nearby, context_bbox)
+    friction = spread_friction(road_grid, road_mask, decay_distance)
+
+    row0, row1, col0, col1 = window
+    grid[row0:row1, col0:col1] = friction[row0 - context[0]:row1 - context[0], col0 - context[2]:col1 - context[2]]
+
+
+def changed_tiles(old, new, window, tile=CHANGE_TILE):
+    """Tiles [ty, tx] of the grid (tile x tile pixels, row 0 = minLat) whose values changed in the window."""
+    rows, cols = np.nonzero(old != new)
+    tiles = {((window[0] + r) // tile, (window[2] + c) // tile) for r, c in zip(rows.tolist(), cols.tolist())}
+    return [list(t) for t in sorted(tiles)]
+
+
+def load_friction_grids():
+    """Full-precision region friction grids of the region stores ({name: grid}), None if one is missing."""
+    grids = {}
+    band = OUTPUT_FILE.stem
+    for region in region_grids():
+        store = store_path(f"app_{region['name']}")
+        if not has_band(store, band):
+            return None
+        grids[region['name']] = np.flipud(read_band(store, band)).astype(np.float32)
+    return grids
+
+
+def update_friction_grids(grids, roads, touched):
+    """
+    Patch the region grids ({name: grid}) in place for the roads changed
+    by an incremental sync ({id: old road or None}), old and new versions.
+    Returns the patched windows ({name: [(row0, row1, col0, col1)]}) and the
+    changed tiles ({name: [[ty, tx]]}).
+    """
+    current = {road['id']: road for road in roads}
+    changed_roads = [old for old in touched.values() if old is not None]
+    changed_roads += [current[key] for key in touched if key in current]
+
+    windows, tiles = {}, {}
+    for region in region_grids():
+        region_windows = change_windows(changed_roads, region)
+        if not region_windows:
+            continue
+        grid = grids[region['name']]
+        before = grid.copy()
+        region_tiles = set()
+        for window in region_windows:
+            update_friction_grid(grid, roads, window, region)
+            row0, row1, col0, col1 = window
+            region_tiles.update(map(tuple, changed_tiles(before[row0:row1, col0:col1],
+                                                         grid[row0:row1, col0:col1], window)))
+        windows[region['name']] = region_windows
+        tiles[region['name']] = [list(t) for t in sorted(region_tiles)]
+        pixels = sum((w[1] - w[0]) * (w[3] - w[2]) for w in region_windows)
+        print(f"Region {region['name']}: {len(region_windows)} windows patched "
+              f"({pixels / grid.size:.1%} of the grid), {len(region_tiles)} tiles changed")
+    return windows, tiles
+
+
+def save_changes(tiles, timestamp, full=False, path=CHANGES_FILE):
+    """
+    Change report of the friction grids: the tiles (CHANGE_TILE pixels, row
+    0 = minLat) changed per region, or full=True after a full rebuild
+    (every tile may have changed). The tiles are added to those of the
+    previous syncs until accessibility.py consumes the report (and clears
+    it); without a previous report, the changes before this sync are
+    unknown and the report is full.
+    """
+    merged = {name: {tuple(t) for t in region_tiles} for name, region_tiles in tiles.items()}
+    previous = None
+    if path.exists():
+        with open(path, "r") as f:
+            previous = json.load(f)
+    if previous is None or previous.get("tile_size") != CHANGE_TILE:
+        full = True
+    else:
+        full = full or previous.get("full", False)
+        for name, region_tiles in previous.get("regions", {}).items():
+            merged.setdefault(name, set()).update(tuple(t) for t in region_tiles)
+
+    report = {"grid": OUTPUT_FILE.stem, "timestamp": timestamp, "tile_size": CHANGE_TILE, "full": full,
+              "regions": {name: [list(t) for t in sorted(region_tiles)]
+                          for name, region_tiles in merged.items() if region_tiles}}
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"✔ Saved the changed tiles to {path}")
+
+
+def create_friction_grid(roads):
+    """Create the friction grid over the full GRID_BBOX from road data."""
+    friction_grid = assemble_global(create_friction_grids(roads), fill=MAX_FRICTION)
+    height, width = friction_grid.shape
     return friction_grid, width, height
 
 
-def save_grid(friction_grid, width, height):
-    """Save friction grid to JSON in same format as population.json."""
-    print(f"Saving to {OUTPUT_FILE}...")
-    
-    OUTPUT_FILE.parent.mkdir(parents=True, exist_ok=True)
-    
-    # Flatten to 1D array (row-major, matching population.json)
-    flat_values = friction_grid.flatten().tolist()
-    
-    output_data = {
-        "width": width,
-        "height": height,
-        "minLat": GRID_BBOX['minLat'],
-        "maxLat": GRID_BBOX['maxLat'],
-        "minLon": GRID_BBOX['minLon'],
-        "maxLon": GRID_BBOX['maxLon'],
-        "step": GRID_BBOX['step'],
-        "maxScore": float(MAX_FRICTION),
-        "values": flat_values
-    }
+def save_grid(region_grids, fmt='both', dtype='float32'):
+    """
+    Save the region friction grids (.<region>.grid) and the full grid as
+    .grid (binary) and/or .json, same layout as population.
+    """
+    print(f"Saving to {OUTPUT_FILE.with_suffix('')}.* ({fmt})...")
     
-    with open(OUTPUT_FILE, 'w') as f:
-        json.dump(output_data, f)
+    written = save_region_outputs(OUTPUT_FILE, region_grids, max_score=MAX_FRICTION, dtype=dtype)
+    friction_grid = assemble_global(region_grids, fill=MAX_FRICTION)
+    written += save_grid_outputs(OUTPUT_FILE, friction_grid, GRID_BBOX,
+                                 max_score=MAX_FRICTION, fmt=fmt, dtype=dtype)
     
-    print(f"Saved! File size: {OUTPUT_FILE.stat().st_size / 1024:.1f} KB")
+    for path in written:
+        print(f"Saved! {path.name}: {path.stat().st_size / 1024:.1f} KB")
+
+
+def save_grid_patch(grids, windows, fmt='both', dtype='float32'):
+    """
+    Write the patched windows of the region grids: in place in the region
+    stores and, when their quantization allows it, in the .grid files; the
+    other files (legacy .json, uint16 grids whose range changed) are
+    rewritten whole.
+    """
+    base = OUTPUT_FILE.with_suffix('')
+    friction_grid = assemble_global(grids, fill=MAX_FRICTION)
+    written = []
+    for region in region_grids():
+        if region['name'] not in windows:
+            continue
+        grid = grids[region['name']]
+        store = region_store(region)
+        for row0, row1, col0, col1 in windows[region['name']]:
+            # Stores are north-up: flipped rows
+            write_window(store, base.name, np.flipud(grid[row0:row1, col0:col1]),
+                         Window(col0, region['height'] - row1, col1 - col0, row1 - row0))
+
+        path = base.with_name(f"{base.name}.{region['name']}.grid")
+        if not (path.exists() and all(patch_grid(path, grid, window, dtype) for window in windows[region['name']])):
+            written += save_grid_outputs(path, grid, region, max_score=MAX_FRICTION, fmt='binary',
+                                         dtype=dtype, region=region['name'], x0=region['x0'], y0=region['y0'])
+
+    if fmt in ('binary', 'both'):
+        path = base.with_suffix('.grid')
+        patched = path.exists()
+        for region in region_grids():
+            for row0, row1, col0, col1 in windows.get(region['name'], []):
+                patched = patched and patch_grid(path, friction_grid, (row0 + region['y0'], row1 + region['y0'],
+                                                                       col0 + region['x0'], col1 + region['x0']),
+                                                 dtype)
+        if not patched:
+            written += save_grid_outputs(base, friction_grid, GRID_BBOX, max_score=MAX_FRICTION,
+                                         fmt='binary', dtype=dtype)
+    if fmt in ('json', 'both'):
+        written += save_grid_outputs(base, friction_grid, GRID_BBOX, max_score=MAX_FRICTION,
+                                     fmt='json', dtype=dtype)
+
+    for path in written:
+        print(f"Saved! {path.name}: {path.stat().st_size / 1024:.1f} KB")
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fetch OSM roads and build the friction grid")
+    add_cache_arguments(parser)
+    add_incremental_argument(parser)
+    add_grid_arguments(parser)
+    add_telemetry_arguments(parser)
+    args = parser.parse_args()
+    configure_cache_from_args(args)
+
     print("=== Fetching OSM Roads for Mauritius ===\n")
     
-    roads = fetch_roads()
-    
-    if len(roads) == 0:
-        print("No roads found! Check OSM query.")
-        exit(1)
-    
-    friction_grid, width, height = create_friction_grid(roads)
-    save_grid(friction_grid, width, height)
+    with run_from_args("fetch_roads_friction", args):
+        since = last_sync("roads") if args.incremental and ROADS_FILE.exists() else None
+        if since:
+            with stage("sync_roads") as span:
+                roads, touched, timestamp = sync_roads(since)
+                record(span, roads=roads, changed=touched)
+        else:
+            with stage("fetch_roads") as span:
+                roads, timestamp = fetch_roads()
+                touched = None
+                record(span, roads=roads)
+        
+        if len(roads) == 0:
+            print("No roads found! Check OSM query.")
+            exit(1)
+        
+        if touched == {}:
+            print("✔ No road changed, friction grids kept")
+            save_changes({}, timestamp)
+        else:
+            with stage("save_roads"):
+                save_roads(roads)
+            # After a sync, only the windows around the changed roads are recomputed
+            friction_grids = load_friction_grids() if touched else None
+            if friction_grids is not None:
+                with stage("patch_grids") as span:
+                    windows, tiles = update_friction_grids(friction_grids, roads, touched)
+                    record(span, windows=windows, tiles=sum(len(t) for t in tiles.values()))
+                with stage("save"):
+                    save_grid_patch(friction_grids, windows, fmt=args.format, dtype=args.dtype)
+                    save_changes(tiles, timestamp)
+            else:
+                with stage("friction_grids") as span:
+                    friction_grids = create_friction_grids(roads)
+                    record(span, **friction_grids)
+                with stage("save"):
+                    save_grid(friction_grids, fmt=args.format, dtype=args.dtype)
+                    save_changes({}, timestamp, full=True)
+        save_sync("roads", timestamp)
     
     print("\nDone!")
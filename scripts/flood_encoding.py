@@ -0,0 +1,286 @@
+"""
+Value encodings of the flood simulator rasters (full images and tiles).
+
+Three layers are exported: flood (HAND), sea (flood-onset level, elevation
+for the water depth) and population (density). Encodings:
+- sqrt: RGBA, 8-bit 255 * sqrt(v / max) in red, land in alpha; the sea layer
+  has the elevation in red and the flood-onset level in green (legacy)
+- rg16: RGB, 16-bit code in red (high byte) and green (low byte); the sea
+  layer keeps the 8-bit sqrt elevation in blue for the water depth
+- gray: single channel, 8-bit code; the sea layer only has the flood-onset
+  level, also used for the water depth
+Codes of rg16 and gray: 0 is off land (or empty), heights are
+1 + round(sqrt(v / max) * (top - 1)) and the population
+1 + round(v / max * (top - 1)), top = 65535 (rg16) or 255 (gray). Every
+layout has opaque pixels on land, so the browser canvas returns them
+unchanged (no premultiplied alpha).
+
+The images are PNG (streamed) or lossless WebP (Pillow, held in memory).
+export_layer measures the decoding error on land while writing, for the
+size-versus-precision report of the build.
+"""
+
+import struct
+import tempfile
+import zlib
+import numpy as np
+from pathlib import Path
+
+from raster_store import STRIP_ROWS, band_strips, store_profile
+
+ENCODINGS = ('sqrt', 'rg16', 'gray')
+IMAGE_FORMATS = ('png', 'webp')
+
+LAYER_FILES = {"flood": "flood_hand", "sea": "sea_level", "population": "flood_population"}
+LAYER_BANDS = {
+    "flood": ["hand", "dem", "districts"],
+    "sea": ["dem", "sea_onset", "districts"],
+    "population": ["population"],
+}
+# Band holding the value tested against the water level (reported precision)
+LAYER_VALUE = {"flood": "hand", "sea": "sea_onset", "population": "population"}
+
+CODE_TOP = {'rg16': 65535, 'gray': 255}
+CHANNELS = {'sqrt': 4, 'rg16': 3, 'gray': 1}
+MIN_POPULATION = 0.1  # densities below are transparent (empty)
+WEBP_MAX_SIZE = 16383
+
+
+def encode_sqrt(values, max_value):
+    """Square root encoding, favors low heights: 255 * sqrt(v / max)."""
+    clamped = np.clip(values, 0, max_value)
+    return (np.sqrt(clamped / max_value) * 255.0).astype(np.uint8)
+
+
+def land_alpha(dem, land):
+    """Alpha channel of the PNGs: opaque on land, transparent on the ocean."""
+    alpha = np.full(dem.shape, 255, dtype=np.uint8)
+    alpha[dem <= 0] = 0
+    alpha[land == 0] = 0
+    return alpha
+
+
+def red_alpha(red, alpha, green=None):
+    rgba = np.zeros(red.shape + (4,), dtype=np.uint8)
+    rgba[..., 0] = red
+    if green is not None:
+        rgba[..., 1] = green
+    rgba[..., 3] = alpha
+    return rgba
+
+
+def sqrt_code(values, max_value, top):
+    clamped = np.clip(np.nan_to_num(values), 0, max_value)
+    return (1 + np.rint(np.sqrt(clamped / max_value) * (top - 1))).astype(np.uint32)
+
+
+def linear_code(values, max_value, top):
+    clamped = np.clip(np.nan_to_num(values), 0, max_value)
+    return (1 + np.rint(clamped / max_value * (top - 1))).astype(np.uint32)
+
+
+def layer_valid(layer, bands):
+    """Pixels carrying a value: land for the heights, populated cells."""
+    if layer == "population":
+        return bands["population"] > MIN_POPULATION
+    return land_alpha(bands["dem"], bands["districts"]) > 0
+
+
+def encode_layer(layer, bands, encoding='sqrt', max_height=None, max_population=None):
+    """Pixels (rows, width, channels) uint8 of a strip ({band: array}) of a layer."""
+    if encoding == 'sqrt':
+        if layer == "flood":
+            return red_alpha(encode_sqrt(bands["hand"], max_height), land_alpha(bands["dem"], bands["districts"]))
+        if layer == "sea":
+            return red_alpha(encode_sqrt(bands["dem"], max_height), land_alpha(bands["dem"], bands["districts"]),
+                             green=encode_sqrt(bands["sea_onset"], max_height))
+        pop = bands["population"]
+        scaled = np.clip(pop / max_population * 255, 0, 255).astype(np.uint8)
+        return red_alpha(scaled, np.where(pop <= MIN_POPULATION, 0, 255).astype(np.uint8))
+
+    top = CODE_TOP[encoding]
+    values = bands[LAYER_VALUE[layer]]
+    if layer == "population":
+        code = linear_code(values, max_population, top)
+    else:
+        code = sqrt_code(values, max_height, top)
+    code[~layer_valid(layer, bands)] = 0
+
+    pixels = np.zeros(code.shape + (CHANNELS[encoding],), dtype=np.uint8)
+    if encoding == 'gray':
+        pixels[..., 0] = code
+        return pixels
+    pixels[..., 0] = code >> 8
+    pixels[..., 1] = code & 0xff
+    if layer == "sea":
+        pixels[..., 2] = np.where(code > 0, encode_sqrt(bands["dem"], max_height), 0)
+    return pixels
+
+
+def decode_layer(layer, pixels, encoding='sqrt', max_height=None, max_population=None):
+    """Values tested against the water level (or densities) of encoded pixels."""
+    if encoding == 'sqrt':
+        code = pixels[..., 1 if layer == "sea" else 0].astype(np.float64)
+        scale = max_population if layer == "population" else max_height
+        return code / 255 * scale if layer == "population" else (code / 255) ** 2 * scale
+
+    top = CODE_TOP[encoding]
+    code = pixels[..., 0].astype(np.float64)
+    if encoding == 'rg16':
+        code = code * 256 + pixels[..., 1]
+    fraction = np.maximum(code - 1, 0) / (top - 1)
+    return fraction * max_population if layer == "population" else fraction ** 2 * max_height
+
+
+def has_data(pixels):
+    """False for a fully transparent (or empty) image."""
+    return bool(pixels[..., 3].any() if pixels.shape[-1] == 4 else pixels.any())
+
+
+def write_png(path, width, height, strips):
+    """
+    Streamed PNG writer (gray, RGB or RGBA from the channel count). `strips`
+    yields (rows, width, channels) uint8 arrays from top to bottom, so the
+    image never has to be held in memory.
+    """
+    def chunk(tag, data):
+        return (struct.pack(">I", len(data)) + tag + data +
+                struct.pack(">I", zlib.crc32(tag + data) & 0xffffffff))
+
+    compressor = zlib.compressobj(9)
+    previous = None
+    with open(path, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        for strip in strips:
+            rows = strip.reshape(strip.shape[0], -1)
+            if previous is None:
+                channels = rows.shape[1] // width
+                color_type = {1: 0, 3: 2, 4: 6}[channels]
+                f.write(chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, color_type, 0, 0, 0)))
+                previous = np.zeros(rows.shape[1], dtype=np.uint8)
+            # "Up" filter: difference with the row above
+            filtered = np.empty((rows.shape[0], rows.shape[1] + 1), dtype=np.uint8)
+            filtered[:, 0] = 2
+            filtered[:, 1:] = rows - np.vstack([previous, rows[:-1]])
+            previous = rows[-1].copy()
+            data = compressor.compress(filtered.tobytes())
+            if data:
+                f.write(chunk(b"IDAT", data))
+        f.write(chunk(b"IDAT", compressor.flush()))
+        f.write(chunk(b"IEND", b""))
+
+
+def write_webp(path, width, height, strips):
+    """Lossless WebP (the whole image is assembled in memory)."""
+    try:
+        from PIL import Image
+    except ImportError:
+        raise RuntimeError("Pillow is required for the WebP images (pip install Pillow)")
+    if max(width, height) > WEBP_MAX_SIZE:
+        raise ValueError(f"WebP images are limited to {WEBP_MAX_SIZE}px, got {width}x{height}")
+
+    pixels = np.concatenate(list(strips))
+    if pixels.ndim == 3 and pixels.shape[-1] == 1:
+        pixels = pixels[..., 0]
+    Image.fromarray(pixels).save(path, "WEBP", lossless=True, quality=100, method=4, exact=True)
+
+
+def write_image(path, width, height, strips, image_format='png'):
+    (write_webp if image_format == 'webp' else write_png)(path, width, height, strips)
+    return path
+
+
+def layer_path(directory, layer, image_format='png'):
+    return Path(directory) / f"{LAYER_FILES[layer]}.{image_format}"
+
+
+def export_layer(path, store, layer, encoding='sqrt', image_format='png', max_height=None,
+                 max_population=None, strip_rows=STRIP_ROWS):
+    """
+    Write the image of a layer from the bands of the store. Returns its
+    precision on the valid pixels: {"bytes", "max_error", "mean_error"}.
+    """
+    profile = store_profile(store)
+    error = {"max": 0.0, "sum": 0.0, "count": 0}
+
+    def strips():
+        for bands in band_strips(store, LAYER_BANDS[layer], strip_rows):
+            pixels = encode_layer(layer, bands, encoding, max_height, max_population)
+            valid = layer_valid(layer, bands)
+            if valid.any():
+                scale = max_population if layer == "population" else max_height
+                exact = np.clip(bands[LAYER_VALUE[layer]][valid], 0, scale)
+                diff = np.abs(decode_layer(layer, pixels, encoding, max_height, max_population)[valid] - exact)
+                error["max"] = max(error["max"], float(diff.max()))
+                error["sum"] += float(diff.sum())
+                error["count"] += int(valid.sum())
+            yield pixels
+
+    write_image(path, profile["width"], profile["height"], strips(), image_format)
+    return {
+        "bytes": Path(path).stat().st_size,
+        "max_error": error["max"],
+        "mean_error": error["sum"] / error["count"] if error["count"] else 0.0,
+    }
+
+
+def encoding_metadata(encoding, image_format, max_height, max_population=None):
+    """Description of the encoding for flood_metadata.json."""
+    layers = {
+        'sqrt': {
+            "flood": {"hand": "red", "land": "alpha"},
+            "sea": {"elevation": "red", "sea_onset": "green", "land": "alpha"},
+            "population": {"density": "red", "land": "alpha"},
+        },
+        'rg16': {
+            "flood": {"hand": ["red", "green"]},
+            "sea": {"sea_onset": ["red", "green"], "elevation": "blue"},
+            "population": {"density": ["red", "green"]},
+        },
+        'gray': {
+            "flood": {"hand": "gray"},
+            "sea": {"sea_onset": "gray"},
+            "population": {"density": "gray"},
+        },
+    }[encoding]
+    return {
+        "name": encoding,
+        "format": image_format,
+        "scale": {"heights": "sqrt", "population": "linear"},
+        "code_top": CODE_TOP.get(encoding, 255),
+        "nodata": "alpha" if encoding == 'sqrt' else 0,
+        "max_height": max_height,
+        "max_population": max_population,
+        "channels": layers,
+    }
+
+
+def format_size(n_bytes):
+    return f"{n_bytes / 1e6:.2f} MB" if n_bytes >= 1e5 else f"{n_bytes / 1e3:.1f} kB"
+
+
+def print_precision_report(report):
+    """`report`: {(encoding, format): {layer: export_layer result}}."""
+    print("Encoding report (size / decoding error on land):")
+    for (encoding, image_format), layers in report.items():
+        for layer, result in layers.items():
+            unit = "/cell" if layer == "population" else "m"
+            print(f"  {encoding:<5} {image_format:<4} {layer:<10} {format_size(result['bytes']):>10}  "
+                  f"max {result['max_error']:.4f} {unit}, mean {result['mean_error']:.4f} {unit}")
+
+
+def compare_encodings(store, layers, max_height, max_population=None):
+    """Export every encoding and image format to a scratch directory, for the report."""
+    report = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for encoding in ENCODINGS:
+            for image_format in IMAGE_FORMATS:
+                try:
+                    report[(encoding, image_format)] = {
+                        layer: export_layer(layer_path(tmp, layer, image_format), store, layer, encoding,
+                                            image_format, max_height, max_population)
+                        for layer in layers
+                    }
+                except (RuntimeError, ValueError) as e:
+                    print(f"⚠️ Skipping {encoding}/{image_format}: {e}")
+    return report
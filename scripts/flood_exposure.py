@@ -0,0 +1,201 @@
+"""
+Flood exposure lookup tables: population and amenities flooded per water
+level, for the river (HAND) and sea (flood-onset level) modes of the
+simulator, in total and per district.
+
+A pixel is flooded at level L when its HAND (river) or flood-onset level
+(sea) is <= L, so every pixel is binned once by the first level that floods
+it (bin = ceil(value / step)) and the tables are the cumulative sums of the
+bins. The district of a pixel comes from one labeled rasterization (id =
+index in the districts file + 1, 0 off land), the bins of all districts are
+counted by a single bincount on district * (levels + 1) + bin.
+
+Output (public/data/hazards/flood_exposure.json):
+{
+  "levels": {"step": 0.1, "count": 501},      level k = k * step meters
+  "districts": [names],
+  "modes": {
+    "river": {
+      "population": [people flooded at each level],
+      "amenities": {type: [count at each level]},
+      "categories": {group: [count at each level]},    groups of amenities.py
+      "districts": {name: {"population": [...], "amenities": [...]}}
+    },
+    "sea": {...}
+  }
+}
+"""
+
+import json
+import numpy as np
+import geopandas as gpd
+import rasterio
+from pathlib import Path
+from pyproj import Transformer
+
+from amenities import ALL_AMENITY_GROUPS
+
+OSM_DIR = Path(__file__).parent.parent / "geo-maurice-app" / "public" / "data" / "osm"
+
+EXPOSURE_STEP_M = 0.1
+EXPOSURE_MAX_M = 50.0  # range of the simulator slider
+MODES = ('river', 'sea')
+
+EARTH_RADIUS_M = 6378137.0
+METERS_PER_DEGREE = 111139
+
+
+def level_count(step=EXPOSURE_STEP_M, max_level=EXPOSURE_MAX_M):
+    return int(round(max_level / step)) + 1
+
+
+def level_bins(values, step=EXPOSURE_STEP_M, n_levels=None):
+    """Index of the first level flooding each value, n_levels if never."""
+    n_levels = n_levels or level_count(step)
+    bins = np.ceil(np.maximum(values, 0) / step - 1e-6)
+    return np.minimum(np.nan_to_num(bins, nan=n_levels), n_levels).astype(np.int64)
+
+
+def load_districts(path, crs):
+    """(names, [(geometry, district id)]) of the districts file, in `crs`."""
+    gdf = gpd.read_file(path)
+    if gdf.crs != crs:
+        gdf = gdf.to_crs(crs)
+    names = [str(row.get("shapeName") or f"district_{i + 1}") for i, row in enumerate(gdf.to_dict("records"))]
+    return names, [(geom, i + 1) for i, geom in enumerate(gdf.geometry)]
+
+
+def people_per_pixel(population, transform, src_res):
+    """
+    People in each DEM pixel from the resampled population grid (people per
+    source cell). The DEM is Web Mercator and the population grid is in
+    degrees, the ratio of their true cell areas depends on the latitude.
+    """
+    rows = np.arange(population.shape[0]) + 0.5
+    y = transform.f + rows * transform.e
+    lat = np.arctan(np.sinh(y / EARTH_RADIUS_M))
+    pixel_side = abs(transform.a) * np.cos(lat)
+    src_area = abs(src_res[0] * src_res[1]) * METERS_PER_DEGREE ** 2 * np.cos(lat)
+    return population * (pixel_side ** 2 / src_area)[:, None].astype(np.float32)
+
+
+def exposure_histograms(levels, people, districts, n_districts, step=EXPOSURE_STEP_M,
+                        max_level=EXPOSURE_MAX_M):
+    """
+    Per-mode histograms of the people by (district, level bin). `levels`
+    is {mode: level raster}; only the pixels with a district count.
+    Returns {"<mode>_population": (n_districts + 1, n_levels + 1) array}.
+    """
+    n_levels = level_count(step, max_level)
+    size = (n_districts + 1) * (n_levels + 1)
+    active = districts > 0
+    district = districts[active].astype(np.int64) * (n_levels + 1)
+    weights = people[active] if people is not None else np.zeros(int(active.sum()))
+
+    histograms = {}
+    for mode, values in levels.items():
+        index = district + level_bins(values[active], step, n_levels)
+        counts = np.bincount(index, weights=weights, minlength=size)
+        histograms[f"{mode}_population"] = counts.reshape(n_districts + 1, n_levels + 1)
+    return histograms
+
+
+def load_amenity_points(osm_dir=OSM_DIR):
+    """{amenity type: (lon array, lat array)} of the OSM amenity files."""
+    points = {}
+    for path in sorted(Path(osm_dir).glob("*.geojson")):
+        with open(path, "r", encoding="utf-8") as f:
+            coords = [feat["geometry"]["coordinates"][:2] for feat in json.load(f).get("features", [])
+                      if feat.get("geometry") and feat["geometry"].get("type") == "Point"]
+        if coords:
+            lon, lat = np.array(coords, dtype=np.float64).T
+            points[path.stem] = (lon, lat)
+    return points
+
+
+def amenity_histograms(points, rasters, n_districts, step=EXPOSURE_STEP_M, max_level=EXPOSURE_MAX_M):
+    """
+    Per-mode histograms of the amenities by (type, district, level bin),
+    from the rasters {"river", "sea", "districts", "dem": path}; only the
+    amenities on a land pixel (district, above the sea) count.
+    Returns ({"<mode>_amenities": {type: array}}, amenities on land).
+    """
+    n_levels = level_count(step, max_level)
+    histograms = {f"{mode}_amenities": {} for mode in MODES}
+    total = 0
+
+    with rasterio.open(rasters["districts"]) as src:
+        transformer = Transformer.from_crs("EPSG:4326", src.crs, always_xy=True)
+        transform, height, width = src.transform, src.height, src.width
+
+    datasets = {name: rasterio.open(path) for name, path in rasters.items()}
+    try:
+        for amenity, (lon, lat) in points.items():
+            x, y = transformer.transform(lon, lat)
+            rows, cols = rasterio.transform.rowcol(transform, x, y)
+            rows, cols = np.asarray(rows), np.asarray(cols)
+            inside = (rows >= 0) & (rows < height) & (cols >= 0) & (cols < width)
+            coords = list(zip(np.asarray(x)[inside], np.asarray(y)[inside]))
+            if not coords:
+                continue
+
+            values = {name: np.array([v[0] for v in ds.sample(coords)]) for name, ds in datasets.items()}
+            district = values["districts"].astype(np.int64)
+            on_land = (district > 0) & (values["dem"] > 0)
+            total += int(on_land.sum())
+            for mode in MODES:
+                index = district[on_land] * (n_levels + 1) + level_bins(values[mode][on_land], step, n_levels)
+                counts = np.bincount(index, minlength=(n_districts + 1) * (n_levels + 1))
+                histograms[f"{mode}_amenities"][amenity] = counts.reshape(n_districts + 1, n_levels + 1)
+    finally:
+        for ds in datasets.values():
+            ds.close()
+    return histograms, total
+
+
+def cumulative(counts, n_levels):
+    """Cumulative values at every level of a histogram (last bin = never)."""
+    return [int(v) for v in np.rint(np.cumsum(counts)[:n_levels])]
+
+
+def exposure_table(population_hist, amenity_hist, district_names, step=EXPOSURE_STEP_M,
+                   max_level=EXPOSURE_MAX_M, groups=ALL_AMENITY_GROUPS):
+    """
+    JSON-ready exposure table from the histograms, the amenities per type
+    and rolled up per category (`groups`: {category: [types]}).
+    """
+    n_levels = level_count(step, max_level)
+    table = {
+        "levels": {"step": step, "count": n_levels},
+        "districts": district_names,
+        "modes": {},
+    }
+    for mode in MODES:
+        population = population_hist[f"{mode}_population"]
+        amenities = amenity_hist.get(f"{mode}_amenities", {})
+        all_amenities = sum(amenities.values()) if amenities else np.zeros_like(population)
+        table["modes"][mode] = {
+            "population": cumulative(population.sum(axis=0), n_levels),
+            "amenities": {name: cumulative(counts.sum(axis=0), n_levels) for name, counts in amenities.items()},
+            "categories": {
+                group: cumulative(sum((amenities[name].sum(axis=0) for name in types if name in amenities),
+                                      np.zeros(n_levels + 1)), n_levels)
+                for group, types in groups.items()
+            },
+            "districts": {
+                name: {
+                    "population": cumulative(population[i + 1], n_levels),
+                    "amenities": cumulative(all_amenities[i + 1], n_levels),
+                }
+                for i, name in enumerate(district_names)
+            },
+        }
+    return table
+
+
+def save_exposure_table(path, table):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(table, f, separators=(",", ":"))
+    return path
@@ -0,0 +1,168 @@
+"""
+XYZ tile pyramid (Web Mercator, 256 px tiles) of the flood simulator
+rasters, cut from the full-precision bands of the flood store.
+
+Every tile is one windowed read of its bands resampled to 256x256, so below
+the native zoom of the DEM GDAL serves it from the overviews of the store
+instead of the full bands. Each band is resampled as recorded in the store
+(average for the heights, nearest for the district ids). The tiles use the
+same encoding and image format as the full images (flood_encoding.py), and
+the empty ones (open ocean) are not written. The tiles are
+independent and are rendered in a process pool.
+
+Output: <tiles_dir>/<layer>/<z>/<x>/<y>.<png|webp> and a manifest (tiles.json):
+{
+  "tile_size": 256, "minzoom": 9, "maxzoom": 12,
+  "layers": {
+    layer: {"url": "<layer>/{z}/{x}/{y}.png", "tiles": {"<z>": [[x, y], ...]}}
+  },
+  ...extra fields (bounds, encoding, max_height)
+}
+"""
+
+import json
+import math
+import shutil
+import numpy as np
+import rasterio
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from rasterio.enums import Resampling
+from rasterio.windows import Window
+
+from flood_encoding import has_data, write_image
+from raster_store import band_path, load_manifest, store_profile
+
+TILE_PX = 256
+ORIGIN_SHIFT = 20037508.342789244  # half of the Web Mercator world width (m)
+MANIFEST = "tiles.json"
+TILES_PER_TASK = 32
+
+
+def tile_span(zoom):
+    """Width of a tile at `zoom`, in Web Mercator meters."""
+    return 2 * ORIGIN_SHIFT / 2 ** zoom
+
+
+def native_zoom(transform):
+    """Zoom whose tile pixels match the raster pixels."""
+    return int(round(math.log2(tile_span(0) / (TILE_PX * abs(transform.a)))))
+
+
+def zoom_range(profile, min_zoom=None):
+    """(minzoom, maxzoom): down to the zoom where the raster fits in ~one tile."""
+    max_zoom = native_zoom(profile["transform"])
+    if min_zoom is None:
+        size = max(profile["width"], profile["height"])
+        min_zoom = max_zoom - math.ceil(math.log2(max(size / TILE_PX, 1)))
+    return max(0, min(min_zoom, max_zoom)), max_zoom
+
+
+def tiles_covering(profile, zoom):
+    """(x, y) of the tiles intersecting the raster at `zoom`."""
+    left, bottom, right, top = rasterio.transform.array_bounds(
+        profile["height"], profile["width"], profile["transform"])
+    span = tile_span(zoom)
+    last = 2 ** zoom - 1
+    x0, x1 = (int(np.clip((v + ORIGIN_SHIFT) // span, 0, last)) for v in (left, right - 1e-6))
+    y0, y1 = (int(np.clip((ORIGIN_SHIFT - v) // span, 0, last)) for v in (top, bottom + 1e-6))
+    return [(x, y) for y in range(y0, y1 + 1) for x in range(x0, x1 + 1)]
+
+
+def read_tile(src, zoom, x, y, resampling):
+    """Values of a band on the (zoom, x, y) tile, 0 outside the raster."""
+    t = src.transform
+    span = tile_span(zoom)
+    # Tile in (fractional) raster pixels, and raster pixels per tile pixel
+    col0 = (-ORIGIN_SHIFT + x * span - t.c) / t.a
+    row0 = (t.f - (ORIGIN_SHIFT - y * span)) / -t.e
+    ratio = span / TILE_PX / t.a
+
+    tile = np.zeros((TILE_PX, TILE_PX), dtype=src.dtypes[0])
+    c0, c1 = max(col0, 0), min(col0 + TILE_PX * ratio, src.width)
+    r0, r1 = max(row0, 0), min(row0 + TILE_PX * ratio, src.height)
+    ox0, ox1 = (int(round((c - col0) / ratio)) for c in (c0, c1))
+    oy0, oy1 = (int(round((r - row0) / ratio)) for r in (r0, r1))
+    if ox1 <= ox0 or oy1 <= oy0:
+        return tile
+
+    tile[oy0:oy1, ox0:ox1] = src.read(1, window=Window(c0, r0, c1 - c0, r1 - r0),
+                                      out_shape=(oy1 - oy0, ox1 - ox0), resampling=resampling)
+    return tile
+
+
+def render_tile(zoom, x, y, store, layers, tiles_dir, image_format, resampling, datasets):
+    """Write the tiles of every layer at (zoom, x, y). Returns the populated layers."""
+    values = {}
+    populated = []
+    for layer, (bands, encode) in layers.items():
+        for band in bands:
+            if band not in values:
+                if band not in datasets:
+                    datasets[band] = rasterio.open(band_path(store, band))
+                values[band] = read_tile(datasets[band], zoom, x, y, resampling[band])
+        pixels = encode({band: values[band] for band in bands})
+        if not has_data(pixels):
+            continue
+        path = Path(tiles_dir) / layer / str(zoom) / str(x) / f"{y}.{image_format}"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        write_image(path, TILE_PX, TILE_PX, [pixels], image_format)
+        populated.append(layer)
+    return populated
+
+
+def tile_job(store, layers, tiles_dir, image_format='png'):
+    """Arguments of render_tile shared by all the tiles (datasets opened lazily)."""
+    resampling = {band: Resampling[entry.get("resampling", "average")]
+                  for band, entry in load_manifest(store)["bands"].items()}
+    return {"store": store, "layers": layers, "tiles_dir": tiles_dir, "image_format": image_format,
+            "resampling": resampling, "datasets": {}}
+
+
+def _init_worker(job):
+    global _job
+    _job = job
+
+
+def _render_tile(tile):
+    return render_tile(*tile, **_job)
+
+
+def build_tile_pyramid(store, layers, tiles_dir, workers=1, min_zoom=None, image_format='png', extra=None):
+    """
+    Render the pyramid of `layers` ({layer: (bands, encode)}, `encode` maps
+    {band: array} to the tile pixels) from the bands of `store` into
+    `tiles_dir`, replacing a previous pyramid. Returns the manifest.
+    """
+    tiles_dir = Path(tiles_dir)
+    if tiles_dir.exists():
+        shutil.rmtree(tiles_dir)
+    tiles_dir.mkdir(parents=True)
+
+    profile = store_profile(store)
+    min_zoom, max_zoom = zoom_range(profile, min_zoom)
+    tiles = [(z, x, y) for z in range(min_zoom, max_zoom + 1) for x, y in tiles_covering(profile, z)]
+
+    if workers <= 1:
+        job = tile_job(store, layers, tiles_dir, image_format)
+        results = [render_tile(*tile, **job) for tile in tiles]
+        for src in job["datasets"].values():
+            src.close()
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(tile_job(store, layers, tiles_dir, image_format),)) as executor:
+            results = list(executor.map(_render_tile, tiles, chunksize=TILES_PER_TASK))
+
+    manifest = dict(extra or {}, tile_size=TILE_PX, minzoom=min_zoom, maxzoom=max_zoom, layers={})
+    for layer in layers:
+        populated = {}
+        for (z, x, y), done in zip(tiles, results):
+            if layer in done:
+                populated.setdefault(str(z), []).append([x, y])
+        manifest["layers"][layer] = {"url": f"{layer}/{{z}}/{{x}}/{{y}}.{image_format}", "tiles": populated}
+
+    with open(tiles_dir / MANIFEST, "w") as f:
+        json.dump(manifest, f, separators=(",", ":"))
+    written = sum(len(done) for done in results)
+    print(f"✔ Saved {written} tiles (zoom {min_zoom}-{max_zoom}, {len(tiles)} candidates) to {tiles_dir}")
+    return manifest
@@ -1,348 +1,819 @@
+#!/usr/bin/env python3
+"""
+HAND flood model (Height Above Nearest Drainage) and the rasters of the
+client-side flood simulator.
+
+The DEM tiles are merged into the "flood" raster store (raster_store.py,
+data/store/flood/) and processed by blocks. The rivers and the districts
+(land mask) are rasterized once on the whole grid into bands of the store,
+kept across runs while flood.geojson and the districts file are unchanged
+(content hash), and the blocks read their windows. Each block is read with a halo
+of `halo` pixels around it, so the nearest-river search (EDT) and the
+smoothing (Gaussian) see the rivers and terrain beyond the block edges, and
+only the block core is kept. The full-precision results are streamed to
+the bands of the store and the PNGs are exported from them by strips, so
+the peak memory is bounded by the memory budget instead of by the DEM size.
+
+The blocks are independent and are processed in a process pool
+(--workers). The block layout only depends on the budget, the halo and
+--block-size, never on the worker count, so the parallel output is
+bit-identical to the serial one (--verify checks it).
+
+The EDT of a padded window gives the nearest river of the cells that are
+closer to a river than to the window edge. The other cells (far from every
+river, mostly at sea) look their nearest river up in a KD-tree of all the
+river pixels, so the HAND does not depend on the blocks: --verify also
+checks it against a single block over the whole DEM.
+
+A priority-flood from the sea, by tiles fitting in the memory budget
+(tiled_flood.py, exact), gives the flood-onset level of every cell, the sea
+level at which it gets connected to the ocean, stored in the green channel
+of sea_level.png. With --engine flow, one priority-flood pass on the whole
+mosaic (priority_flood.py) gives the HAND along the D8 flow paths of the
+depression-filled DEM, used instead of the nearest-river HAND; the run
+stops when that pass does not fit in the memory of the workers. Both bands
+are cached in the store by the content hash of the DEM tiles.
+
+Outputs in public/data/hazards/:
+- flood_hand.png, sea_level.png: sqrt-encoded heights (red) and land (alpha),
+  flood-onset level in the green channel of sea_level.png, or another
+  encoding / lossless WebP (--encoding, --image-format, flood_encoding.py)
+- flood_population.png: population density aligned on the DEM
+- flood_metadata.json: bounds, size, files, encoding and measured precision
+  of the images
+- tiles/: XYZ pyramid of the flood, sea-level and population rasters, with
+  the list of the populated tiles in tiles/tiles.json (flood_tiles.py)
+- flood_model.geojson: risk zones (legacy vector model), plus one simplified
+  GeoJSON per zoom band and their index flood_model.json (risk_polygons.py)
+- flood_exposure.json: population and amenities flooded per water level,
+  river and sea modes, per district (flood_exposure.py)
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import shutil
+import time
+import numpy as np
 import rasterio
+import geopandas as gpd
+from pathlib import Path
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pyproj import Transformer
+from rasterio.features import rasterize
 from rasterio.merge import merge
-from rasterio.features import rasterize, shapes
 from rasterio.warp import reproject, Resampling
-import geopandas as gpd
-import numpy as np
+from rasterio.windows import Window, transform as window_transform
 from scipy.ndimage import distance_transform_edt, gaussian_filter
-from pathlib import Path
-import json
-from shapely.geometry import shape, mapping
+from scipy.spatial import cKDTree
+from shapely.geometry import box
+
+from content_hash import fingerprint
+from flood_encoding import (ENCODINGS, IMAGE_FORMATS, LAYER_BANDS, compare_encodings, encode_layer,
+                            encoding_metadata, export_layer, layer_path, print_precision_report)
+from flood_exposure import (amenity_histograms, exposure_histograms, exposure_table, load_amenity_points,
+                            load_districts, people_per_pixel, save_exposure_table)
+from flood_tiles import MANIFEST as TILES_MANIFEST, build_tile_pyramid
+from priority_flood import flood_tree, flow_hand
+from risk_polygons import VECTOR_TILE_SIZE, vectorize_risk
+from telemetry import add_telemetry_arguments, record, run_from_args, stage
+from tiled_flood import flood_memory_mb, write_sea_onset_band
+from raster_store import (CATEGORICAL, LAYOUTS, STRIP_ROWS, TILE_SIZE, band_array, band_current, band_path,
+                          band_strips, create_band, create_store, finalize_band, load_manifest, read_band, register_band,
+                          store_path, store_profile, write_band)
+
+BASE_DIR = Path(__file__).parent.parent
+HAZARDS_DIR = BASE_DIR / "geo-maurice-app" / "public" / "data" / "hazards"
+DISTRICTS_FILE = BASE_DIR / "geo-maurice-app" / "public" / "data" / "districts_mauritius.geojson"
+POPULATION_FILE = BASE_DIR / "data" / "population_2020_1km.tif"
+STORE = store_path("flood")
+TILES_DIR_NAME = "tiles"
+
+# We focus on the precision in the 0-820m range (Full Island Coverage)
+MAX_HAND_M = 820.0
+
+# Smoothing of the HAND grid, reduces the "voronoi" abrupt cuts
+SMOOTH_SIGMA = 2
+SMOOTH_RADIUS = int(4.0 * SMOOTH_SIGMA + 0.5)  # gaussian_filter truncate=4
+
+# Risk thresholds (HAND in meters)
+HIGH_RISK_M = 5
+MEDIUM_RISK_M = 15
+
+# Block processing
+DEFAULT_MEMORY_BUDGET_MB = 512  # per worker
+DEFAULT_HALO = 256  # pixels, ~2.4km at zoom 12
+LOOKUP_CHUNK = 1 << 18  # pixels per KD-tree query of the nearest-river lookups
+RIVER_PIXELS_FILE = "river_pixels.npz"  # in the store
+BYTES_PER_PIXEL = 64  # working set of process_hand_block per padded pixel
+
+# HAND engines: Euclidean-nearest river (smoothed), or along the flow paths
+ENGINES = ('edt', 'flow')
+
+RIVER_TYPES = ['LineString', 'MultiLineString', 'Polygon', 'MultiPolygon']
+
+
+def list_dem_files(zoom=None, hazards_dir=HAZARDS_DIR):
+    """DEM tiles of one zoom level (the highest available by default)."""
+    dem_files = sorted(Path(hazards_dir).glob("mauritius_dem_z*_*.tif"))
+    zooms = sorted({int(p.name.split('_')[2][1:]) for p in dem_files})
+    if not zooms:
+        return []
+    zoom = zoom or zooms[-1]
+    return [p for p in dem_files if p.name.startswith(f"mauritius_dem_z{zoom}_")]
+
+
+def merge_dem(dem_files, store=STORE, layout='tiled'):
+    """
+    Merge the DEM tiles into the "dem" band of a store, (re)created on the
+    grid of the mosaic. Returns the grid profile.
+    """
+    store = Path(store)
+    tmp_path = store.parent / f"{store.name}.dem.tmp.tif"
+    tmp_path.parent.mkdir(parents=True, exist_ok=True)
+    dst_kwds = ({"tiled": True, "blockxsize": TILE_SIZE, "blockysize": TILE_SIZE, "compress": "deflate",
+                 "predictor": 3} if layout == 'tiled' else {"tiled": False})
+    merge([str(p) for p in dem_files], dst_path=tmp_path, dst_kwds=dst_kwds)
+    with rasterio.open(tmp_path) as src:
+        profile = src.profile
+        dtype = src.dtypes[0]
+
+    create_store(store, profile)
+    os.replace(tmp_path, band_path(store, "dem"))
+    register_band(store, "dem", dtype=dtype, count=1, layout=layout, description="elevation (m)")
+    finalize_band(store, "dem")
+    return store_profile(store)
+
+
+def load_geometries(path, crs, valid_types=None):
+    """Geometries of a vector file, reprojected to `crs`."""
+    gdf = gpd.read_file(path)
+    if valid_types:
+        gdf = gdf[gdf.geometry.type.isin(valid_types)]
+    if gdf.crs != crs:
+        gdf = gdf.to_crs(crs)
+    return list(gdf.geometry)
+
+
+def rasterize_mask(geometries, out_shape, transform):
+    """1 on the pixels touched by the geometries, 0 elsewhere."""
+    if not geometries:
+        return np.zeros(out_shape, dtype=np.uint8)
+    return rasterize(
+        shapes=geometries,
+        out_shape=out_shape,
+        transform=transform,
+        fill=0,
+        all_touched=True,  # Improved connectivity
+        default_value=1,
+        dtype='uint8'
+    )
+
+
+def rasterize_band(store, band, geometries, inputs, *extra, layout='tiled', description=None):
+    """
+    Rasterize geometries (all touched) into a uint8 band of the store, by
+    strips. The band is registered with the content hash of the `inputs`
+    files, of the grid and of `extra` (selection of the geometries), and is
+    reused as is while they do not change. Returns the band path.
+    """
+    digest = fingerprint(inputs, band, load_manifest(store)["grid"], *extra)
+    if band_current(store, band, digest):
+        print(f"✔ Reusing the cached {band} mask")
+        return band_path(store, band)
+
+    with create_band(store, band, "uint8", layout=layout, description=description) as dst:
+        for row in range(0, dst.height, STRIP_ROWS):
+            window = Window(0, row, dst.width, min(STRIP_ROWS, dst.height - row))
+            dst.write(rasterize_mask(geometries, (window.height, window.width), dst.window_transform(window)),
+                      1, window=window)
+    finalize_band(store, band, CATEGORICAL)
+    register_band(store, band, fingerprint=digest)
+    return band_path(store, band)
+
+
+def block_size_for_budget(memory_budget_mb, halo, height, width):
+    """Core size of the blocks (multiple of TILE_SIZE) fitting in the budget."""
+    side = int(math.sqrt(memory_budget_mb * 1024 * 1024 / BYTES_PER_PIXEL))
+    if side >= max(height, width):
+        return max(height, width)
+    core = (side - 2 * halo) // TILE_SIZE * TILE_SIZE
+    if core < TILE_SIZE:
+        print(f"⚠️ Memory budget too small for a {halo}px halo, using {TILE_SIZE}px blocks")
+        core = TILE_SIZE
+    return core
+
+
+def plan_blocks(height, width, block_size):
+    """Core windows covering the raster, row by row."""
+    return [
+        Window(col, row, min(block_size, width - col), min(block_size, height - row))
+        for row in range(0, height, block_size)
+        for col in range(0, width, block_size)
+    ]
+
+
+def padded_window(core, halo, height, width):
+    """Core window grown by the halo (clipped to the raster)."""
+    row0 = max(0, core.row_off - halo)
+    col0 = max(0, core.col_off - halo)
+    row1 = min(height, core.row_off + core.height + halo)
+    col1 = min(width, core.col_off + core.width + halo)
+    return Window(col0, row0, col1 - col0, row1 - row0)
+
+
+def nearest_river_elevation(dem, river_mask):
+    """Elevation of the nearest river pixel of every pixel, and its distance in pixels."""
+    # Invert mask: 0 is target (river), 1 is background for EDT
+    distances, indices = distance_transform_edt(1 - river_mask, return_indices=True)
+    return dem[indices[0], indices[1]], distances
+
+
+def hand_from_base(dem, base, sigma=SMOOTH_SIGMA):
+    """Elevation above the nearest river (`base`), negative values (local depressions) set to 0, then smoothed."""
+    hand = dem - base
+    hand[hand < 0] = 0
+    return gaussian_filter(hand, sigma=sigma)
+
+
+def hand_from_dem(dem, river_mask, sigma=SMOOTH_SIGMA):
+    """
+    HAND of every pixel: elevation above the nearest river pixel, negative
+    values (local depressions) set to 0, then smoothed.
+    Returns (hand, distance to the nearest river in pixels).
+    """
+    base, distances = nearest_river_elevation(dem, river_mask)
+    return hand_from_base(dem, base, sigma), distances
+
+
+def save_river_pixels(store):
+    """
+    Rows, columns and elevations of all the river pixels of the store, for
+    the nearest-river lookups of the blocks. Returns (file path, count).
+    """
+    rows, cols, elevations = [], [], []
+    offset = 0
+    for strip in band_strips(store, ["rivers", "dem"]):
+        r, c = np.nonzero(strip["rivers"])
+        rows.append(r + offset)
+        cols.append(c)
+        elevations.append(strip["dem"][r, c])
+        offset += strip["rivers"].shape[0]
+    rows, cols, elevations = np.concatenate(rows), np.concatenate(cols), np.concatenate(elevations)
+    # By column then row: the order in which the EDT breaks the ties
+    order = np.lexsort((rows, cols))
+    path = Path(store) / RIVER_PIXELS_FILE
+    np.savez(path, rows=rows[order], cols=cols[order], dem=elevations[order])
+    return path, len(rows)
+
+
+_river_tree = None
+
+
+def lookup_nearest_river(path, rows, cols):
+    """
+    Elevation of the nearest river pixel of raster pixels, over the whole
+    raster (KD-tree). Among equidistant rivers, the lowest column then row
+    is kept, like distance_transform_edt, so a lookup gives the same HAND
+    as the EDT of a single block.
+    """
+    global _river_tree
+    if _river_tree is None or _river_tree[0] != path:
+        pixels = np.load(path)
+        _river_tree = (path, cKDTree(np.column_stack([pixels["rows"], pixels["cols"]])), pixels["dem"])
+    _, tree, elevations = _river_tree
+
+    base = np.empty(len(rows), dtype=elevations.dtype)
+    for start in range(0, len(rows), LOOKUP_CHUNK):
+        points = np.column_stack([rows[start:start + LOOKUP_CHUNK], cols[start:start + LOOKUP_CHUNK]])
+        nearest = np.empty(len(points), dtype=np.int64)
+        pending, k = np.arange(len(points)), 4
+        while len(pending):
+            distances, indices = tree.query(points[pending], k=k)
+            tied = distances == distances[:, :1]
+            # Rivers are sorted by column then row: the lowest tied index
+            nearest[pending] = np.where(tied, indices, tree.n).min(axis=1)
+            # All k neighbours tied: there may be more, query again with more
+            pending = pending[tied[:, -1] & (k < tree.n)]
+            k *= 4
+        base[start:start + len(points)] = elevations[nearest]
+    return base
+
+
+def window_clearance(window, height, width):
+    """
+    Distance of the pixels of a window to the nearest pixel outside it,
+    in pixels (inf towards the raster edges).
+    """
+    rows = np.arange(window.height, dtype=np.float64)[:, None]
+    cols = np.arange(window.width, dtype=np.float64)[None, :]
+    clearance = np.full((window.height, window.width), np.inf)
+    if window.row_off > 0:
+        clearance = np.minimum(clearance, rows + 1)
+    if window.row_off + window.height < height:
+        clearance = np.minimum(clearance, window.height - rows)
+    if window.col_off > 0:
+        clearance = np.minimum(clearance, cols + 1)
+    if window.col_off + window.width < width:
+        clearance = np.minimum(clearance, window.width - cols)
+    return clearance
+
+
+def compute_flood_tree_rasters(store, dem_files, memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB, workers=1,
+                               with_hand=False, layout='tiled'):
+    """
+    Priority-flood from the sea. Writes the bands:
+    - ocean and sea_onset: sea level at which each cell gets connected to
+      the sea (its filled elevation), inland depressions stay dry until
+      they spill. Flooded by tiles fitting in the memory budget
+      (tiled_flood.py)
+    - hand_flow (with_hand): HAND along the D8 flow paths to the rivers
+      of the "rivers" band. The flow paths need the flood tree of the whole
+      mosaic in one pass, which must fit in the memory of the workers
+      (budget x workers, the pool is idle meanwhile)
+    The bands are kept across runs while the DEM tiles (and the rivers)
+    are unchanged (content hash).
+    Returns {"onset": path, "hand": path}, None when hand_flow does not fit.
+    """
+    grid = load_manifest(store)["grid"]
+    onset_digest = fingerprint(dem_files, "sea_onset", grid)
+    if band_current(store, "sea_onset", onset_digest) and band_current(store, "ocean", onset_digest):
+        print("✔ Reusing the cached sea onset band")
+    else:
+        write_sea_onset_band(store, memory_budget_mb, workers, layout)
+        register_band(store, "ocean", fingerprint=onset_digest)
+        register_band(store, "sea_onset", fingerprint=onset_digest)
+    paths = {"onset": band_path(store, "sea_onset")}
+
+    if with_hand:
+        rivers_digest = load_manifest(store)["bands"]["rivers"]["fingerprint"]
+        hand_digest = fingerprint(dem_files, "hand_flow", grid, rivers_digest)
+        needed_mb = flood_memory_mb(grid["height"] * grid["width"])
+        if band_current(store, "hand_flow", hand_digest):
+            print("✔ Reusing the cached flow HAND band")
+        elif needed_mb > memory_budget_mb * workers:
+            print(f"❌ The flow engine needs ~{needed_mb:.0f} MB for the {grid['width']}x{grid['height']} DEM "
+                  f"(budget {memory_budget_mb} MB x {workers} workers). "
+                  f"Raise --memory-budget or use --engine edt.")
+            return None
+        else:
+            dem = band_array(store, "dem")
+            tree = flood_tree(dem, band_array(store, "ocean") > 0)
+            hand = flow_hand(tree, dem, band_array(store, "rivers"))
+            del tree
+            write_band(store, "hand_flow", hand, layout, description="HAND along the flow paths (m)")
+            register_band(store, "hand_flow", fingerprint=hand_digest)
+        paths["hand"] = band_path(store, "hand_flow")
+    return {name: str(path) for name, path in paths.items()}
+
+
+def classify_risk(hand, dem, land):
+    """Risk code per pixel: 2 high, 1 medium, 0 none (or ocean / off land)."""
+    risk = np.zeros(hand.shape, dtype=np.uint8)
+    risk[(hand > 0) & (hand <= HIGH_RISK_M)] = 2
+    risk[(hand > HIGH_RISK_M) & (hand <= MEDIUM_RISK_M)] = 1
+    risk[dem <= 0] = 0
+    risk[land == 0] = 0
+    return risk
+
+
+def process_hand_block(core, context):
+    """
+    HAND, risk, districts, population and exposure histograms of one core
+    window.
+    `context` holds the store (dem, rivers, districts, sea_onset and, for
+    the flow engine, the precomputed hand_flow bands, memory mapped with the
+    'mmap' layout), the river pixels file, the halo and the population file.
+    """
+    store = context["store"]
+    profile = store_profile(store)
+    height, width = profile["height"], profile["width"]
+    # A precomputed HAND needs no halo
+    halo = 0 if context.get("hand") else context["halo"]
+    padded = padded_window(core, halo, height, width)
+    dem = read_band(store, "dem", padded)
+    core_transform = window_transform(core, profile["transform"])
+    crs = profile["crs"]
+
+    inner = (slice(core.row_off - padded.row_off, core.row_off - padded.row_off + core.height),
+             slice(core.col_off - padded.col_off, core.col_off - padded.col_off + core.width))
+
+    river_mask = read_band(store, "rivers", padded)
+    lookups = 0
+    if context.get("hand"):
+        hand = read_band(store, "hand_flow", core)
+    else:
+        if river_mask.any():
+            base, distances = nearest_river_elevation(dem, river_mask)
+        else:
+            base, distances = np.zeros_like(dem), np.full(dem.shape, np.inf)
+
+        # The smoothing carries the pixels up to SMOOTH_RADIUS around the core.
+        # Their nearest river is the one of the window when it is closer than
+        # the window edge (any river outside is at least that far), the other
+        # ones look it up over the whole raster
+        reach = padded_window(core, SMOOTH_RADIUS, height, width)
+        reach_slices = (slice(reach.row_off - padded.row_off, reach.row_off - padded.row_off + reach.height),
+                        slice(reach.col_off - padded.col_off, reach.col_off - padded.col_off + reach.width))
+        unsure = distances[reach_slices] >= window_clearance(padded, height, width)[reach_slices]
+        del distances
+        rows, cols = np.nonzero(unsure)
+        if len(rows):
+            base[reach_slices][unsure] = lookup_nearest_river(context["river_pixels"], rows + reach.row_off,
+                                                              cols + reach.col_off)
+        lookups = len(rows)
+        hand = hand_from_base(dem, base)[inner]
+
+    dem = dem[inner]
+    onset = read_band(store, "sea_onset", core)
+    # District id of every pixel (0 off land), the districts are the land mask
+    districts = read_band(store, "districts", core)
+    land = districts > 0
+
+    population = people = None
+    if context["population"]:
+        with rasterio.open(context["population"]) as src_pop:
+            # Reproject the population data (LatLon) on the DEM grid (Mercator)
+            population = np.zeros(dem.shape, dtype=np.float32)
+            reproject(
+                source=rasterio.band(src_pop, 1),
+                destination=population,
+                src_transform=src_pop.transform,
+                src_crs=src_pop.crs,
+                dst_transform=core_transform,
+                dst_crs=crs,
+                resampling=Resampling.bilinear
+            )
+            people = people_per_pixel(np.maximum(population, 0), core_transform, src_pop.res)
+
+    finite = np.isfinite(dem)
+    return {
+        "window": core,
+        "hand": hand.astype(np.float32),
+        "risk": classify_risk(hand, dem, land),
+        "districts": districts,
+        "population": population,
+        "stats": {
+            "river_pixels": int(river_mask[inner].sum()),
+            "nearest_lookups": lookups,
+            "dem_min": float(dem[finite].min()) if finite.any() else math.inf,
+            "dem_max": float(dem[finite].max()) if finite.any() else -math.inf,
+            "dem_sum": float(dem[finite].sum(dtype=np.float64)),
+            "dem_count": int(finite.sum()),
+            "below_50": int(np.sum((dem > 0) & (dem < 50))),
+            "land": int(np.count_nonzero(land)),
+            "max_population": float(np.nanmax(population)) if population is not None else 0.0,
+            **exposure_histograms({"river": hand, "sea": onset}, people, np.where(dem > 0, districts, 0),
+                                  context["n_districts"]),
+        },
+    }
+
+
+def merge_stats(total, stats):
+    for key, value in stats.items():
+        if key == "dem_min":
+            total[key] = min(total.get(key, math.inf), value)
+        elif key in ("dem_max", "max_population"):
+            total[key] = max(total.get(key, -math.inf), value)
+        else:
+            total[key] = total.get(key, 0) + value
+    return total
+
+
+_context = None
+
+
+def _init_worker(context):
+    global _context
+    _context = context
+
+
+def _process_block(core):
+    return process_hand_block(core, _context)
+
+
+def run_blocks(blocks, context, workers=1):
+    """
+    Block results, in completion order. With several workers the blocks are
+    processed in a process pool; every block only depends on its own
+    padded window, so the results do not depend on the worker count.
+    """
+    if workers <= 1 or len(blocks) == 1:
+        for core in blocks:
+            yield process_hand_block(core, context)
+        return
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(blocks)), initializer=_init_worker,
+                             initargs=(context,)) as executor:
+        futures = [executor.submit(_process_block, core) for core in blocks]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+# Bands written by the blocks: dtype, overview resampling
+BLOCK_BANDS = {
+    "hand": ("float32", "average", "HAND (m)"),
+    "risk": ("uint8", CATEGORICAL, "risk code: 2 high, 1 medium"),
+    "population": ("float32", "average", "population density"),
+}
+
 
-def generate_hand_model():
+def compute_blocks(context, blocks, store, workers=1, layout='tiled'):
+    """
+    Process the blocks and stitch their cores into the bands of the store.
+    Returns ({band: path}, merged stats).
+    """
+    names = [name for name in BLOCK_BANDS if name != "population" or context["population"]]
+    outputs = {
+        name: create_band(store, name, BLOCK_BANDS[name][0], layout=layout, description=BLOCK_BANDS[name][2])
+        for name in names
+    }
+    stats = {}
+    try:
+        for i, result in enumerate(run_blocks(blocks, context, workers), 1):
+            for name, dst in outputs.items():
+                dst.write(result[name], 1, window=result["window"])
+            merge_stats(stats, result["stats"])
+            print(f"  Block {i}/{len(blocks)} done")
+    finally:
+        for dst in outputs.values():
+            dst.close()
+
+    for name in names:
+        finalize_band(store, name, BLOCK_BANDS[name][1])
+    return {name: band_path(store, name) for name in names}, stats
+
+
+def verify_blocks(context, blocks, paths, store, profile, name, layout='tiled'):
+    """Process the blocks serially in a scratch store, raise if an output differs from `paths`."""
+    scratch = store.parent / f"{store.name}_{name}"
+    create_store(scratch, profile)
+    reference, _ = compute_blocks(context, blocks, scratch, workers=1, layout=layout)
+    for band, path in paths.items():
+        same = raster_digest(path) == raster_digest(reference[band])
+        print(f"  {band}: {'identical' if same else 'DIFFERENT'}")
+        if not same:
+            raise RuntimeError(f"Output {band} differs from the {name} run")
+    shutil.rmtree(scratch)
+
+
+def raster_digest(path, strip_rows=STRIP_ROWS):
+    """SHA-256 of the pixel values of a raster (not of the file bytes)."""
+    digest = hashlib.sha256()
+    with rasterio.open(path) as src:
+        for row in range(0, src.height, strip_rows):
+            window = Window(0, row, src.width, min(strip_rows, src.height - row))
+            digest.update(src.read(window=window).tobytes())
+    return digest.hexdigest()
+
+
+def wgs84_bounds(transform, width, height, crs):
+    """[[min_lat, min_lon], [max_lat, max_lon]] of the raster."""
+    bounds = rasterio.transform.array_bounds(height, width, transform)
+    transformer = Transformer.from_crs(crs, "EPSG:4326", always_xy=True)
+    min_lon, min_lat = transformer.transform(bounds[0], bounds[1])
+    max_lon, max_lat = transformer.transform(bounds[2], bounds[3])
+    return [[min_lat, min_lon], [max_lat, max_lon]]
+
+
+def generate_hand_model(memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB, halo=DEFAULT_HALO, zoom=None,
+                        workers=None, block_size=None, verify=False, engine='edt',
+                        layout='tiled', tile_min_zoom=None, encoding='sqrt', image_format='png',
+                        compare=False, vector_tile_size=VECTOR_TILE_SIZE, hazards_dir=HAZARDS_DIR, store=STORE):
+    if halo < SMOOTH_RADIUS:
+        # The smoothing of the core edges needs SMOOTH_RADIUS pixels of context
+        raise ValueError(f"halo must be at least {SMOOTH_RADIUS}px (smoothing radius), got {halo}px")
     print("Generating HAND Flood Model...")
-    
-    # Paths
-    base_dir = Path(__file__).parent.parent
-    hazards_dir = base_dir / "geo-maurice-app" / "public" / "data" / "hazards"
-    dem_files = list(hazards_dir.glob("mauritius_dem_z*_*.tif"))
+    t0 = time.time()
+
+    hazards_dir, store = Path(hazards_dir), Path(store)
+    workers = workers or os.cpu_count()
+    dem_files = list_dem_files(zoom, hazards_dir)
     river_file = hazards_dir / "flood.geojson"
-    output_file = hazards_dir / "flood_model.geojson"
 
     if not dem_files:
         print("❌ No DEM files found. Run fetch_dem.py first.")
         return
-    
+
     if not river_file.exists():
         print("❌ No river data found. Run fetch_hazards.py first.")
         return
 
-    # 1. Merge DEM Tiles
+    # 1. Merge DEM Tiles (into the store)
     print(f"Merging {len(dem_files)} DEM tiles...")
-    src_files_to_mosaic = []        
-    for fp in dem_files:
-        src = rasterio.open(fp)
-        src_files_to_mosaic.append(src)
-    
-    mosaic, out_trans = merge(src_files_to_mosaic)
-    out_meta = src.meta.copy()
-    out_meta.update({
-        "driver": "GTiff",
-        "height": mosaic.shape[1],
-        "width": mosaic.shape[2],
-        "transform": out_trans,
-        "crs": src.crs
-    })
-
-    # Elevation Grid (handle nodata)
-    dem_grid = mosaic[0]
-    # Replace weird negative values or nodata with high value or NaN
-    # dem_grid[dem_grid < -100] = 9999 
-
-    # 2. Rasterize Rivers
-    print("Rasterizing rivers...")
-    rivers_gdf = gpd.read_file(river_file)
-    
-    # Filter rivers (LineString) and wetlands (Polygon)
-    # Convert all to a common format or just use is_valid check
-    valid_types = ['LineString', 'MultiLineString', 'Polygon', 'MultiPolygon']
-    rivers_gdf = rivers_gdf[rivers_gdf.geometry.type.isin(valid_types)]
-    
-    if rivers_gdf.empty:
+    with stage("merge_dem") as span:
+        profile = merge_dem(dem_files, store, layout)
+        mosaic_path = band_path(store, "dem")
+        height, width, crs = profile["height"], profile["width"], profile["crs"]
+        record(span, tiles=dem_files, pixels=height * width, dem_bytes=mosaic_path)
+
+    # 2. Rivers (LineString) and wetlands (Polygon), land mask from the districts
+    with stage("load_vectors") as span:
+        rivers = load_geometries(river_file, crs, RIVER_TYPES)
+        districts, district_names = None, ["all"]
+        if rivers and DISTRICTS_FILE.exists():
+            district_names, districts = load_districts(DISTRICTS_FILE, crs)
+        record(span, rivers=rivers, districts=district_names)
+    if not rivers:
         print("No river lines found.")
         return
+    if districts is None:
+        print("⚠️ District file not found, skipping land mask.")
+        # The whole grid is one district
+        districts = [(box(*rasterio.transform.array_bounds(height, width, profile["transform"])), 1)]
 
-    print(f"DEM CRS: {src.crs}, Rivers CRS: {rivers_gdf.crs}")
-    if rivers_gdf.crs != src.crs:
-        print("Re-projecting rivers to match DEM...")
-        rivers_gdf = rivers_gdf.to_crs(src.crs)
-
-    # Use 1 for river pixels, 0 for others
-    river_mask = rasterize(
-        shapes=rivers_gdf.geometry,
-        out_shape=dem_grid.shape,
-        transform=out_trans,
-        fill=0,
-        all_touched=True, # Improved connectivity
-        default_value=1
-    )
-    
-    print(f"River Mask Sum: {river_mask.sum()} pixels")
-    if river_mask.sum() == 0:
+    # River and land masks, rasterized once and cached in the store across runs
+    with stage("masks"):
+        rasterize_band(store, "rivers", rivers, [river_file], RIVER_TYPES, layout=layout,
+                       description="river pixels")
+        district_band = rasterize_band(store, "districts", districts, [DISTRICTS_FILE], layout=layout,
+                                       description="district id, 0 off land")
+        river_pixels, river_count = save_river_pixels(store)
+    if river_count == 0:
         print("❌ Rasterization failed. Rivers might be outside DEM bounds.")
-        print(f"DEM Bounds: {src.bounds}")
-        print(f"River Bounds: {rivers_gdf.total_bounds}")
         return
 
-    # 3. Compute Nearest River Elevation (Allocation)
-    
-    print("Computing distance transform...")
-    # Invert mask: 0 is target (river), 1 is background for EDT
-    # exact_edt computes distance to nearest zero
-    indices = distance_transform_edt(1 - river_mask, return_distances=False, return_indices=True)
-    
-    nearest_y = indices[0]
-    nearest_x = indices[1]
-    
-    # Fetch elevation of the nearest river pixel
-    reference_elevation = dem_grid[nearest_y, nearest_x]
-    
-    # 4. Compute HAND
-    print("Calculating relative height (HAND)...")
-    hand_grid = dem_grid - reference_elevation
-    
-    # Filter invalid: negative HAND (local depressions) -> 0
-    hand_grid[hand_grid < 0] = 0
-    
-    # SMOOTHING to reduce "voronoi" abrupt cuts
-    print("Smoothing terrain analysis (Sigma=2)...")
-    hand_grid = gaussian_filter(hand_grid, sigma=2)
-    
-    # 5. Thresholding
-    print("Creating risk zones...")
-    
-    risk_grid = np.zeros_like(hand_grid, dtype=np.uint8)
-    
-    # Using 10m and 20m as conservative thresholds for plain simulation
-    risk_grid[(hand_grid > 0) & (hand_grid <= 5)] = 2 # High
-    risk_grid[(hand_grid > 5) & (hand_grid <= 15)] = 1 # Medium (Warning)
-    
-    # Mask out ocean/nodata (crucial fix for artifacts)
-    # 1. Basic Elevation Filter
-    print("Masking by Elevation <= 0m...")
-    risk_grid[dem_grid <= 0] = 0
-    
-    # 2. Strict Land Mask using District Boundaries
-    land_file = base_dir / "geo-maurice-app" / "public" / "data" / "districts_mauritius.geojson"
-    if land_file.exists():
-        print("Applying Land Mask from districts...")
-        land_gdf = gpd.read_file(land_file)
-        if land_gdf.crs != src.crs:
-            land_gdf = land_gdf.to_crs(src.crs)
-            
-        land_mask = rasterize(
-            shapes=land_gdf.geometry,
-            out_shape=dem_grid.shape,
-            transform=out_trans,
-            fill=0,
-            default_value=1,
-            all_touched=True
-        )
-        # Clear risk pixels that are not on land
-        risk_grid[land_mask == 0] = 0
-        print(f"Land Mask applied. Active pixels: {land_mask.sum()}")
-    else:
-        print("⚠️ District file not found, skipping land mask.")
+    if not POPULATION_FILE.exists():
+        print("⚠️ Population file not found, skipping population raster.")
+
+    context = {
+        "store": str(store),
+        "n_districts": len(district_names),
+        "halo": halo,
+        "population": str(POPULATION_FILE) if POPULATION_FILE.exists() else None,
+        "river_pixels": str(river_pixels),
+    }
+
+    # Sea connectivity (and the flow engine HAND) from one priority-flood
+    print("Flooding from the sea (priority-flood)...")
+    t_flood = time.time()
+    with stage("priority_flood") as span:
+        flood_rasters = compute_flood_tree_rasters(store, dem_files, memory_budget_mb, workers,
+                                                   with_hand=engine == 'flow', layout=layout)
+        record(span, pixels=height * width)
+    if flood_rasters is None:
+        return
+    context.update(flood_rasters)
+    print(f"Priority-flood done in {time.time() - t_flood:.1f}s")
+
+    # 3. HAND by blocks, streamed to the bands of the store
+    block_size = block_size or block_size_for_budget(memory_budget_mb, halo, height, width)
+    blocks = plan_blocks(height, width, block_size)
+    print(f"Processing {width}x{height} DEM in {len(blocks)} blocks of {block_size}px "
+          f"(halo {halo}px, budget {memory_budget_mb} MB per worker, {workers} workers)...")
+
+    t_blocks = time.time()
+    with stage("hand_blocks") as span:
+        paths, stats = compute_blocks(context, blocks, store, workers, layout)
+        record(span, blocks=blocks, block_size=block_size, workers=workers, land_pixels=stats["land"])
+    print(f"Blocks done in {time.time() - t_blocks:.1f}s")
+
+    if verify:
+        with stage("verify"):
+            print("Verifying against the serial path...")
+            verify_blocks(context, blocks, paths, store, profile, "serial", layout=layout)
+            print("Verifying against a single block over the whole DEM...")
+            verify_blocks(context, plan_blocks(height, width, max(height, width)), paths, store, profile,
+                          "single", layout=layout)
+
+    print(f"River Mask Sum: {stats['river_pixels']} pixels")
+    if stats["nearest_lookups"]:
+        print(f"{stats['nearest_lookups']} pixels with no river closer than the halo edge, "
+              f"nearest river looked up over the whole raster")
+    print(f"Land Mask applied. Active pixels: {stats['land']}")
+
+    # Absolute DEM for the "Sea Level Rise" simulation
+    mean = stats["dem_sum"] / stats["dem_count"] if stats["dem_count"] else math.nan
+    print(f"[DEBUG] DEM Stats: Min={stats['dem_min']:.2f}, Max={stats['dem_max']:.2f}, Mean={mean:.2f}")
+    if stats["land"]:
+        print(f"[DEBUG] Land Pixels < 50m: {stats['below_50']} / {stats['land']} "
+              f"({stats['below_50'] / stats['land'] * 100:.1f}%)")
+
+    # Population aligned on the DEM, transparent where empty
+    max_pop = 0
+    if context["population"]:
+        max_pop = stats["max_population"]
+        print(f"Max Population Density (reprojected): {max_pop}")
+        if max_pop <= 0:
+            print("⚠️ Population grid is empty after reprojection.")
+    layers = ["flood", "sea"] + (["population"] if max_pop > 0 else [])
+
+    # 4. Rasters for the client-side simulation, exported from the store
+    hazards_dir.mkdir(parents=True, exist_ok=True)
+    files, precision = {}, {}
+    with stage("export_rasters") as span:
+        for layer in layers:
+            path = layer_path(hazards_dir, layer, image_format)
+            precision[layer] = export_layer(path, store, layer, encoding, image_format, MAX_HAND_M, max_pop)
+            files[layer] = path.name
+            print(f"✔ Saved {layer} raster to {path}")
+        record(span, **{f"{layer}_bytes": result["bytes"] for layer, result in precision.items()})
+
+    report = {(encoding, image_format): precision}
+    if compare:
+        with stage("compare_encodings"):
+            report.update(compare_encodings(store, layers, MAX_HAND_M, max_pop))
+    print_precision_report(report)
 
-    # 6. Generate Raster Output for Client-Side Simulation
-    print("Generating Raster Map for Dynamic Simulation...")
-    
-    # Normalize HAND grid to 0-255 for PNG export
-    # We focus on the precision in the 0-820m range (Full Island Coverage)
-    # PRECISION FIX: Use Square Root encoding to favor low altitudes.
-    # Val = 255 * sqrt(h / 820)
-    MAX_HAND_M = 820.0
-    
-    # Copy grid
-    raster_grid = hand_grid.copy()
-    
-    height, width = raster_grid.shape
-    rgba = np.zeros((height, width, 4), dtype=np.uint8)
-    
-    # SQRT Scaling
-    # Avoid div by zero
-    safe_grid = raster_grid.copy()
-    safe_grid[safe_grid < 0] = 0
-    safe_grid[safe_grid > MAX_HAND_M] = MAX_HAND_M # Clamp
-    
-    scaled = np.sqrt(safe_grid / MAX_HAND_M) * 255.0
-    
-    # Assign to Red Channel
-    rgba[..., 0] = scaled.astype(np.uint8) 
-    rgba[..., 1] = 0
-    rgba[..., 2] = 0
-    
-    # Alpha Channel setup
-    alpha = np.ones_like(raster_grid, dtype=np.uint8) * 255
-    alpha[dem_grid <= 0] = 0 # Ocean
-    
-    try:
-        land_file = base_dir / "geo-maurice-app" / "public" / "data" / "districts_mauritius.geojson"
-        if land_file.exists():
-            land_gdf = gpd.read_file(land_file)
-            if land_gdf.crs != src.crs:
-                land_gdf = land_gdf.to_crs(src.crs)
-            
-            land_mask_raster = rasterize(
-                shapes=land_gdf.geometry,
-                out_shape=dem_grid.shape,
-                transform=out_trans,
-                fill=0,
-                default_value=1,
-                all_touched=True
-            )
-            alpha[land_mask_raster == 0] = 0
-    except Exception as e:
-        print(f"Warning: Could not apply land mask to raster: {e}")
-        
-    rgba[..., 3] = alpha
-
-    from PIL import Image
-    img = Image.fromarray(rgba, 'RGBA')
-    png_path = hazards_dir / "flood_hand.png"
-    img.save(png_path, optimize=True)
-    print(f"✔ Saved HAND Raster to {png_path}")
-    
-    # Metadata update
-    bounds = rasterio.transform.array_bounds(height, width, out_trans)
-    from pyproj import Transformer
-    transformer = Transformer.from_crs(src.crs, "EPSG:4326", always_xy=True)
-    min_lon, min_lat = transformer.transform(bounds[0], bounds[1])
-    max_lon, max_lat = transformer.transform(bounds[2], bounds[3])
-    
     metadata = {
-        "bounds": [[min_lat, min_lon], [max_lat, max_lon]], 
+        "bounds": wgs84_bounds(profile["transform"], width, height, crs),
         "max_height": MAX_HAND_M,
         "width": width,
         "height": height,
-        "encoding": "sqrt" 
+        "encoding": encoding,
+        "image_format": image_format,
+        "files": files,
+        # Channels and scales of every layer (flood_encoding.py)
+        "codec": encoding_metadata(encoding, image_format, MAX_HAND_M, max_pop or None),
+        "precision": {layer: {key: round(value, 6) for key, value in result.items()}
+                      for layer, result in precision.items()},
+        # XYZ pyramid of the same rasters, manifest relative to this file
+        "tiles": f"{TILES_DIR_NAME}/{TILES_MANIFEST}"
     }
-    
+    if encoding == 'sqrt':
+        # sea_level.png: elevation in red, flood-onset sea level in green
+        metadata["sea_onset"] = "green"
     meta_path = hazards_dir / "flood_metadata.json"
     with open(meta_path, 'w') as f:
         json.dump(metadata, f, indent=2)
     print(f"✔ Saved Metadata to {meta_path}")
 
-    # 7. Generate Absolute DEM Raster for "Sea Level Rise" Simulation
-    print("Generating Sea Level Rise Map (Absolute Elevation)...")
-    
-    dem_raster = dem_grid.copy()
-    
-    rgba_sl = np.zeros((height, width, 4), dtype=np.uint8)
-    
-    # DEBUG: DEM Stats
-    print(f"[DEBUG] DEM Stats: Min={np.nanmin(dem_raster):.2f}, Max={np.nanmax(dem_raster):.2f}, Mean={np.nanmean(dem_raster):.2f}")
-    # Count land pixels below 50m
-    pixels_below_50 = np.sum((dem_raster > 0) & (dem_raster < 50))
-    total_land = np.count_nonzero(land_mask_raster)
-    print(f"[DEBUG] Land Pixels < 50m: {pixels_below_50} / {total_land} ({pixels_below_50/total_land*100:.1f}%)")
-
-    # SQRT Scaling for Sea Level
-    dem_safe = dem_raster.copy()
-    dem_safe[dem_safe < 0] = 0
-    dem_safe[dem_safe > MAX_HAND_M] = MAX_HAND_M
-    
-    scaled_sl = np.sqrt(dem_safe / MAX_HAND_M) * 255.0
-    
-    rgba_sl[..., 0] = scaled_sl.astype(np.uint8)
-    rgba_sl[..., 1] = 0
-    rgba_sl[..., 2] = 0
-    
-    alpha_sl = np.ones_like(dem_raster, dtype=np.uint8) * 255
-    alpha_sl[dem_raster <= 0] = 0
-    
-    # Apply District Mask
-    alpha_sl[land_mask_raster == 0] = 0
-    
-    rgba_sl[..., 3] = alpha_sl
-
-    img_sl = Image.fromarray(rgba_sl, 'RGBA')
-    sl_path = hazards_dir / "sea_level.png"
-    img_sl.save(sl_path, optimize=True)
-    print(f"✔ Saved Sea Level Raster to {sl_path}")
-
-    # (Optional) Still save vector for legacy/comparison if needed
-    # ... code below vectorizes ...
+    # 5. Legacy vector model
     print("Vectorizing result (keeping legacy Poly support)...")
-    results = (
-        {'properties': {'risk_code': v}, 'geometry': s}
-        for i, (s, v) 
-        in enumerate(shapes(risk_grid, mask=risk_grid > 0, transform=out_trans))
-    )
-    
-    features = []
-    for geom_item in results:
-        code = geom_item['properties']['risk_code']
-        risk_level = "High" if code == 2 else "Medium"
-        
-        features.append({
-            "type": "Feature",
-            "properties": {
-                "risk_level": risk_level,
-                "type": "risk_zone"
-            },
-            "geometry": geom_item['geometry']
-        })
-        
-    # Create GeoDataFrame from features to handle projection easily
-    if features:
-        temp_gdf = gpd.GeoDataFrame.from_features(features)
-        temp_gdf.set_crs(src.crs, allow_override=True, inplace=True)
-        final_gdf = temp_gdf.to_crs("EPSG:4326")
-        final_gdf.to_file(output_file, driver='GeoJSON')
-        print(f"✔ Saved Legacy HAND vector model to {output_file}")
-    else:
-        print("⚠️ No risk zones found to vectorize.")
-    # 8. Generate Aligned Population Raster
-    print("Generating Aligned Population Map...")
-    pop_file = base_dir / "data" / "population_2020_1km.tif"
-    if pop_file.exists():
-        with rasterio.open(pop_file) as src_pop:
-            # We need to reproject the population data (LatLon) to match the DEM grid (Mercator)
-            # Create a destination array matching DEM shape
-            pop_grid = np.zeros_like(dem_raster, dtype=np.float32)
-            
-            reproject(
-                source=rasterio.band(src_pop, 1),
-                destination=pop_grid,
-                src_transform=src_pop.transform,
-                src_crs=src_pop.crs,
-                dst_transform=out_trans,
-                dst_crs=src.crs,
-                resampling=Resampling.bilinear
-            )
-            
-            # Normalize Population for visualization
-            # Find max reasonably 
-            max_pop = np.nanmax(pop_grid)
-            print(f"Max Population Density (reprojected): {max_pop}")
-            if max_pop > 0:
-                # Scale to 0-255
-                # Using sqrt or log might be better for visibility, but linear for now
-                scaled_pop = (pop_grid / max_pop) * 255
-                scaled_pop[scaled_pop > 255] = 255
-                scaled_pop[scaled_pop < 0] = 0
-                
-                rgba_pop = np.zeros((height, width, 4), dtype=np.uint8)
-                # We store density in Red channel
-                rgba_pop[..., 0] = scaled_pop.astype(np.uint8)
-                rgba_pop[..., 1] = 0 
-                rgba_pop[..., 2] = 0
-                
-                # Alpha - 0 if no pop? No, likely full alpha so we can multiply later
-                # Or transparent if 0?
-                # Let's make it transparent where 0 population to save processing
-                alpha_pop = np.ones_like(pop_grid, dtype=np.uint8) * 255
-                alpha_pop[pop_grid <= 0.1] = 0 # Empty areas
-                rgba_pop[..., 3] = alpha_pop
-                
-                img_pop = Image.fromarray(rgba_pop, 'RGBA')
-                pop_out = hazards_dir / "flood_population.png"
-                img_pop.save(pop_out, optimize=True)
-                print(f"✔ Saved Population Raster to {pop_out}")
-            else:
-                 print("⚠️ Population grid is empty after reprojection.")
-    else:
-        print("⚠️ Population file not found, skipping population raster.")
+    with stage("vectorize") as span:
+        index = vectorize_risk(paths["risk"], hazards_dir / "flood_model.geojson", vector_tile_size, workers)
+        record(span, **{f"{band['file']}_features": band["features"] for band in index["bands"]})
+
+    # 6. XYZ tile pyramid, so the map only loads the tiles in view
+    print("Rendering the tile pyramid...")
+    tile_layers = {
+        layer: (LAYER_BANDS[layer], partial(encode_layer, layer, encoding=encoding, max_height=MAX_HAND_M,
+                                            max_population=max_pop))
+        for layer in layers
+    }
+    with stage("tiles") as span:
+        manifest = build_tile_pyramid(store, tile_layers, hazards_dir / TILES_DIR_NAME, workers=workers,
+                                      min_zoom=tile_min_zoom, image_format=image_format,
+                                      extra={"bounds": metadata["bounds"], "encoding": encoding,
+                                             "max_height": MAX_HAND_M})
+        record(span, **{f"{layer}_tiles": sum(len(tiles) for tiles in entry["tiles"].values())
+                        for layer, entry in manifest["layers"].items()})
+
+    # 7. Exposure tables (population and amenities flooded per level)
+    with stage("exposure") as span:
+        points = load_amenity_points()
+        amenities, on_land = amenity_histograms(
+            points,
+            {"river": paths["hand"], "sea": context["onset"], "districts": district_band, "dem": mosaic_path},
+            len(district_names))
+        table = exposure_table(stats, amenities, district_names)
+        exposure_path = save_exposure_table(hazards_dir / "flood_exposure.json", table)
+        record(span, amenities=on_land, table_bytes=exposure_path)
+    print(f"✔ Saved Exposure Tables to {exposure_path} ({on_land} amenities on land)")
+
+    print(f"Done in {time.time() - t0:.1f}s")
+
+
 if __name__ == "__main__":
-    generate_hand_model()
+    parser = argparse.ArgumentParser(description="Generate the HAND flood model and simulator rasters")
+    parser.add_argument("--memory-budget", type=int, default=DEFAULT_MEMORY_BUDGET_MB,
+                        help="Working memory of a block (per worker) in MB (default: %(default)s)")
+    parser.add_argument("--block-size", type=int, default=None,
+                        help="Block core size in pixels (default: from the memory budget)")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument("--verify", action="store_true",
+                        help="Also run the serial path and a single block over the whole DEM (needs its "
+                             "memory) and check the outputs are bit-identical")
+    parser.add_argument("--halo", type=int, default=DEFAULT_HALO,
+                        help=f"Block overlap in pixels, at least {SMOOTH_RADIUS} (smoothing radius): farther "
+                             f"nearest rivers are looked up over the whole raster (slower)")
+    parser.add_argument("--engine", choices=ENGINES, default='edt',
+                        help="HAND engine: nearest river (edt) or along the D8 flow paths (flow)")
+    parser.add_argument("--store-layout", choices=LAYOUTS, default='tiled',
+                        help="Band layout in the raster store: compressed tiles or memory-mappable strips")
+    parser.add_argument("--zoom", type=int, default=None, help="DEM zoom level (default: highest available)")
+    parser.add_argument("--tile-min-zoom", type=int, default=None,
+                        help="Lowest zoom of the tile pyramid (default: the whole DEM in ~one tile)")
+    parser.add_argument("--encoding", choices=ENCODINGS, default='sqrt',
+                        help="Value encoding of the simulator rasters: 8-bit RGBA (sqrt), 16-bit in two "
+                             "channels (rg16) or single-channel 8-bit (gray)")
+    parser.add_argument("--image-format", choices=IMAGE_FORMATS, default='png',
+                        help="Image format of the simulator rasters and tiles (webp is lossless)")
+    parser.add_argument("--compare-encodings", action="store_true",
+                        help="Also report the size and precision of every encoding and format")
+    parser.add_argument("--vector-tile-size", type=int, default=VECTOR_TILE_SIZE,
+                        help="Tile size in pixels of the risk zones polygonization (0: one pass)")
+    add_telemetry_arguments(parser)
+    args = parser.parse_args()
+    if args.halo < SMOOTH_RADIUS:
+        parser.error(f"--halo must be at least {SMOOTH_RADIUS}px (smoothing radius)")
+
+    with run_from_args("generate_flood_model", args):
+        generate_hand_model(memory_budget_mb=args.memory_budget, halo=args.halo, zoom=args.zoom,
+                            workers=args.workers, block_size=args.block_size, verify=args.verify,
+                            engine=args.engine, layout=args.store_layout, tile_min_zoom=args.tile_min_zoom,
+                            encoding=args.encoding, image_format=args.image_format,
+                            compare=args.compare_encodings, vector_tile_size=args.vector_tile_size)
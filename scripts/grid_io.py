@@ -0,0 +1,201 @@
+"""
+Binary grid format shared by the grid producers (population, roads friction).
+
+A `.grid` file is:
+- 8 bytes magic `GMGRID1\n`
+- uint32 little-endian: length of the JSON header in bytes
+- the JSON header (utf-8, padded with spaces so the payload is 16-byte aligned)
+- the raw little-endian payload, row-major, row 0 = minLat
+
+Header fields: width, height, minLat, maxLat, minLon, maxLon, step, maxScore,
+dtype ("float32" or "uint16"), scale and offset (value = raw * scale + offset,
+1 and 0 for float32).
+
+The legacy JSON format ({..., "values": [...]}) can still be written for
+backward compatibility.
+"""
+
+import json
+import struct
+import numpy as np
+from pathlib import Path
+
+MAGIC = b"GMGRID1\n"
+ALIGNMENT = 16
+DTYPES = {
+    'float32': np.dtype('<f4'),
+    'uint16': np.dtype('<u2'),
+}
+FORMATS = ('binary', 'json', 'both')
+
+
+def quantize(values, dtype, value_range=None):
+    """
+    Encode float values as `dtype`. Returns (payload, scale, offset).
+    `value_range` (min, max) quantizes a part of a grid like the whole grid.
+    """
+    values = np.asarray(values, dtype=np.float32)
+    if dtype == 'float32':
+        return values.astype(DTYPES['float32']), 1.0, 0.0
+
+    if dtype != 'uint16':
+        raise ValueError(f"Unsupported grid dtype: {dtype}")
+
+    if value_range is not None:
+        vmin, vmax = value_range
+    else:
+        vmin = float(values.min()) if values.size else 0.0
+        vmax = float(values.max()) if values.size else 0.0
+    scale = (vmax - vmin) / 65535.0 if vmax > vmin else 1.0
+    raw = np.rint((values - vmin) / scale)
+    return np.clip(raw, 0, 65535).astype(DTYPES['uint16']), scale, vmin
+
+
+def grid_header(bbox, width, height, max_score, dtype='float32', scale=1.0, offset=0.0, **extra):
+    header = {
+        "width": int(width),
+        "height": int(height),
+        "minLat": bbox['minLat'],
+        "maxLat": bbox['maxLat'],
+        "minLon": bbox['minLon'],
+        "maxLon": bbox['maxLon'],
+        "step": bbox['step'],
+        "maxScore": float(max_score),
+        "dtype": dtype,
+        "scale": scale,
+        "offset": offset,
+    }
+    header.update(extra)
+    return header
+
+
+def write_grid(path, values, bbox, max_score=None, dtype='float32', **extra):
+    """Write a 2D grid (row 0 = minLat) to a binary `.grid` file."""
+    values = np.asarray(values)
+    height, width = values.shape
+    if max_score is None:
+        max_score = float(values.max()) if values.size else 0.0
+
+    payload, scale, offset = quantize(values, dtype)
+    header = grid_header(bbox, width, height, max_score, dtype, scale, offset, **extra)
+
+    header_bytes = json.dumps(header).encode('utf-8')
+    prefix_len = len(MAGIC) + 4
+    pad = (-(prefix_len + len(header_bytes))) % ALIGNMENT
+    header_bytes += b' ' * pad
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<I', len(header_bytes)))
+        f.write(header_bytes)
+        f.write(np.ascontiguousarray(payload).tobytes())
+    return header
+
+
+def read_grid_header(path):
+    """Read the JSON header of a `.grid` file. Returns (header, payload offset)."""
+    with open(path, 'rb') as f:
+        magic = f.read(len(MAGIC))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a grid file")
+        (header_len,) = struct.unpack('<I', f.read(4))
+        header = json.loads(f.read(header_len).decode('utf-8'))
+    return header, len(MAGIC) + 4 + header_len
+
+
+def read_grid(path, mode='r'):
+    """
+    Memory-map a `.grid` file without copying the payload.
+    Returns (header, raw array of shape (height, width)). Use `grid_values`
+    to get the decoded float values of a quantized grid.
+    """
+    header, offset = read_grid_header(path)
+    raw = np.memmap(path, dtype=DTYPES[header['dtype']], mode=mode, offset=offset,
+                    shape=(header['height'], header['width']))
+    return header, raw
+
+
+def grid_values(header, raw):
+    """Decoded float32 values (no copy for float32 grids)."""
+    if header['dtype'] == 'float32':
+        return raw
+    return raw.astype(np.float32) * np.float32(header['scale']) + np.float32(header['offset'])
+
+
+def patch_grid(path, values, window, dtype='float32'):
+    """
+    Overwrite the window (row0, row1, col0, col1) of a `.grid` file in
+    place with the same window of `values` (the whole new grid, row 0 =
+    minLat). Returns False, leaving the file untouched, when the file has
+    another shape or dtype, or when the quantization of the new grid differs
+    from the file's (uint16 grid whose min or max changed): rewrite it then.
+    """
+    header, raw = read_grid(path, mode='r+')
+    values = np.asarray(values, dtype=np.float32)
+    if header['dtype'] != dtype or raw.shape != values.shape:
+        return False
+
+    row0, row1, col0, col1 = window
+    value_range = (float(values.min()), float(values.max())) if values.size else (0.0, 0.0)
+    payload, scale, offset = quantize(values[row0:row1, col0:col1], dtype, value_range)
+    if (scale, offset) != (header['scale'], header['offset']):
+        return False
+
+    raw[row0:row1, col0:col1] = payload
+    raw.flush()
+    return True
+
+
+def write_grid_json(path, values, bbox, max_score=None, **extra):
+    """Write the legacy JSON grid format read by older app versions."""
+    values = np.asarray(values, dtype=np.float32)
+    height, width = values.shape
+    if max_score is None:
+        max_score = float(values.max()) if values.size else 0.0
+
+    output_data = {
+        "width": int(width),
+        "height": int(height),
+        "minLat": bbox['minLat'],
+        "maxLat": bbox['maxLat'],
+        "minLon": bbox['minLon'],
+        "maxLon": bbox['maxLon'],
+        "step": bbox['step'],
+        "maxScore": float(max_score),
+    }
+    output_data.update(extra)
+    # Flatten to 1D array (row-major)
+    output_data["values"] = values.ravel().tolist()
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(output_data, f)
+
+
+def save_grid_outputs(base_path, values, bbox, max_score=None, fmt='both', dtype='float32', **extra):
+    """
+    Write a grid as `<base_path>.grid` and/or `<base_path>.json`.
+    Returns the list of written paths.
+    """
+    base_path = Path(base_path)
+    written = []
+    if fmt in ('binary', 'both'):
+        path = base_path.with_suffix('.grid')
+        write_grid(path, values, bbox, max_score=max_score, dtype=dtype, **extra)
+        written.append(path)
+    if fmt in ('json', 'both'):
+        path = base_path.with_suffix('.json')
+        write_grid_json(path, values, bbox, max_score=max_score, **extra)
+        written.append(path)
+    return written
+
+
+def add_grid_arguments(parser):
+    parser.add_argument("--format", choices=FORMATS, default='both',
+                        help="Grid output: binary .grid, legacy .json or both (default)")
+    parser.add_argument("--dtype", choices=sorted(DTYPES), default='float32',
+                        help="Binary payload type, uint16 quantizes the values")
+    return parser
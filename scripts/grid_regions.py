@@ -0,0 +1,175 @@
+"""
+Application grid definition, shared by every grid producer.
+
+GRID_BBOX is the envelope used by the app (heatmap.js), from Mauritius to
+Rodrigues. More than 90% of it is open ocean, so the producers work on one
+tight sub-grid per island (REGIONS) and only assemble the full envelope for
+the legacy outputs.
+
+Regions are aligned on the global grid: a region is the window
+[y0:y0+height, x0:x0+width] of the global grid (row 0 = minLat).
+
+The full-precision region grids are also kept in the raster store
+app_<region> (raster_store.py), north-up with the pixel centers on the grid
+nodes; the .grid files are the exports read by the app.
+"""
+
+import json
+import numpy as np
+from pathlib import Path
+from rasterio.transform import from_origin
+
+from grid_io import save_grid_outputs
+from raster_store import create_store, store_path, write_band
+
+PUBLIC_DATA_DIR = Path(__file__).parent.parent / "geo-maurice-app/public/data"
+REGIONS_FILE = PUBLIC_DATA_DIR / "grid_regions.json"
+
+GRID_STEP = 0.002  # ~200m, same as heatmap.js resolution
+
+# Bounding box of our map (same as heatmap.js)
+GRID_BBOX = {
+    'minLat': -20.60,
+    'maxLat': -19.40,
+    'minLon': 57.20,
+    'maxLon': 63.60,
+    'step': GRID_STEP
+}
+
+# One box per island, including the offshore islets
+REGIONS = {
+    'mauritius': {
+        'minLat': -20.60,
+        'maxLat': -19.80,
+        'minLon': 57.20,
+        'maxLon': 57.90,
+    },
+    'rodrigues': {
+        'minLat': -19.85,
+        'maxLat': -19.55,
+        'minLon': 63.25,
+        'maxLon': 63.60,
+    },
+}
+
+
+def grid_shape(bbox=GRID_BBOX):
+    """(width, height) of a grid covering the bbox (or of a region grid)."""
+    if 'width' in bbox:
+        return bbox['width'], bbox['height']
+    width = int(np.ceil((bbox['maxLon'] - bbox['minLon']) / bbox['step']))
+    height = int(np.ceil((bbox['maxLat'] - bbox['minLat']) / bbox['step']))
+    return width, height
+
+
+def grid_transform(bbox=GRID_BBOX):
+    """
+    North-up transform of a grid (app grid or region) whose pixel centers
+    sit on the grid nodes (minLon + x*step, minLat + y*step), the points
+    sampled by the app. Rows must be flipped to get row 0 = minLat.
+    """
+    step = bbox['step']
+    _, height = grid_shape(bbox)
+    return from_origin(bbox['minLon'] - step / 2, bbox['minLat'] + (height - 0.5) * step, step, step)
+
+
+def region_store(region):
+    """Raster store of a region grid, created if needed."""
+    width, height = grid_shape(region)
+    path = store_path(f"app_{region['name']}")
+    create_store(path, {"crs": "EPSG:4326", "transform": grid_transform(region),
+                        "width": width, "height": height})
+    return path
+
+
+def region_grid(name):
+    """
+    Bbox of a region snapped on the global grid, with its size and its
+    offset (x0, y0) in the global grid.
+    """
+    box = REGIONS[name]
+    step = GRID_BBOX['step']
+    global_width, global_height = grid_shape(GRID_BBOX)
+
+    x0 = max(0, int(round((box['minLon'] - GRID_BBOX['minLon']) / step)))
+    y0 = max(0, int(round((box['minLat'] - GRID_BBOX['minLat']) / step)))
+    x1 = min(global_width, int(round((box['maxLon'] - GRID_BBOX['minLon']) / step)))
+    y1 = min(global_height, int(round((box['maxLat'] - GRID_BBOX['minLat']) / step)))
+
+    return {
+        'name': name,
+        'minLat': GRID_BBOX['minLat'] + y0 * step,
+        'maxLat': GRID_BBOX['minLat'] + y1 * step,
+        'minLon': GRID_BBOX['minLon'] + x0 * step,
+        'maxLon': GRID_BBOX['minLon'] + x1 * step,
+        'step': step,
+        'x0': x0,
+        'y0': y0,
+        'width': x1 - x0,
+        'height': y1 - y0,
+    }
+
+
+def region_grids():
+    return [region_grid(name) for name in REGIONS]
+
+
+def regions_metadata():
+    width, height = grid_shape(GRID_BBOX)
+    return {
+        "grid": dict(GRID_BBOX, width=width, height=height),
+        "regions": region_grids(),
+    }
+
+
+def save_regions_metadata(path=REGIONS_FILE):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(regions_metadata(), f, indent=2)
+
+
+def locate(lat, lon):
+    """
+    Region and (x, y) index inside the region of a point, or None outside
+    of every region. Same flooring as heatmap.js.
+    """
+    for region in region_grids():
+        x = int(np.floor((lon - region['minLon']) / region['step']))
+        y = int(np.floor((lat - region['minLat']) / region['step']))
+        if 0 <= x < region['width'] and 0 <= y < region['height']:
+            return region['name'], x, y
+    return None
+
+
+def assemble_global(region_values, fill=0.0, dtype=np.float32):
+    """Place region arrays ({name: array}) into the full GRID_BBOX grid."""
+    width, height = grid_shape(GRID_BBOX)
+    values = np.full((height, width), fill, dtype=dtype)
+    for region in region_grids():
+        if region['name'] in region_values:
+            y0, x0 = region['y0'], region['x0']
+            values[y0:y0 + region['height'], x0:x0 + region['width']] = region_values[region['name']]
+    return values
+
+
+def save_region_outputs(base_path, region_values, max_score=None, dtype='float32'):
+    """
+    Write one `<base>.<region>.grid` per region, plus the shared regions
+    metadata, and keep the full-precision values in the band `<base>` of
+    the region stores. Returns the list of written paths.
+    """
+    base_path = Path(base_path).with_suffix('')
+    written = []
+    for region in region_grids():
+        values = region_values.get(region['name'])
+        if values is None:
+            continue
+        write_band(region_store(region), base_path.name, np.flipud(np.asarray(values, dtype=np.float32)),
+                   description=f"{base_path.name} (row 0 = maxLat)")
+        path = base_path.with_name(f"{base_path.name}.{region['name']}.grid")
+        written += save_grid_outputs(path, values, region, max_score=max_score, fmt='binary',
+                                     dtype=dtype, region=region['name'],
+                                     x0=region['x0'], y0=region['y0'])
+    save_regions_metadata(base_path.parent / REGIONS_FILE.name)
+    return written
@@ -0,0 +1,253 @@
+"""
+Shared on-disk cache for Nominatim/Overpass responses.
+
+Responses are stored under data/cache/osm/, keyed by a hash of the
+normalized query text (whitespace collapsed), so cosmetic changes in the
+query strings of the scripts do not invalidate the cache.
+
+- Entries older than the TTL are downloaded again.
+- The cache is capped in size, least recently used entries are evicted first.
+- In offline mode, cached responses are replayed whatever their age and a
+  missing entry raises OfflineCacheMiss instead of hitting the network.
+
+Overpass downloads go through the shared OverpassScheduler
+(overpass_scheduler.py: slot status, retries, endpoint pool); `query_all`
+runs a batch of queries concurrently on it. CachedOverpass only replaces
+the download of OSMPythonTools (Overpass.query, its cache keys and options
+are the library's own, checked by test_osm_cache.py).
+"""
+
+import argparse
+import os
+import re
+import threading
+import time
+import ujson
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+
+from OSMPythonTools.cachingStrategy import CachingStrategy
+from OSMPythonTools.cachingStrategy.base import CachingStrategyBase
+from OSMPythonTools.nominatim import Nominatim
+from OSMPythonTools.overpass import Overpass
+
+from overpass_scheduler import DEFAULT_RETRIES, OverpassError, OverpassScheduler
+
+CACHE_DIR = Path(__file__).parent.parent / "data" / "cache" / "osm"
+DEFAULT_TTL_HOURS = 24 * 7
+DEFAULT_MAX_SIZE_MB = 500
+# Setting put in front of the query string by Overpass._queryString
+TIMEOUT_RE = re.compile(r"^\[timeout:(\d+)\]")
+
+
+class OfflineCacheMiss(Exception):
+    """Raised in offline mode when a query has no cached response."""
+
+
+def normalize_query(text):
+    """Collapse whitespace so that equivalent queries share a cache entry."""
+    return " ".join(str(text).split())
+
+
+class ResponseCache(CachingStrategyBase):
+    """OSMPythonTools caching strategy with TTL, size cap and offline replay."""
+
+    def __init__(self, cacheDir=CACHE_DIR, ttl_hours=DEFAULT_TTL_HOURS,
+                 max_size_mb=DEFAULT_MAX_SIZE_MB, offline=False):
+        self._cacheDir = Path(cacheDir)
+        self._cacheDir.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl_hours * 3600 if ttl_hours is not None else None
+        self.max_size = max_size_mb * 1024 * 1024 if max_size_mb is not None else None
+        self.offline = offline
+        self._local = threading.local()
+
+    def _filename(self, key):
+        return self._cacheDir / f"{key}.json"
+
+    @contextmanager
+    def fresh(self, enabled=True):
+        """Ignore the cached responses in this thread (except in offline mode)."""
+        previous = getattr(self._local, "fresh", False)
+        self._local.fresh = enabled and not self.offline
+        try:
+            yield
+        finally:
+            self._local.fresh = previous
+
+    def get(self, key):
+        if getattr(self._local, "fresh", False):
+            return None
+        path = self._filename(key)
+        if not path.exists():
+            if self.offline:
+                raise OfflineCacheMiss(f"No cached response for {key} (offline mode)")
+            return None
+
+        stat = path.stat()
+        if not self.offline and self.ttl is not None and time.time() - stat.st_mtime > self.ttl:
+            return None
+
+        with open(path, "r") as f:
+            data = ujson.load(f)
+
+        # atime tracks the last use (LRU), mtime the download date (TTL)
+        os.utime(path, (time.time(), stat.st_mtime))
+        return data
+
+    def set(self, key, value):
+        path = self._filename(key)
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, "w") as f:
+            ujson.dump(value, f)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits max_size."""
+        if self.max_size is None:
+            return
+
+        entries = []
+        for p in self._cacheDir.glob("*.json"):
+            try:
+                entries.append((p, p.stat()))
+            except FileNotFoundError:
+                pass
+        total = sum(st.st_size for _, st in entries)
+        if total <= self.max_size:
+            return
+
+        for p, st in sorted(entries, key=lambda e: e[1].st_atime):
+            p.unlink(missing_ok=True)  # another thread may evict it too
+            total -= st.st_size
+            if total <= self.max_size:
+                break
+
+
+_cache = None
+_scheduler = None
+
+
+def configure_cache(offline=False, ttl_hours=DEFAULT_TTL_HOURS,
+                    max_size_mb=DEFAULT_MAX_SIZE_MB, cache_dir=CACHE_DIR):
+    """Install the response cache as OSMPythonTools caching strategy."""
+    global _cache
+    _cache = CachingStrategy.use(ResponseCache, cacheDir=cache_dir, ttl_hours=ttl_hours,
+                                 max_size_mb=max_size_mb, offline=offline)
+    return _cache
+
+
+def get_cache():
+    if _cache is None:
+        configure_cache()
+    return _cache
+
+
+def configure_scheduler(endpoints=None, retries=DEFAULT_RETRIES):
+    """Install the Overpass scheduler used by CachedOverpass."""
+    global _scheduler
+    _scheduler = OverpassScheduler(endpoints, retries=retries)
+    return _scheduler
+
+
+def get_scheduler():
+    if _scheduler is None:
+        configure_scheduler()
+    return _scheduler
+
+
+def add_cache_arguments(parser):
+    parser.add_argument("--offline", action="store_true",
+                        help="Replay cached Nominatim/Overpass responses, no network")
+    parser.add_argument("--cache-ttl", type=float, default=DEFAULT_TTL_HOURS,
+                        help=f"Cache lifetime in hours (default {DEFAULT_TTL_HOURS})")
+    parser.add_argument("--cache-max-mb", type=float, default=DEFAULT_MAX_SIZE_MB,
+                        help=f"Cache size cap in MB (default {DEFAULT_MAX_SIZE_MB})")
+    parser.add_argument("--overpass-endpoint", action="append", default=None, metavar="URL",
+                        help="Overpass API endpoint, repeat for a pool of mirrors "
+                             "(default https://overpass-api.de/api/)")
+    parser.add_argument("--overpass-retries", type=int, default=DEFAULT_RETRIES,
+                        help=f"Retries of a rate-limited or failed Overpass query (default {DEFAULT_RETRIES})")
+    return parser
+
+
+def configure_cache_from_args(args):
+    configure_scheduler(args.overpass_endpoint, retries=args.overpass_retries)
+    return configure_cache(offline=args.offline, ttl_hours=args.cache_ttl,
+                           max_size_mb=args.cache_max_mb)
+
+
+def parse_cache_args(description):
+    """Argument parser for scripts that only take the cache options."""
+    parser = argparse.ArgumentParser(description=description)
+    add_cache_arguments(parser)
+    args = parser.parse_args()
+    configure_cache_from_args(args)
+    return args
+
+
+class CachedOverpass(Overpass):
+    """
+    Overpass client using the shared cache and normalized query text,
+    downloading through the shared scheduler (thread safe).
+    """
+
+    def __init__(self, *args, **kwargs):
+        get_cache()
+        super().__init__(*args, **kwargs)
+
+    def _queryString(self, query, *args, **kwargs):
+        return super()._queryString(normalize_query(query), *args, **kwargs)
+
+    def query(self, query, timeout=25, fresh=False, **kwargs):
+        """
+        Overpass.query (cache keys, onlyCached, shallow), raises OverpassError
+        on failure. `fresh` skips the cached response (except in offline mode).
+        """
+        # fresh settings: the library mutates its default dict
+        kwargs["settings"] = dict(kwargs.get("settings") or {})
+        with get_cache().fresh(fresh):
+            return super().query(query, timeout=timeout, **kwargs)
+
+    def _CacheObject__query(self, queryString, params):
+        """Download of the library (cache miss), through the shared scheduler."""
+        timeout = TIMEOUT_RE.match(queryString)
+        return get_scheduler().fetch(queryString, timeout=int(timeout.group(1)) if timeout else 25)
+
+    def _waitForReady(self):
+        # The scheduler waits for the slots of its endpoints
+        return True
+
+    def _isValid(self, result):
+        if not super()._isValid(result):
+            raise OverpassError(f"Error in Overpass result: {result.remark()}")
+        return True
+
+
+def query_all(overpass, queries, timeout=180, **kwargs):
+    """
+    Run several Overpass queries concurrently (as many as the scheduler has
+    slots), results in the order of `queries`. The first failure is raised.
+    """
+    with ThreadPoolExecutor(max_workers=max(1, min(len(queries), get_scheduler().parallelism))) as executor:
+        return list(executor.map(lambda query: overpass.query(query, timeout=timeout, **kwargs), queries))
+
+
+class CachedNominatim(Nominatim):
+    """Nominatim client using the shared cache and normalized search text."""
+
+    def __init__(self, *args, **kwargs):
+        get_cache()
+        super().__init__(*args, **kwargs)
+
+    def _queryString(self, *args, **kwargs):
+        if len(args) == 1 and isinstance(args[0], str):
+            args = (normalize_query(args[0]),)
+        return super()._queryString(*args, **kwargs)
+
+
+def resolve_area_id(name='Mauritius'):
+    """Resolve the OSM area id of a place (cached Nominatim lookup)."""
+    return CachedNominatim().query(name).areaId()
+
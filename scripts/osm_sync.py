@@ -0,0 +1,155 @@
+"""
+Incremental refresh of the OSM extracts (fetch_osm, fetch_roads_friction,
+fetch_hazards --incremental).
+
+Every full or incremental fetch records the OSM base timestamp of its
+Overpass responses (osm3s.timestamp_osm_base, the time of the data, not of
+the local clock) in data/osm/sync.json. The next incremental run sends two
+queries per group of filters instead of downloading everything again:
+- changes: the matching elements modified since that timestamp
+  ((newer:"...")), plus the matching ways with a node moved since then,
+  with their full geometry
+- inventory: the ids of every matching element (out ids, no geometry), so
+  deleted elements and elements whose tags no longer match are dropped
+
+and the scripts merge them into their stores (amenity GeoJSON files, road
+store, flood.geojson), rewriting only the files whose content changed.
+Relations whose member ways moved are not detected; run a full fetch now
+and then (without --incremental) to catch them.
+
+Without a recorded timestamp (first run, files written by an older
+version), the scripts fall back to a full fetch.
+"""
+
+import json
+from pathlib import Path
+
+from osm_cache import query_all
+
+SYNC_FILE = Path(__file__).parent.parent / "data" / "osm" / "sync.json"
+ELEMENT_ORDER = {"node": 0, "way": 1, "relation": 2}
+
+
+def load_sync(path=SYNC_FILE):
+    if not Path(path).exists():
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def last_sync(dataset, path=SYNC_FILE):
+    """OSM base timestamp of the last fetch of a dataset, or None."""
+    return load_sync(path).get(dataset)
+
+
+def save_sync(dataset, timestamp, path=SYNC_FILE):
+    """Record the OSM base timestamp of a dataset (once its outputs are written)."""
+    if timestamp is None:
+        return
+    path = Path(path)
+    state = load_sync(path)
+    state[dataset] = timestamp
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w") as f:
+        json.dump(state, f, indent=2)
+    tmp.replace(path)
+
+
+def osm_base(results):
+    """Oldest OSM base timestamp of Overpass results (None if unknown)."""
+    # Raw "YYYY-MM-DDTHH:MM:SSZ" strings, the format of the (newer:"...") filter
+    stamps = [(result.toJSON().get("osm3s") or {}).get("timestamp_osm_base") for result in results]
+    stamps = [stamp for stamp in stamps if stamp]
+    return min(stamps) if stamps else None
+
+
+def element_key(el):
+    """Store key of an element: "<type>/<id>" (node, way and relation ids overlap)."""
+    return f"{el.type()}/{el.id()}"
+
+
+def key_order(key):
+    """Sort key of a store key: nodes, ways, relations by id, like the Overpass output."""
+    element_type, element_id = key.split("/")
+    return ELEMENT_ORDER[element_type], int(element_id)
+
+
+def changes_query(area_id, filters, since, out):
+    """
+    Elements matching the filters ([(element type, tag selector)], e.g.
+    ("way", '["highway"~"^(primary|secondary)$"]')) changed since `since`.
+    """
+    statements = []
+    for element_type, selector in filters:
+        statements.append(f'{element_type}{selector}(area.searchArea)(newer:"{since}");')
+        if element_type in ('way', 'nwr'):
+            statements.append(f'way{selector}(bn.moved);')
+    return f"""
+    area({area_id})->.searchArea;
+    node(area.searchArea)(newer:"{since}")->.moved;
+    (
+      {" ".join(statements)}
+    );
+    out {out};
+    """
+
+
+def union_query(area_id, filters, out='ids'):
+    """Every element matching the filters (the inventory with out ids)."""
+    statements = " ".join(f'{element_type}{selector}(area.searchArea);' for element_type, selector in filters)
+    return f"""
+    area({area_id})->.searchArea;
+    (
+      {statements}
+    );
+    out {out};
+    """
+
+
+def fetch_changes(overpass, area_id, groups, since, out='geom', timeout=180):
+    """
+    Changed elements and current ids of each group of filters
+    ({name: filters}). All the queries run concurrently and bypass the
+    response cache. Returns ({name: (changed elements, current keys)},
+    OSM base timestamp).
+    """
+    names = list(groups)
+    queries = []
+    for name in names:
+        queries += [changes_query(area_id, groups[name], since, out), union_query(area_id, groups[name])]
+    results = query_all(overpass, queries, timeout=timeout, fresh=True)
+
+    changes = {}
+    for i, name in enumerate(names):
+        changed, inventory = results[2 * i], results[2 * i + 1]
+        changes[name] = (changed.elements(), {element_key(el) for el in inventory.elements()})
+    return changes, osm_base(results)
+
+
+def merge(store, changed, current):
+    """
+    Apply changes to a store {key: value} in place: entries missing from the
+    current keys are removed, `changed` ({key: value, None to drop}) updates
+    the others. Returns the keys whose value changed, with their old value
+    (None if new).
+    """
+    touched = {}
+    for key in [key for key in store if key not in current]:
+        touched[key] = store.pop(key)
+    for key, value in changed.items():
+        old = store.get(key)
+        if key not in current or value is None:
+            if key in store:
+                touched[key] = store.pop(key)
+        elif old != value:
+            touched[key] = old
+            store[key] = value
+    return touched
+
+
+def add_incremental_argument(parser):
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only fetch the OSM elements changed since the last sync and merge them "
+                             "(full fetch when there is no previous sync)")
+    return parser
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Rate-limit-aware scheduler of the Overpass queries (used by CachedOverpass).
+
+- Pool of endpoints (public instance, mirrors, a local stand-in): each
+  query goes to the endpoint with the fewest queries in flight, at most
+  `slots` per endpoint.
+- Before a query, the /status of the endpoint is read and the scheduler
+  waits for a free slot ("Slot available after: ..., in N seconds.").
+- 429, 502, 503, 504, network errors and server-side runtime errors
+  ("Query timed out", out of memory) are retried with exponential backoff
+  and jitter, on another endpoint when there is one; the failing endpoint
+  cools down meanwhile (Retry-After honored). Other errors (bad query) are
+  raised at once. After the retries the query fails with OverpassError:
+  no empty result is ever returned in place of a failed one.
+- Identical queries in flight are sent once, the other callers wait for
+  the same response.
+
+Local stand-in endpoint, replaying the cached responses (data/cache/osm/),
+to test the scripts and the retries without the network:
+
+    python scripts/overpass_scheduler.py --serve 8765 --fail-rate 0.3
+    python scripts/fetch_roads_friction.py --cache-ttl 0 --overpass-endpoint http://127.0.0.1:8765/api/
+"""
+
+import argparse
+import datetime
+import hashlib
+import json
+import random
+import re
+import socket
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+DEFAULT_ENDPOINTS = ["https://overpass-api.de/api/"]
+# Other public instances, e.g. for --overpass-endpoint
+MIRRORS = ["https://overpass.kumi.systems/api/", "https://overpass.private.coffee/api/"]
+
+DEFAULT_SLOTS = 2  # concurrent queries per endpoint (overpass-api.de: 2 per IP)
+DEFAULT_RETRIES = 5
+BACKOFF_BASE_S = 2.0
+BACKOFF_MAX_S = 60.0
+MAX_SLOT_WAIT_S = 120.0
+STATUS_TIMEOUT_S = 10
+RETRY_STATUS = {429, 502, 503, 504}
+USER_AGENT = "geo-maurice (https://github.com/augustin-bresset/geo-maurice)"
+
+
+class OverpassError(Exception):
+    """A query that failed (bad query, or still failing after the retries)."""
+
+
+class RetryableError(Exception):
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def backoff_delay(attempt):
+    """Exponential backoff with jitter: uniform in [d/2, d], d = base * 2^attempt (capped)."""
+    delay = min(BACKOFF_MAX_S, BACKOFF_BASE_S * 2 ** attempt)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def slot_wait(status_text):
+    """Seconds to wait before a slot is free, from the text of /status (0: free now)."""
+    waits = []
+    for line in status_text.splitlines():
+        line = line.strip()
+        free = re.match(r"(\d+) slots? available now\.", line)
+        if line == "Rate limit: 0" or (free and int(free.group(1)) > 0):
+            return 0.0
+        match = re.match(r"Slot available after: .*, in (-?\d+) seconds?\.", line)
+        if match:
+            waits.append(max(0.0, float(match.group(1))))
+    return min(waits) if waits else 0.0
+
+
+class OverpassScheduler:
+    """Sends Overpass queries over a pool of endpoints (thread safe)."""
+
+    def __init__(self, endpoints=None, slots=DEFAULT_SLOTS, retries=DEFAULT_RETRIES):
+        self.endpoints = [{"url": url if url.endswith("/") else url + "/", "running": 0, "cooldown": 0.0}
+                          for url in (endpoints or DEFAULT_ENDPOINTS)]
+        self.slots = slots
+        self.retries = retries
+        self._lock = threading.Condition()
+        self._inflight = {}
+
+    @property
+    def parallelism(self):
+        """Queries the pool can run at the same time."""
+        return self.slots * len(self.endpoints)
+
+    def fetch(self, query_string, timeout=180):
+        """
+        Raw response of a query ({"version", "response", "timestamp"}, the
+        OSMPythonTools cache format). Identical queries in flight are sent once.
+        """
+        with self._lock:
+            future = self._inflight.get(query_string)
+            owner = future is None
+            if owner:
+                future = self._inflight[query_string] = Future()
+        if not owner:
+            return future.result()
+
+        try:
+            data = self._fetch_with_retries(query_string, timeout)
+            future.set_result(data)
+            return data
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[query_string]
+
+    def _acquire(self):
+        """The endpoint with a free slot and the fewest queries, waiting if none."""
+        with self._lock:
+            while True:
+                now = time.monotonic()
+                free = [e for e in self.endpoints if e["running"] < self.slots and e["cooldown"] <= now]
+                if free:
+                    endpoint = min(free, key=lambda e: e["running"])
+                    endpoint["running"] += 1
+                    return endpoint
+                cooling = [e["cooldown"] - now for e in self.endpoints if e["cooldown"] > now]
+                self._lock.wait(timeout=min(cooling) if cooling else None)
+
+    def _release(self, endpoint, cooldown=0.0):
+        with self._lock:
+            endpoint["running"] -= 1
+            if cooldown:
+                endpoint["cooldown"] = max(endpoint["cooldown"], time.monotonic() + cooldown)
+            self._lock.notify_all()
+
+    def _fetch_with_retries(self, query_string, timeout):
+        for attempt in range(self.retries + 1):
+            endpoint = self._acquire()
+            cooldown = 0.0
+            try:
+                self._wait_for_slot(endpoint)
+                return self._request(endpoint["url"], query_string, timeout)
+            except RetryableError as e:
+                if attempt == self.retries:
+                    raise OverpassError(f"{endpoint['url']}: {e} (after {attempt + 1} attempts)") from e
+                cooldown = e.retry_after or backoff_delay(attempt)
+                print(f"⚠️ Overpass {endpoint['url']}: {e}, retry {attempt + 1}/{self.retries} "
+                      f"in {cooldown:.1f}s{' on another endpoint' if len(self.endpoints) > 1 else ''}")
+            finally:
+                self._release(endpoint, cooldown)
+
+    def _wait_for_slot(self, endpoint):
+        """Wait until the endpoint announces a free slot (if it has a /status)."""
+        deadline = time.monotonic() + MAX_SLOT_WAIT_S
+        while True:
+            try:
+                request = urllib.request.Request(endpoint["url"] + "status", headers={"User-Agent": USER_AGENT})
+                with urllib.request.urlopen(request, timeout=STATUS_TIMEOUT_S) as response:
+                    wait = slot_wait(response.read().decode("utf-8", "replace"))
+            except (urllib.error.URLError, OSError, ValueError):
+                return  # mirrors without /status
+            # Measured after the /status round-trip, which may have used it up
+            remaining = deadline - time.monotonic()
+            if wait <= 0 or remaining <= 0:
+                return
+            time.sleep(min(wait + random.uniform(0, 1), remaining))
+
+    def _request(self, url, query_string, timeout):
+        request = urllib.request.Request(url + "interpreter",
+                                         urllib.parse.urlencode({"data": query_string}).encode("utf-8"),
+                                         headers={"User-Agent": USER_AGENT})
+        try:
+            with urllib.request.urlopen(request, timeout=timeout + 30) as response:
+                payload = response.read().decode(response.info().get_content_charset("utf-8"))
+        except urllib.error.HTTPError as e:
+            if e.code in RETRY_STATUS:
+                retry_after = e.headers.get("Retry-After")
+                raise RetryableError(f"HTTP {e.code}",
+                                     float(retry_after) if retry_after and retry_after.isdigit() else None)
+            raise OverpassError(f"{url}: HTTP {e.code} {e.reason}: {e.read()[:300]!r}") from e
+        except (urllib.error.URLError, socket.timeout, ConnectionError) as e:
+            raise RetryableError(f"network error ({e})")
+
+        try:
+            data = json.loads(payload)
+        except ValueError:
+            raise RetryableError("invalid JSON response")
+        remark = data.get("remark") or ""
+        if "runtime error" in remark:
+            raise RetryableError(remark.strip())
+        return {"version": "1.0", "response": data, "timestamp": datetime.datetime.now().isoformat()}
+
+
+# ============================================================
+# Local stand-in endpoint
+# ============================================================
+
+def cache_key(query_string):
+    """
+    OSMPythonTools cache key of a query string received by the endpoint:
+    the query without its [timeout:...] setting (the Overpass queries have
+    no request parameters, so no '????' suffix).
+    """
+    hash_string = re.sub(r"^\[timeout:\d+\]", "", query_string)
+    return f"overpass-{hashlib.sha1(hash_string.encode('utf-8')).hexdigest()}"
+
+
+def stub_handler(cache_dir, fail_rate=0.0):
+    """Request handler replaying the cached Overpass responses, with random 429s."""
+    cache_dir = Path(cache_dir)
+
+    class Handler(BaseHTTPRequestHandler):
+        def reply(self, code, body, content_type="application/json"):
+            data = body.encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path.endswith("/status"):
+                self.reply(200, "Connected as: 0\nRate limit: 0\n", "text/plain")
+            else:
+                self.reply(404, "{}")
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            query = urllib.parse.parse_qs(self.rfile.read(length).decode("utf-8")).get("data", [""])[0]
+            if random.random() < fail_rate:
+                self.reply(429, '{"remark": "rate limited (stand-in)"}')
+                return
+            path = cache_dir / f"{cache_key(query)}.json"
+            if path.exists():
+                with open(path, "r") as f:
+                    self.reply(200, json.dumps(json.load(f)["response"]))
+            else:
+                print(f"⚠️ No cached response for: {query[:120]}")
+                self.reply(400, '{"remark": "no cached response (stand-in)"}')
+
+        def log_message(self, fmt, *args):
+            pass
+
+    return Handler
+
+
+def serve(port, cache_dir, fail_rate=0.0):
+    server = ThreadingHTTPServer(("127.0.0.1", port), stub_handler(cache_dir, fail_rate))
+    print(f"Overpass stand-in on http://127.0.0.1:{port}/api/ (replaying {cache_dir}, "
+          f"{fail_rate:.0%} of the queries answered 429)")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    from osm_cache import CACHE_DIR
+
+    parser = argparse.ArgumentParser(description="Local Overpass stand-in endpoint replaying the cache")
+    parser.add_argument("--serve", type=int, default=8765, metavar="PORT", help="Port (default: %(default)s)")
+    parser.add_argument("--cache-dir", type=Path, default=CACHE_DIR, help="Cached responses to replay")
+    parser.add_argument("--fail-rate", type=float, default=0.0,
+                        help="Share of the queries answered 429, to exercise the retries")
+    args = parser.parse_args()
+
+    serve(args.serve, args.cache_dir, args.fail_rate)
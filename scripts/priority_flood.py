@@ -0,0 +1,223 @@
+"""
+Priority-flood on a DEM: depression filling and D8 flow routing.
+
+Priority-flood grows the flooded area from the outlets (the sea and the
+raster edges), always through the lowest cell of its border: every cell is
+reached at its spill level (filled elevation) from a neighbour, which is
+its D8 receiver. This is Prim's algorithm on the 8-connected grid with the
+edge weights max(z_u, z_v), so the same flood tree is obtained with the
+compiled minimum spanning tree of scipy.sparse.csgraph, in O(n log n):
+- receiver of a cell: its parent in the tree (towards the sea)
+- filled elevation: the highest cell on its tree path to the sea
+
+Path quantities (filled elevation, drain cell) are computed by pointer
+jumping, a few vectorized passes (log of the path length) over the cells.
+Only the cells above the outlets are graph nodes, the sea is one node.
+
+exit_cells, label_links and minimax_levels are the pieces of the tiled
+version for DEMs larger than memory (tiled_flood.py).
+"""
+
+import numpy as np
+from scipy.ndimage import binary_dilation, label
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import breadth_first_order, minimum_spanning_tree
+
+# Half of the 8 neighbours (dy, dx): each pair of cells is linked once
+HALF_NEIGHBORS = [(0, 1), (1, -1), (1, 0), (1, 1)]
+NEIGHBORS = HALF_NEIGHBORS + [(-dy, -dx) for dy, dx in HALF_NEIGHBORS]
+
+
+def ocean_mask(dem, sea_level=0.0):
+    """Cells at or below the sea level (or nodata) connected to the raster edge."""
+    below = ~(dem > sea_level)
+    labels, _ = label(below, structure=np.ones((3, 3)))
+    edge = np.unique(np.concatenate([labels[0], labels[-1], labels[:, 0], labels[:, -1]]))
+    return np.isin(labels, edge[edge > 0])
+
+
+def _neighbor(rows, cols, dy, dx, height, width):
+    """Flat index of the (dy, dx) neighbours, -1 outside the raster."""
+    rr, cc = rows + dy, cols + dx
+    inside = (rr >= 0) & (rr < height) & (cc >= 0) & (cc < width)
+    return np.where(inside, rr * width + cc, -1)
+
+
+def _jump(pointer, value=None, reduce=np.maximum):
+    """
+    Pointer jumping to the root of every node. With `value`, also reduces
+    the values along each path. The root must point to itself.
+    """
+    while True:
+        if value is not None:
+            value = reduce(value, value[pointer])
+        jumped = pointer[pointer]
+        if np.array_equal(jumped, pointer):
+            return pointer, value
+        pointer = jumped
+
+
+def flood_tree(dem, outlets=None):
+    """
+    Flood tree of a DEM. Returns a dict:
+    - cells: flat indices of the nodes (cells not in `outlets`)
+    - parent: parent node of each node, len(cells) for the sea
+    - filled: filled elevation (spill level) of each node
+    - shape
+    """
+    if outlets is None:
+        outlets = ocean_mask(dem)
+    height, width = dem.shape
+    z = dem.ravel()
+    cells = np.flatnonzero(~outlets.ravel())
+    n = len(cells)
+    if n == 0:
+        return {"cells": cells, "parent": cells, "filled": np.zeros(0), "shape": dem.shape}
+
+    node = np.full(z.size, n, dtype=np.int64)  # n: the sea
+    node[cells] = np.arange(n)
+    zc = z[cells].astype(np.float64)
+    rows, cols = np.divmod(cells, width)
+
+    # csgraph ignores zero weights
+    offset = 1.0 - min(zc.min(), 0.0)
+
+    src, dst, weight = [], [], []
+    for dy, dx in HALF_NEIGHBORS:
+        nb = _neighbor(rows, cols, dy, dx, height, width)
+        nb_node = np.where(nb >= 0, node[nb], n)
+        keep = np.flatnonzero(nb_node < n)
+        src.append(keep)
+        dst.append(nb_node[keep])
+        weight.append(np.maximum(zc[keep], zc[nb_node[keep]]) + offset)
+
+    # Cells next to an outlet or on the raster edge drain to the sea
+    exits = np.zeros(n, dtype=bool)
+    for dy, dx in NEIGHBORS:
+        nb = _neighbor(rows, cols, dy, dx, height, width)
+        exits |= (nb < 0) | (node[np.maximum(nb, 0)] == n)
+    exit_nodes = np.flatnonzero(exits)
+    src.append(exit_nodes)
+    dst.append(np.full(len(exit_nodes), n))
+    weight.append(zc[exit_nodes] + offset)
+
+    graph = csr_matrix(
+        (np.concatenate(weight), (np.concatenate(src), np.concatenate(dst))),
+        shape=(n + 1, n + 1)
+    )
+    tree = minimum_spanning_tree(graph)
+    _, predecessors = breadth_first_order(tree, n, directed=False, return_predecessors=True)
+
+    parent = predecessors.astype(np.int64)
+    parent[n] = n
+    # Filled elevation: highest cell on the path to the sea
+    _, filled = _jump(parent, np.append(zc, -np.inf))
+    return {"cells": cells, "parent": parent[:n], "filled": filled[:n], "shape": dem.shape}
+
+
+def filled_dem(tree, dem):
+    """Depression-filled DEM (outlet cells keep their elevation)."""
+    filled = np.array(dem, dtype=np.float32)
+    filled.ravel()[tree["cells"]] = tree["filled"]
+    return filled
+
+
+def receivers(tree):
+    """D8 receiver of every cell (flat index), -1 for the sea and the outlets."""
+    cells, parent = tree["cells"], tree["parent"]
+    receiver = np.full(int(np.prod(tree["shape"])), -1, dtype=np.int64)
+    receiver[cells] = np.where(parent < len(cells), cells[np.minimum(parent, len(cells) - 1)], -1)
+    return receiver.reshape(tree["shape"])
+
+
+def flow_hand(tree, dem, drains, sea_level=0.0):
+    """
+    HAND along the flow paths: height of every cell above the first drain
+    cell (river) its flow path reaches, or above the sea level when it
+    reaches the sea first. Outlet cells are 0.
+    """
+    cells, parent = tree["cells"], tree["parent"]
+    n = len(cells)
+    hand = np.zeros(tree["shape"], dtype=np.float32)
+    if n == 0:
+        return hand
+
+    # Drain cells are the roots of their own paths
+    is_drain = np.append(drains.ravel()[cells] > 0, True)
+    pointer = np.where(is_drain, np.arange(n + 1), np.append(parent, n))
+    drain, _ = _jump(pointer)
+
+    zc = dem.ravel()[cells].astype(np.float64)
+    base = np.append(zc, sea_level)[drain[:n]]
+    hand.ravel()[cells] = np.maximum(zc - base, 0)
+    return hand
+
+
+def exit_cells(tree):
+    """
+    Exit cell of the flood path of every node: the last node before the
+    sea (a cell next to an outlet or on the raster edge).
+    """
+    parent = tree["parent"]
+    pointer = np.where(parent == len(parent), np.arange(len(parent)), parent)
+    root, _ = _jump(pointer)
+    return root
+
+
+def min_links(a, b, level):
+    """Undirected links (a, b, level) without duplicates, the lowest level of each pair kept."""
+    a, b = np.minimum(a, b), np.maximum(a, b)
+    order = np.lexsort((level, b, a))
+    a, b, level = a[order], b[order], level[order]
+    first = np.ones(len(a), dtype=bool)
+    first[1:] = (a[1:] != a[:-1]) | (b[1:] != b[:-1])
+    return a[first], b[first], level[first]
+
+
+def label_links(labels, levels):
+    """
+    Links between the labels of 8-neighbour cells: (label a, label b, level)
+    with the level max(levels) of the two cells, the lowest over the pairs
+    of cells of each couple of labels.
+    """
+    height, width = labels.shape
+    a, b, level = [], [], []
+    for dy, dx in HALF_NEIGHBORS:
+        src = (slice(0, height - dy), slice(max(0, -dx), width - max(0, dx)))
+        dst = (slice(dy, height), slice(max(0, dx), width - max(0, -dx)))
+        differ = labels[src] != labels[dst]
+        a.append(labels[src][differ])
+        b.append(labels[dst][differ])
+        level.append(np.maximum(levels[src][differ], levels[dst][differ]))
+    return min_links(np.concatenate(a), np.concatenate(b), np.concatenate(level))
+
+
+def minimax_levels(a, b, level, root):
+    """
+    Minimax level from `root` of every node of an undirected graph given
+    by its links: the lowest, over the paths to the root, of the highest
+    link level. Returns (sorted node ids, their levels, -inf for the root).
+    """
+    nodes = np.union1d(np.union1d(a, b), [root])
+    src, dst = np.searchsorted(nodes, a), np.searchsorted(nodes, b)
+    start = np.searchsorted(nodes, root)
+
+    # The tree only depends on the order of the levels: ranks as weights
+    # (csgraph ignores zero weights), the exact levels looked up after
+    values, rank = np.unique(level, return_inverse=True)
+    graph = csr_matrix((rank + 1.0, (src, dst)), shape=(len(nodes), len(nodes)))
+    tree = minimum_spanning_tree(graph)
+    tree = (tree + tree.T).tocsr()
+    _, predecessors = breadth_first_order(tree, start, directed=False, return_predecessors=True)
+
+    parent = predecessors.astype(np.int64)
+    parent[start] = start
+    linked = parent >= 0
+    parent[~linked] = np.flatnonzero(~linked)
+    level_up = np.full(len(nodes), -np.inf)
+    children = np.flatnonzero(linked)
+    children = children[children != start]
+    level_up[children] = values[np.asarray(tree[children, parent[children]]).ravel().astype(np.int64) - 1]
+    level_up[~linked] = np.inf  # not connected to the root
+    _, levels = _jump(parent, level_up)
+    return nodes, levels
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Profile scoring from the precomputed travel-cost rasters (accessibility.py).
+
+A profile (public/data/profiles/*.json) is a weighted sum of per-amenity
+decay scores, `weight` being the range in km. The decay functions are the
+ones of calculateHeatmap() in heatmap.js:
+- linear: 1 - cost / range, 0 beyond the range
+- exponential: exp(-cost / range), up to range * roadFactor * 5
+- constant: 1 within the range
+
+Scoring is a few array operations per amenity on the cost rasters, done by
+chunks of rows to bound the temporaries.
+"""
+
+import argparse
+import json
+import time
+import numpy as np
+from pathlib import Path
+from scipy.ndimage import maximum_filter
+
+from accessibility import ACCESS_DIR, POPULATION_BASE, friction_key, load_region_grid
+from grid_io import read_grid, grid_values
+from grid_regions import PUBLIC_DATA_DIR, region_grids, assemble_global
+
+PROFILES_DIR = PUBLIC_DATA_DIR / "profiles"
+
+DECAY_TYPES = ('linear', 'exponential', 'constant')
+CHUNK_ROWS = 128
+
+# Land = populated cells dilated by ~2km, as in heatmap.js
+LAND_DILATE_RADIUS = 10  # pixels
+
+
+def load_profile(profile):
+    """Load a profile from its id (profiles/<id>.json) or a path."""
+    path = Path(profile)
+    if not path.suffix:
+        path = PROFILES_DIR / f"{profile}.json"
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def profile_settings(profile):
+    """Decay type, road factor and friction source of a profile (app defaults)."""
+    settings = profile.get("heatmapSettings") or {}
+    return {
+        "type": settings.get("type", "linear"),
+        "roadFactor": float(settings.get("roadFactor", 1.0)),
+        "frictionSource": settings.get("frictionSource", "population"),
+    }
+
+
+def scored_amenities(profile):
+    """[(amenity, range in meters)] of the amenities that contribute."""
+    return [
+        (name, cfg["weight"] * 1000.0)
+        for name, cfg in (profile.get("amenities") or {}).items()
+        if cfg.get("score") and cfg.get("weight", 0) > 0
+    ]
+
+
+def decay(cost, range_m, decay_type='linear', max_scan=np.inf):
+    """Score of each cell for one amenity, from its travel cost."""
+    if decay_type == 'constant':
+        val = (cost < range_m).astype(np.float32)
+    elif decay_type == 'exponential':
+        val = np.exp(-cost / np.float32(range_m))
+    else:
+        val = np.maximum(0, 1 - cost / np.float32(range_m))
+    val[cost > max_scan] = 0
+    return val
+
+
+def land_mask(population, radius=LAND_DILATE_RADIUS):
+    """Populated cells dilated by a square of `radius` pixels."""
+    if population is None:
+        return None
+    return maximum_filter(population > 0, size=2 * radius + 1, mode='constant', cval=False)
+
+
+def load_cost_raster(key, amenity, region, access_dir=ACCESS_DIR):
+    path = Path(access_dir) / key / f"{amenity}.{region['name']}.grid"
+    if not path.exists():
+        raise FileNotFoundError(f"Missing cost raster {path}, run accessibility.py for '{key}'")
+    header, raw = read_grid(path)
+    return grid_values(header, raw)
+
+
+def score_region(region, amenities, settings, access_dir=ACCESS_DIR, chunk_rows=CHUNK_ROWS):
+    """Accumulated profile score of one region (float32 array)."""
+    key = friction_key(settings["frictionSource"], settings["roadFactor"])
+    scan_factor = settings["roadFactor"] * (5 if settings["type"] == 'exponential' else 1.5)
+
+    height, width = region['height'], region['width']
+    scores = np.zeros((height, width), dtype=np.float32)
+
+    costs = [(load_cost_raster(key, amenity, region, access_dir), range_m)
+             for amenity, range_m in amenities]
+
+    for y in range(0, height, chunk_rows):
+        rows = slice(y, min(height, y + chunk_rows))
+        for cost, range_m in costs:
+            scores[rows] += decay(cost[rows], range_m, settings["type"], range_m * scan_factor)
+
+    return scores
+
+
+def compute_land_masks():
+    """Land mask of every region ({region name: bool array})."""
+    land_masks = {}
+    for region in region_grids():
+        mask = land_mask(load_region_grid(POPULATION_BASE, region))
+        if mask is None:
+            # No population data, assume everywhere is land
+            mask = np.ones((region['height'], region['width']), dtype=bool)
+        land_masks[region['name']] = mask
+    return land_masks
+
+
+def score_profile(profile, access_dir=ACCESS_DIR, chunk_rows=CHUNK_ROWS, land_masks=None):
+    """
+    Score a profile (dict, id or path) on every region.
+    Returns (scores, max_score, land_masks), scores and land_masks being
+    {region name: array}. Precomputed land masks can be passed to avoid
+    the dilation when scoring many profiles.
+    """
+    if not isinstance(profile, dict):
+        profile = load_profile(profile)
+
+    settings = profile_settings(profile)
+    amenities = scored_amenities(profile)
+
+    scores = {}
+    for region in region_grids():
+        scores[region['name']] = score_region(region, amenities, settings, access_dir, chunk_rows)
+
+    if land_masks is None:
+        land_masks = compute_land_masks()
+
+    max_score = float(max((s.max() for s in scores.values()), default=0.0))
+    return scores, max_score, land_masks
+
+
+def score_profile_global(profile, access_dir=ACCESS_DIR):
+    """Same as score_profile, assembled on the full GRID_BBOX grid of the app."""
+    scores, max_score, land_masks = score_profile(profile, access_dir)
+    return (assemble_global(scores, fill=0.0), max_score,
+            assemble_global(land_masks, fill=0, dtype=np.uint8))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score a profile from the cost rasters")
+    parser.add_argument("profile", help="Profile id (profiles/<id>.json) or path")
+    args = parser.parse_args()
+
+    profile = load_profile(args.profile)
+    t0 = time.time()
+    scores, max_score, land_masks = score_profile(profile)
+    elapsed = (time.time() - t0) * 1000
+
+    settings = profile_settings(profile)
+    print(f"Profile '{profile.get('id', args.profile)}' ({settings['type']}, "
+          f"{friction_key(settings['frictionSource'], settings['roadFactor'])}): "
+          f"{len(scored_amenities(profile))} amenities, maxScore={max_score:.3f} ({elapsed:.1f} ms)")
@@ -0,0 +1,256 @@
+"""
+Aligned raster store shared by the pipeline stages.
+
+A store is a directory holding full-precision bands on one grid (CRS,
+transform and size, recorded in store.json), one GeoTIFF per band:
+- layout 'tiled': 256x256 tiles, DEFLATE compressed, for windowed reads
+- layout 'mmap': uncompressed contiguous strips, the band is memory
+  mapped (band_memmap): read_band slices the map instead of decoding, and
+  the workers of a pool share the pages of the same file
+Every band gets internal overviews (finalize_band), so a reduced
+resolution can be read without touching the full band.
+
+Stores:
+- flood: the DEM grid (Web Mercator) of generate_flood_model.py
+- app_<region>: the region grids of the app (grid_regions.py), north-up
+
+A band derived from files (e.g. a mask rasterized from a GeoJSON) can be
+registered with the content hash of its inputs ("fingerprint"), and is only
+rebuilt when they change (band_current).
+
+The PNGs and .grid files of the app are exports of these bands.
+"""
+
+import json
+import os
+import shutil
+import numpy as np
+import rasterio
+from pathlib import Path
+from rasterio.enums import Resampling
+from rasterio.transform import Affine
+from rasterio.windows import Window
+
+STORE_DIR = Path(__file__).parent.parent / "data" / "store"
+MANIFEST = "store.json"
+
+LAYOUTS = ('tiled', 'mmap')
+TILE_SIZE = 256
+STRIP_ROWS = 512
+
+# Overview resampling of categorical bands (ids, classes)
+CATEGORICAL = 'nearest'
+
+
+def store_path(name):
+    return STORE_DIR / name
+
+
+def load_manifest(path):
+    manifest_path = Path(path) / MANIFEST
+    if not manifest_path.exists():
+        return None
+    with open(manifest_path, "r") as f:
+        return json.load(f)
+
+
+def save_manifest(path, manifest):
+    manifest_path = Path(path) / MANIFEST
+    tmp = manifest_path.with_suffix(".tmp")
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, manifest_path)
+
+
+def grid_of(profile):
+    """JSON description of the grid of a rasterio profile."""
+    return {
+        "crs": rasterio.crs.CRS.from_user_input(profile["crs"]).to_string(),
+        "transform": list(profile["transform"])[:6],
+        "width": int(profile["width"]),
+        "height": int(profile["height"]),
+    }
+
+
+def create_store(path, profile):
+    """
+    Open a store on the grid of `profile`, created if needed. The bands of
+    an existing store on another grid are dropped. Returns the manifest.
+    """
+    path = Path(path)
+    grid = grid_of(profile)
+    manifest = load_manifest(path)
+    if manifest is not None and manifest["grid"] != grid:
+        shutil.rmtree(path)
+        manifest = None
+    if manifest is None:
+        path.mkdir(parents=True, exist_ok=True)
+        manifest = {"grid": grid, "bands": {}}
+        save_manifest(path, manifest)
+    return manifest
+
+
+def store_profile(path):
+    """Rasterio profile (crs, transform, size) of the grid of a store."""
+    grid = load_manifest(path)["grid"]
+    return {
+        "crs": grid["crs"],
+        "transform": Affine(*grid["transform"]),
+        "width": grid["width"],
+        "height": grid["height"],
+    }
+
+
+def band_path(path, band):
+    return Path(path) / f"{band}.tif"
+
+
+def has_band(path, band):
+    manifest = load_manifest(path)
+    return bool(manifest and band in manifest["bands"] and band_path(path, band).exists())
+
+
+def band_current(path, band, fingerprint):
+    """True if the band exists and was registered as built from `fingerprint`."""
+    return has_band(path, band) and load_manifest(path)["bands"][band].get("fingerprint") == fingerprint
+
+
+def band_profile(path, dtype, count=1, layout='tiled'):
+    """GeoTIFF creation profile of a band of the store."""
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unknown layout '{layout}', expected one of {LAYOUTS}")
+    profile = dict(store_profile(path), driver="GTiff", dtype=dtype, count=count, nodata=None)
+    if layout == 'tiled':
+        profile.update(tiled=True, blockxsize=TILE_SIZE, blockysize=TILE_SIZE, compress="deflate",
+                       predictor=3 if np.dtype(dtype).kind == 'f' else 2)
+    else:
+        profile.update(tiled=False, interleave="band")
+    return profile
+
+
+def register_band(path, band, **entry):
+    manifest = load_manifest(path)
+    manifest["bands"][band] = dict(manifest["bands"].get(band, {}), **entry)
+    save_manifest(path, manifest)
+
+
+def create_band(path, band, dtype, count=1, layout='tiled', description=None):
+    """
+    Open a band for writing (rasterio dataset, to close by the caller).
+    'mmap' bands are filled with zeros and closed first (GDAL only lays out
+    the empty strips on close), so the strips stay contiguous whatever the
+    order of the windowed writes.
+    """
+    tif = band_path(path, band)
+    dst = rasterio.open(tif, "w", **band_profile(path, dtype, count, layout))
+    if layout == 'mmap':
+        with dst:
+            zeros = np.zeros((count, min(STRIP_ROWS, dst.height), dst.width), dtype=dtype)
+            for row in range(0, dst.height, STRIP_ROWS):
+                rows = min(STRIP_ROWS, dst.height - row)
+                dst.write(zeros[:, :rows], window=Window(0, row, dst.width, rows))
+        dst = rasterio.open(tif, "r+")
+    register_band(path, band, dtype=np.dtype(dtype).name, count=count, layout=layout,
+                  description=description or band, overviews=[], fingerprint=None)
+    return dst
+
+
+def overview_factors(width, height, min_size=TILE_SIZE):
+    factors = []
+    factor = 2
+    while max(width, height) // factor >= min_size:
+        factors.append(factor)
+        factor *= 2
+    return factors
+
+
+def finalize_band(path, band, resampling='average'):
+    """Build the internal overviews of a band."""
+    with rasterio.open(band_path(path, band), "r+") as dst:
+        factors = overview_factors(dst.width, dst.height)
+        if factors:
+            dst.build_overviews(factors, Resampling[resampling])
+    register_band(path, band, overviews=factors, resampling=resampling)
+
+
+def write_band(path, band, values, layout='tiled', description=None, resampling='average'):
+    """Write a whole band (2D array, or 3D for several channels) with its overviews."""
+    values = np.asarray(values)
+    count = 1 if values.ndim == 2 else values.shape[0]
+    with create_band(path, band, values.dtype, count, layout, description) as dst:
+        if values.ndim == 2:
+            dst.write(values, 1)
+        else:
+            dst.write(values)
+    finalize_band(path, band, resampling)
+    return band_path(path, band)
+
+
+def write_window(path, band, values, window):
+    """Overwrite a window of a single-band band in place, then rebuild its overviews."""
+    resampling = load_manifest(path)["bands"][band].get("resampling", 'average')
+    with rasterio.open(band_path(path, band), "r+") as dst:
+        dst.write(np.asarray(values, dtype=dst.dtypes[0]), 1, window=window)
+    finalize_band(path, band, resampling)
+    return band_path(path, band)
+
+
+def read_band(path, band, window=None, overview=None, bidx=1):
+    """
+    Values of a band, or of a window of it. `overview` reads the reduced
+    resolution band (factor 2 ** overview, window in its own pixels).
+    A single-band 'mmap' band is copied from its memory map.
+    """
+    entry = load_manifest(path)["bands"].get(band, {})
+    if not overview and bidx == 1 and entry.get("layout") == 'mmap' and entry.get("count") == 1:
+        values = band_memmap(path, band)
+        return np.array(values if window is None else values[window.toslices()])
+    kwargs = {} if not overview else {"overview_level": overview - 1}
+    with rasterio.open(band_path(path, band), **kwargs) as src:
+        return src.read(bidx, window=window)
+
+
+def band_array(path, band):
+    """Whole single-band band: its memory map for a 'mmap' band (no copy), read otherwise."""
+    entry = load_manifest(path)["bands"][band]
+    if entry.get("layout") == 'mmap' and entry.get("count") == 1:
+        return band_memmap(path, band)
+    return read_band(path, band)
+
+
+def band_strips(path, bands, strip_rows=STRIP_ROWS):
+    """Strips of several bands ({band: array}), from top to bottom."""
+    datasets = {band: rasterio.open(band_path(path, band)) for band in bands}
+    try:
+        first = next(iter(datasets.values()))
+        for row in range(0, first.height, strip_rows):
+            window = Window(0, row, first.width, min(strip_rows, first.height - row))
+            yield {band: src.read(1, window=window) for band, src in datasets.items()}
+    finally:
+        for src in datasets.values():
+            src.close()
+
+
+def band_memmap(path, band, mode='r'):
+    """
+    Memory-mapped (height, width) array of a single-band 'mmap' band: its
+    uncompressed strips must be contiguous (create_band lays them out).
+    """
+    entry = load_manifest(path)["bands"][band]
+    if entry["layout"] != 'mmap' or entry["count"] != 1:
+        raise ValueError(f"Band '{band}' is not a single-band 'mmap' band")
+
+    tif = band_path(path, band)
+    with rasterio.open(tif) as src:
+        if src.compression is not None or src.is_tiled:
+            raise ValueError(f"Band '{band}' is not stored in uncompressed strips")
+        rows_per_strip = src.block_shapes[0][0]
+        n_strips = -(-src.height // rows_per_strip)
+        first = int(src.get_tag_item('BLOCK_OFFSET_0_0', 'TIFF', bidx=1))
+        last = int(src.get_tag_item(f'BLOCK_OFFSET_0_{n_strips - 1}', 'TIFF', bidx=1))
+        height, width = src.height, src.width
+
+    dtype = np.dtype(entry["dtype"]).newbyteorder('<')
+    if last - first != (n_strips - 1) * rows_per_strip * width * dtype.itemsize:
+        raise ValueError(f"Band '{band}' strips are not contiguous")
+    return np.memmap(tif, dtype=dtype, mode=mode, offset=first, shape=(height, width))
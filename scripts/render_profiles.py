@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Batch renderer: accessibility scores and overlays for every saved profile.
+
+Profiles are listed in public/data/profiles/index.json. Missing travel-cost
+rasters are computed first (accessibility.py), then the profiles are scored
+in parallel in a process pool. The cost and population grids are memory
+mapped (grid_io.read_grid), so the workers share the OS page cache instead
+of each holding its own copy, and the land masks are computed once and
+handed to each worker at start-up.
+
+Outputs in public/data/scores/:
+- <profile>.<region>.grid: score grid (see grid_io.py)
+- <profile>.<region>.png: overlay, same colors as the app heatmap
+- index.json: maxScore, image bounds and timing per profile
+"""
+
+import argparse
+import json
+import os
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from PIL import Image
+
+from accessibility import ACCESS_DIR, compute_cost_rasters, friction_key
+from grid_io import save_grid_outputs
+from grid_regions import PUBLIC_DATA_DIR, region_grids
+from profile_scoring import (PROFILES_DIR, compute_land_masks, load_profile, profile_settings,
+                             score_profile, scored_amenities)
+
+SCORES_DIR = PUBLIC_DATA_DIR / "scores"
+
+# Overlay opacity of the app heatmap (~0.6)
+OVERLAY_ALPHA = 150
+
+
+def list_profiles(profiles_dir=PROFILES_DIR):
+    """Profile ids of index.json, or every profile file if there is no index."""
+    index_path = Path(profiles_dir) / "index.json"
+    if index_path.exists():
+        with open(index_path, "r", encoding="utf-8") as f:
+            return json.load(f).get("profiles", [])
+    return sorted(p.stem for p in Path(profiles_dir).glob("*.json"))
+
+
+def ensure_cost_rasters(profiles, access_dir=ACCESS_DIR):
+    """Compute the cost rasters the profiles need and that do not exist yet."""
+    missing = {}
+    for profile in profiles:
+        settings = profile_settings(profile)
+        key = friction_key(settings["frictionSource"], settings["roadFactor"])
+        for amenity, _ in scored_amenities(profile):
+            paths = [Path(access_dir) / key / f"{amenity}.{r['name']}.grid" for r in region_grids()]
+            if not all(p.exists() for p in paths):
+                entry = missing.setdefault(key, (settings["frictionSource"], settings["roadFactor"], set()))
+                entry[2].add(amenity)
+
+    for source, road_factor, amenities in missing.values():
+        compute_cost_rasters(sorted(amenities), source, road_factor, output_dir=access_dir)
+
+
+def score_to_rgba(scores, max_score, land):
+    """
+    RGBA overlay (north-up) of a score grid (row 0 = minLat), with the ramp
+    of the app: hue from 240 (blue, low) to 0 (red, high), on land only.
+    """
+    norm = np.minimum(1.0, scores / (max_score or 1.0))
+    hue = (1.0 - norm) * 240.0
+
+    # HSL to RGB with full saturation and 50% lightness
+    h = hue / 60.0
+    x = 1.0 - np.abs(h % 2 - 1.0)
+    sector = np.floor(h).astype(np.int8)
+    r = np.select([sector == 0, sector == 1, sector == 2, sector == 3], [1.0, x, 0.0, 0.0], default=x)
+    g = np.select([sector == 0, sector == 1, sector == 2, sector == 3], [x, 1.0, 1.0, x], default=0.0)
+    b = np.select([sector == 0, sector == 1, sector == 2, sector == 3], [0.0, 0.0, x, 1.0], default=1.0)
+
+    rgba = np.zeros(scores.shape + (4,), dtype=np.uint8)
+    rgba[..., 0] = (r * 255).astype(np.uint8)
+    rgba[..., 1] = (g * 255).astype(np.uint8)
+    rgba[..., 2] = (b * 255).astype(np.uint8)
+    rgba[..., 3] = np.where(land & (scores > 0), OVERLAY_ALPHA, 0).astype(np.uint8)
+    return np.flipud(rgba)
+
+
+_land_masks = None
+
+
+def _init_worker(land_masks):
+    global _land_masks
+    _land_masks = land_masks
+
+
+def render_profile(profile_id, output_dir=SCORES_DIR, access_dir=ACCESS_DIR):
+    """Score one profile and write its grids and overlays. Returns its index entry."""
+    t0 = time.time()
+    profile = load_profile(profile_id)
+    scores, max_score, land_masks = score_profile(profile, access_dir, land_masks=_land_masks)
+    score_time = time.time() - t0
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    regions = {}
+    for region in region_grids():
+        name = region['name']
+        base = f"{profile_id}.{name}"
+        save_grid_outputs(output_dir / f"{base}.grid", scores[name], region, max_score=max_score,
+                          fmt='binary', region=name, x0=region['x0'], y0=region['y0'])
+        Image.fromarray(score_to_rgba(scores[name], max_score, land_masks[name]), 'RGBA').save(
+            output_dir / f"{base}.png", optimize=True)
+        regions[name] = {
+            "grid": f"{base}.grid",
+            "png": f"{base}.png",
+            "bounds": [[region['minLat'], region['minLon']], [region['maxLat'], region['maxLon']]],
+        }
+
+    return {
+        "id": profile_id,
+        "maxScore": max_score,
+        "regions": regions,
+        "scoreSeconds": round(score_time, 4),
+        "totalSeconds": round(time.time() - t0, 4),
+    }
+
+
+def render_all(profile_ids=None, workers=None, output_dir=SCORES_DIR, access_dir=ACCESS_DIR):
+    profile_ids = profile_ids or list_profiles()
+    print(f"=== Rendering {len(profile_ids)} profiles ===")
+
+    t0 = time.time()
+    ensure_cost_rasters([load_profile(p) for p in profile_ids], access_dir)
+    land_masks = compute_land_masks()
+    print(f"Inputs ready ({time.time() - t0:.2f}s)")
+
+    workers = workers or os.cpu_count()
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(land_masks,)) as executor:
+        futures = {executor.submit(render_profile, p, output_dir, access_dir): p for p in profile_ids}
+        for future in as_completed(futures):
+            profile_id = futures[future]
+            try:
+                entry = future.result()
+            except Exception as e:
+                print(f"ERROR {profile_id}: {e}")
+                continue
+            results[profile_id] = entry
+            print(f"✔ {profile_id}: maxScore={entry['maxScore']:.3f}, "
+                  f"score {entry['scoreSeconds'] * 1000:.1f} ms, total {entry['totalSeconds'] * 1000:.1f} ms")
+
+    index_path = Path(output_dir) / "index.json"
+    index_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(index_path, "w") as f:
+        json.dump({"profiles": [results[p] for p in profile_ids if p in results]}, f, indent=2)
+
+    print(f"Rendered {len(results)}/{len(profile_ids)} profiles in {time.time() - t0:.2f}s ({workers} workers)")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render accessibility scores for all saved profiles")
+    parser.add_argument("profiles", nargs="*", help="Profile ids (default: profiles/index.json)")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores)")
+    args = parser.parse_args()
+
+    render_all(args.profiles, workers=args.workers)
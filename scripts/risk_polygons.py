@@ -0,0 +1,244 @@
+"""
+Tiled polygonization of the risk raster (vector model of the flood zones).
+
+The risk band is cut in tiles polygonized in a process pool
+(rasterio.features.shapes), in pixel coordinates, so the edges of two tiles
+share exactly the same vertices. A polygon touching an inner tile edge may
+continue in the next tile: these are kept aside and merged per risk class
+(union) once all the tiles are done, the others are final as soon as their
+tile is.
+
+Every final polygon is reprojected to WGS84 and streamed to the full
+resolution GeoJSON (the legacy flood_model.geojson), so the features are
+never all held in memory. The zoom bands are simplified in the same tiles,
+with a tolerance of half a pixel at the highest zoom of the band, each tile
+as one coverage (shapely.coverage_simplify): the edge shared by two polygons
+(the High zone inside a Medium one) is simplified once for both, so the
+classes stay watertight, without the gaps and overlaps of simplifying every
+polygon on its own. The no-risk background is part of the tile coverage, so
+the only edges left as they are (simplify_boundary=False) are the tile edges:
+the pieces of a polygon cut by a seam still match and are merged like the
+full resolution ones. The boundaries of a tile are noded together first, so
+that neighbours share their vertices.
+
+Needs shapely>=2.1 (coverage_simplify).
+
+Outputs next to `output_file`:
+- flood_model.geojson: full resolution
+- flood_model.z<min>-<max>.geojson: one per simplified zoom band
+- flood_model.json: index of the bands (zooms, tolerance, file, features)
+"""
+
+import json
+import numpy as np
+import rasterio
+import shapely
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from pyproj import Transformer
+from rasterio.features import shapes
+from rasterio.windows import Window
+from shapely import affinity
+from shapely.geometry import mapping, shape
+
+RISK_LEVELS = {2: "High", 1: "Medium"}
+VECTOR_TILE_SIZE = 2048
+# Simplified zoom bands (min, max); the full resolution covers the rest
+ZOOM_BANDS = [(8, 10), (11, 12), (13, 14)]
+WEB_MERCATOR_PIXEL_M = 2 * 20037508.342789244 / 256  # pixel size at zoom 0
+COORD_DECIMALS = 6  # ~0.1 m in degrees
+
+
+def band_tolerance(max_zoom):
+    """Simplification tolerance (m): half a map pixel at the band max zoom."""
+    return WEB_MERCATOR_PIXEL_M / 2 ** max_zoom / 2
+
+
+def vector_bands(pixel_size, zoom_bands=ZOOM_BANDS):
+    """
+    Bands {name: (min zoom, max zoom, tolerance in raster pixels)}, only
+    those coarser than the raster, plus the full resolution "full".
+    """
+    bands = {}
+    for min_zoom, max_zoom in zoom_bands:
+        tolerance = band_tolerance(max_zoom) / pixel_size
+        if tolerance >= 1:
+            bands[f"z{min_zoom}-{max_zoom}"] = (min_zoom, max_zoom, tolerance)
+    finest = max((band[1] for band in bands.values()), default=-1)
+    bands["full"] = (finest + 1, None, 0.0)
+    return bands
+
+
+def tile_coverage(risk, offset):
+    """
+    Polygons of every class of a tile, the background (0) included, as a
+    valid coverage: the polygonized boundaries are noded together, so that a
+    straight edge gets the vertices where its neighbours meet. Returns
+    (polygons, codes).
+    """
+    regions = np.array([shape(geometry) for geometry, _ in shapes(risk, transform=offset)])
+    lines = shapely.node(shapely.multilinestrings(shapely.get_parts(shapely.boundary(regions))))
+    polygons = shapely.get_parts(shapely.polygonize(shapely.get_parts(lines)))
+    # Class of each polygon: the pixel under a point inside it
+    inside = shapely.point_on_surface(polygons)
+    rows = np.floor(shapely.get_y(inside) - offset.f).astype(int)
+    cols = np.floor(shapely.get_x(inside) - offset.c).astype(int)
+    return polygons, risk[rows, cols]
+
+
+def polygonize_tile(risk_path, window, tolerances):
+    """
+    Polygons ({band: [(WKB, code)]}) of a tile, in raster pixel coordinates,
+    split into final ones and the ones touching an inner tile edge (seams).
+    `tolerances` is {band: tolerance in pixels}, 0 for the full resolution.
+    """
+    with rasterio.open(risk_path) as src:
+        risk = src.read(1, window=window)
+        height, width = src.height, src.width
+
+    col0, row0 = window.col_off, window.row_off
+    col1, row1 = col0 + window.width, row0 + window.height
+    offset = rasterio.Affine.translation(col0, row0)
+
+    def on_seam(polygon):
+        min_x, min_y, max_x, max_y = polygon.bounds
+        return ((min_x == col0 and col0 > 0) or (max_x == col1 and col1 < width) or
+                (min_y == row0 and row0 > 0) or (max_y == row1 and row1 < height))
+
+    final, seams = {band: [] for band in tolerances}, {band: [] for band in tolerances}
+    simplified = {band: tolerance for band, tolerance in tolerances.items() if tolerance}
+    if "full" in tolerances:
+        for geometry, code in shapes(risk, mask=risk > 0, transform=offset):
+            polygon = shape(geometry)
+            (seams if on_seam(polygon) else final)["full"].append((shapely.to_wkb(polygon), int(code)))
+
+    if simplified and risk.any():
+        polygons, codes = tile_coverage(risk, offset)
+        risky = codes > 0
+        tile_seams = [on_seam(polygon) for polygon in polygons[risky]]
+        for band, tolerance in simplified.items():
+            # The tile edges (the boundary of the coverage) are kept as they are
+            simple = shapely.coverage_simplify(polygons, tolerance, simplify_boundary=False)[risky]
+            for polygon, code, seam in zip(simple, codes[risky], tile_seams):
+                (seams if seam else final)[band].append((shapely.to_wkb(polygon), int(code)))
+    return final, seams
+
+
+def plan_tiles(height, width, tile_size):
+    return [Window(col, row, min(tile_size, width - col), min(tile_size, height - row))
+            for row in range(0, height, tile_size) for col in range(0, width, tile_size)]
+
+
+def run_tiles(risk_path, tiles, tolerances, workers=1):
+    """(final, seams) polygons of every tile, in completion order."""
+    if workers <= 1 or len(tiles) == 1:
+        for window in tiles:
+            yield polygonize_tile(risk_path, window, tolerances)
+        return
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(tiles))) as executor:
+        futures = [executor.submit(polygonize_tile, str(risk_path), window, tolerances) for window in tiles]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def merge_seams(seams):
+    """Union of the seam polygons of each class, split back into polygons."""
+    for code in sorted({code for _, code in seams}):
+        merged = shapely.union_all(shapely.from_wkb([wkb for wkb, c in seams if c == code]))
+        for polygon in shapely.get_parts(merged):
+            yield polygon, code
+
+
+class FeatureWriter:
+    """GeoJSON FeatureCollection written feature by feature."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.count = 0
+        self.file = open(self.path, "w")
+        self.file.write('{"type":"FeatureCollection","features":[\n')
+
+    def write(self, feature):
+        if self.count:
+            self.file.write(",\n")
+        self.file.write(json.dumps(feature, separators=(",", ":")))
+        self.count += 1
+
+    def close(self):
+        self.file.write("\n]}\n")
+        self.file.close()
+
+
+def band_path(output_file, band):
+    output_file = Path(output_file)
+    if band == "full":
+        return output_file
+    return output_file.with_name(f"{output_file.stem}.{band}{output_file.suffix}")
+
+
+def vectorize_risk(risk_path, output_file, tile_size=VECTOR_TILE_SIZE, workers=1, zoom_bands=ZOOM_BANDS):
+    """
+    Polygons of the risk zones (legacy vector model), in WGS84, one GeoJSON
+    per zoom band. Returns the index of the bands.
+    """
+    with rasterio.open(risk_path) as src:
+        height, width = src.height, src.width
+        transform, crs = src.transform, src.crs
+
+    bands = vector_bands(abs(transform.a), zoom_bands)
+    tolerances = {band: tolerance for band, (_, _, tolerance) in bands.items()}
+    if any(tolerances.values()) and not hasattr(shapely, "coverage_simplify"):
+        raise RuntimeError(f"The simplified zoom bands need shapely>=2.1 (coverage_simplify), "
+                           f"shapely {shapely.__version__} is installed")
+    to_wgs84 = Transformer.from_crs(crs, "EPSG:4326", always_xy=True)
+    # Pixel coordinates to the raster CRS (shapely affine order)
+    pixel_to_crs = [transform.a, transform.b, transform.d, transform.e, transform.c, transform.f]
+
+    def reproject(coords):
+        x, y = to_wgs84.transform(coords[:, 0], coords[:, 1])
+        return np.round(np.column_stack([x, y]), COORD_DECIMALS)
+
+    writers = {band: FeatureWriter(band_path(output_file, band)) for band in bands}
+
+    def write(band, polygon, code):
+        if polygon.is_empty:
+            return
+        geometry = shapely.transform(affinity.affine_transform(polygon, pixel_to_crs), reproject)
+        writers[band].write({
+            "type": "Feature",
+            "properties": {"risk_level": RISK_LEVELS[code], "type": "risk_zone"},
+            "geometry": mapping(geometry),
+        })
+
+    tiles = plan_tiles(height, width, tile_size or max(height, width))
+    seams = {band: [] for band in bands}
+    try:
+        for final, tile_seams in run_tiles(risk_path, tiles, tolerances, workers):
+            for band in bands:
+                for wkb, code in final[band]:
+                    write(band, shapely.from_wkb(wkb), code)
+                seams[band] += tile_seams[band]
+        for band in bands:
+            for polygon, code in merge_seams(seams[band]):
+                write(band, polygon, code)
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    index = {
+        "bands": [
+            {"minzoom": min_zoom, "maxzoom": max_zoom, "tolerance_m": round(tolerance * abs(transform.a), 2),
+             "file": writers[band].path.name, "features": writers[band].count}
+            for band, (min_zoom, max_zoom, tolerance) in bands.items()
+        ]
+    }
+    with open(Path(output_file).with_suffix(".json"), "w") as f:
+        json.dump(index, f, indent=2)
+
+    if not writers["full"].count:
+        print("⚠️ No risk zones found to vectorize.")
+    else:
+        print(f"✔ Saved Legacy HAND vector model to {output_file} ({writers['full'].count} polygons, "
+              f"{len(tiles)} tiles, {len(seams['full'])} seam pieces merged)")
+    return index
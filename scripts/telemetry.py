@@ -0,0 +1,240 @@
+"""
+Per-stage telemetry of the pipeline scripts (fetch_*.py, generate_flood_model.py).
+
+A script runs inside `run(...)` and wraps its stages in `stage(name)`:
+
+    with run_from_args("fetch_roads_friction", args):
+        with stage("fetch_roads") as span:
+            roads = fetch_roads()
+            record(span, roads=roads)
+
+Every stage records its wall time, CPU time (this process and the worker
+processes reaped during the stage), the peak RSS (high-water mark of the
+process at the end of the stage, and how much the stage raised it) and the
+sizes given to `record` (arrays: shape, dtype and MB, lists: length,
+files: bytes). The run writes a JSON report to
+data/telemetry/<script>-<UTC time>.json, also when it fails, so runs can be
+compared before and after a change.
+
+One stage can be profiled (--profile-stage NAME):
+- cprofile: the stats are dumped next to the report (.prof, for snakeviz or
+  pstats) and the top functions by cumulative time are added to the report
+- tracemalloc: the peak traced memory and the lines holding the most
+  memory at the end of the stage
+Both only see the main process, run with --workers 1 to profile the work
+done in the process pools.
+
+Outside of `run` (scripts imported as modules), `stage` records nothing.
+Stages may run in several threads; CPU time and RSS are per process, so
+the figures of overlapping stages include each other.
+"""
+
+import cProfile
+import datetime
+import io
+import json
+import os
+import platform
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows: no rusage, memory and child CPU not reported
+    resource = None
+
+REPORT_DIR = Path(__file__).parent.parent / "data" / "telemetry"
+PROFILE_MODES = ('cprofile', 'tracemalloc')
+PROFILE_TOP = 20
+
+_run = None
+
+
+def rusage():
+    """(CPU s of this process, CPU s of reaped children, peak RSS MB, children peak RSS MB)."""
+    cpu = time.process_time()
+    if resource is None:
+        return cpu, 0.0, None, None
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    # ru_maxrss is in kB on Linux, in bytes on macOS
+    unit = 1 / 2 ** 20 if sys.platform == 'darwin' else 1 / 2 ** 10
+    return (cpu, children.ru_utime + children.ru_stime,
+            own.ru_maxrss * unit, children.ru_maxrss * unit)
+
+
+def describe_size(value):
+    """JSON description of a recorded size."""
+    if isinstance(value, np.ndarray):
+        return {"shape": list(value.shape), "dtype": str(value.dtype), "mb": round(value.nbytes / 2 ** 20, 3)}
+    if isinstance(value, Path):
+        return value.stat().st_size if value.exists() else None
+    if isinstance(value, (list, tuple, dict, set)):
+        return len(value)
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def record(span, **sizes):
+    """Attach sizes (arrays, row lists, files, counts) to a stage."""
+    span.setdefault("sizes", {}).update({key: describe_size(value) for key, value in sizes.items()})
+    return span
+
+
+def profile_top(profiler):
+    stats = pstats.Stats(profiler, stream=io.StringIO())
+    top = []
+    for (filename, line, function), (_, calls, tottime, cumtime, _) in \
+            sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:PROFILE_TOP]:
+        top.append({"function": f"{Path(filename).name}:{line}({function})", "calls": calls,
+                    "tottime_s": round(tottime, 4), "cumtime_s": round(cumtime, 4)})
+    return top
+
+
+@contextmanager
+def profiled(span, mode, prof_path):
+    """Run the body under cProfile or tracemalloc, results in the span."""
+    if mode == 'tracemalloc':
+        tracemalloc.start()
+        try:
+            yield
+        finally:
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            span["profile"] = {
+                "mode": mode,
+                "peak_traced_mb": round(peak / 2 ** 20, 3),
+                "top": [{"line": str(stat.traceback), "mb": round(stat.size / 2 ** 20, 3), "blocks": stat.count}
+                        for stat in snapshot.statistics("lineno")[:PROFILE_TOP]],
+            }
+        return
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        prof_path.parent.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(prof_path)
+        span["profile"] = {"mode": mode, "file": str(prof_path), "top": profile_top(profiler)}
+
+
+@contextmanager
+def stage(name, **sizes):
+    """Measure a stage of the current run, yields its span (a dict) for `record`."""
+    span = {"name": name}
+    record(span, **sizes)
+    if _run is None:
+        yield span
+        return
+
+    # One stack of open stages per thread (concurrent stages are siblings)
+    open_stages = _run["open"].setdefault(threading.get_ident(), [])
+    if open_stages:
+        span["parent"] = open_stages[-1]
+    open_stages.append(name)
+    _run["stages"].append(span)
+
+    wall0 = time.perf_counter()
+    cpu0, children0, rss0, _ = rusage()
+    try:
+        if name == _run["profile_stage"]:
+            _run["profiled"] = True
+            prof_path = _run["report_path"].with_suffix(f".{name}.prof")
+            with profiled(span, _run["profile_mode"], prof_path):
+                yield span
+        else:
+            yield span
+    except BaseException as e:
+        span["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        cpu1, children1, rss1, children_rss = rusage()
+        span["wall_s"] = round(time.perf_counter() - wall0, 4)
+        span["cpu_s"] = round(cpu1 - cpu0, 4)
+        span["children_cpu_s"] = round(children1 - children0, 4)
+        if rss1 is not None:
+            span["peak_rss_mb"] = round(rss1, 1)
+            span["rss_growth_mb"] = round(rss1 - rss0, 1)
+            span["children_peak_rss_mb"] = round(children_rss, 1)
+        open_stages.pop()
+
+
+def print_summary(report):
+    print(f"Telemetry ({report['script']}):")
+    for span in report["stages"]:
+        indent = "    " if "parent" in span else "  "
+        memory = f", peak RSS {span['peak_rss_mb']:.0f} MB" if "peak_rss_mb" in span else ""
+        print(f"{indent}{span['name']:<{28 - len(indent)}} {span['wall_s']:>8.2f}s wall, "
+              f"{span['cpu_s'] + span['children_cpu_s']:>8.2f}s CPU{memory}")
+
+
+@contextmanager
+def run(script, profile_stage=None, profile_mode='cprofile', report_dir=REPORT_DIR):
+    """Telemetry of a whole script run, the JSON report is written on exit."""
+    global _run
+    started = datetime.datetime.now(datetime.timezone.utc)
+    report_path = Path(report_dir) / f"{script}-{started:%Y%m%dT%H%M%SZ}.json"
+    _run = {"stages": [], "open": {}, "profile_stage": profile_stage, "profile_mode": profile_mode,
+            "profiled": False, "report_path": report_path}
+
+    report = {
+        "script": script,
+        "argv": sys.argv[1:],
+        "started": started.isoformat(timespec="seconds"),
+        "host": {"python": platform.python_version(), "platform": platform.platform(),
+                 "cpu_count": os.cpu_count()},
+        "status": "ok",
+    }
+    wall0 = time.perf_counter()
+    cpu0, children0, _, _ = rusage()
+    try:
+        yield report
+    except BaseException as e:
+        report["status"] = "failed"
+        report["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        cpu1, children1, rss, children_rss = rusage()
+        report.update({
+            "wall_s": round(time.perf_counter() - wall0, 4),
+            "cpu_s": round(cpu1 - cpu0, 4),
+            "children_cpu_s": round(children1 - children0, 4),
+            "peak_rss_mb": round(rss, 1) if rss is not None else None,
+            "children_peak_rss_mb": round(children_rss, 1) if children_rss is not None else None,
+            "stages": _run["stages"],
+        })
+        if profile_stage and not _run["profiled"]:
+            print(f"⚠️ Stage '{profile_stage}' never ran, nothing profiled")
+        _run = None
+
+        report_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(report_path, "w") as f:
+            json.dump(report, f, indent=2)
+        print_summary(report)
+        print(f"✔ Saved telemetry report to {report_path}")
+
+
+def add_telemetry_arguments(parser):
+    parser.add_argument("--profile-stage", default=None, metavar="NAME",
+                        help="Profile one stage of the run (see the stage names of the telemetry report)")
+    parser.add_argument("--profile-mode", choices=PROFILE_MODES, default='cprofile',
+                        help="cProfile (CPU, .prof dump) or tracemalloc (allocations) for --profile-stage")
+    parser.add_argument("--telemetry-dir", type=Path, default=REPORT_DIR,
+                        help="Directory of the JSON telemetry reports (default: data/telemetry)")
+    return parser
+
+
+def run_from_args(script, args):
+    return run(script, profile_stage=args.profile_stage, profile_mode=args.profile_mode,
+               report_dir=args.telemetry_dir)
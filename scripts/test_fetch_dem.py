@@ -0,0 +1,116 @@
+"""
+Check the DEM downloader against a local stand-in tile server (no network).
+
+The stand-in serves small GeoTIFFs in the {z}/{x}/{y}.tif layout of the
+tile source, one of them gzip-encoded, one truncated (Content-Length larger
+than the body) and one corrupt (not a GeoTIFF). The first run must keep the
+valid tiles and reject the broken ones without leaving files behind; once
+the server is repaired, a second run must skip the valid tiles and fetch
+the others.
+
+    python scripts/test_fetch_dem.py
+"""
+
+import gzip
+import io
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+
+from fetch_dem import fetch_dem, tile_filename, tile_range
+
+ZOOM = 9  # 4 tiles over Mauritius
+
+
+def geotiff_bytes(seed, size=16):
+    """A small single-band GeoTIFF."""
+    data = np.random.default_rng(seed).uniform(0, 800, (size, size)).astype(np.float32)
+    with rasterio.MemoryFile() as memfile:
+        with memfile.open(driver="GTiff", width=size, height=size, count=1, dtype="float32",
+                          crs="EPSG:3857", transform=from_origin(0, 0, 30, 30)) as dst:
+            dst.write(data, 1)
+        return memfile.read()
+
+
+def stub_handler(tiles, faults):
+    """Handler serving `tiles` ({path: bytes}), `faults` ({path: 'gzip'|'truncated'|'corrupt'})."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = tiles.get(self.path)
+            if body is None:
+                self.send_response(404)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+
+            fault = faults.get(self.path)
+            length = len(body)
+            if fault == "corrupt":
+                body = b"<html>not a tile</html>"
+                length = len(body)
+            elif fault == "gzip":
+                buffer = io.BytesIO()
+                with gzip.GzipFile(fileobj=buffer, mode="wb") as f:
+                    f.write(body)
+                body = buffer.getvalue()
+                length = len(body)
+
+            self.send_response(200)
+            self.send_header("Content-Type", "image/tiff")
+            self.send_header("Content-Length", str(length))
+            if fault == "gzip":
+                self.send_header("Content-Encoding", "gzip")
+            self.end_headers()
+            # Truncated: announce the full length, send half of it and close
+            self.wfile.write(body[:length // 2] if fault == "truncated" else body)
+
+        def log_message(self, fmt, *args):
+            pass
+
+    return Handler
+
+
+def serve(tiles, faults):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), stub_handler(tiles, faults))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def test_download_against_stand_in():
+    coords = tile_range(ZOOM)
+    paths = [f"/{ZOOM}/{x}/{y}.tif" for x, y in coords]
+    tiles = {path: geotiff_bytes(i) for i, path in enumerate(paths)}
+    faults = {paths[1]: "gzip", paths[2]: "truncated", paths[3]: "corrupt"}
+
+    server = serve(tiles, faults)
+    tile_url = f"http://127.0.0.1:{server.server_address[1]}/{{z}}/{{x}}/{{y}}.tif"
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            output_dir = Path(tmp)
+            counts = fetch_dem(zoom=ZOOM, workers=4, tile_url=tile_url, output_dir=output_dir)
+            assert counts == {"downloaded": 2, "skipped": 0, "failed": 2}, counts
+
+            for (x, y), path in zip(coords, paths):
+                output = output_dir / tile_filename(ZOOM, x, y)
+                if faults.get(path) in ("truncated", "corrupt"):
+                    assert not output.exists(), f"{output.name} kept from a broken download"
+                else:
+                    assert output.read_bytes() == tiles[path], f"{output.name} differs from the served tile"
+            assert not list(output_dir.glob("*.part")), "temporary files left behind"
+
+            faults.clear()
+            counts = fetch_dem(zoom=ZOOM, workers=4, tile_url=tile_url, output_dir=output_dir)
+            assert counts == {"downloaded": 2, "skipped": 2, "failed": 0}, counts
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    test_download_against_stand_in()
+    print("✔ DEM downloader checks passed")
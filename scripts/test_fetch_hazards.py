@@ -1,10 +1,10 @@
-from OSMPythonTools.nominatim import Nominatim
-from OSMPythonTools.overpass import Overpass, overpassQueryBuilder
+from OSMPythonTools.overpass import overpassQueryBuilder
+
+from osm_cache import CachedOverpass, resolve_area_id, parse_cache_args
 
 def check_hazards():
-    nominatim = Nominatim()
-    areaId = nominatim.query('Mauritius').areaId()
-    overpass = Overpass()
+    areaId = resolve_area_id()
+    overpass = CachedOverpass()
 
     queries = {
         "hazard=flood": f'"hazard"="flood"',
@@ -30,4 +30,5 @@ def check_hazards():
             print(f"- {label}: Error ({e})")
 
 if __name__ == "__main__":
+    parse_cache_args("Probe OSM for hazard tags")
     check_hazards()
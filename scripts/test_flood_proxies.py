@@ -1,10 +1,10 @@
-from OSMPythonTools.nominatim import Nominatim
-from OSMPythonTools.overpass import Overpass, overpassQueryBuilder
+from OSMPythonTools.overpass import overpassQueryBuilder
+
+from osm_cache import CachedOverpass, resolve_area_id, parse_cache_args
 
 def check_proxies():
-    nominatim = Nominatim()
-    areaId = nominatim.query('Mauritius').areaId()
-    overpass = Overpass()
+    areaId = resolve_area_id()
+    overpass = CachedOverpass()
 
     queries = {
         "waterway=river": f'"waterway"="river"',
@@ -30,4 +30,5 @@ def check_proxies():
             print(f"- {label}: Error ({e})")
 
 if __name__ == "__main__":
+    parse_cache_args("Probe OSM for flood proxy tags")
     check_proxies()
@@ -0,0 +1,110 @@
+"""
+Check the Overpass cache against the local stand-in endpoint (no network).
+
+CachedOverpass only replaces the download of OSMPythonTools: the cache
+keys must be the ones the library computes itself (the entries written by
+a plain Overpass client stay valid, and the other way round), and the
+library options (onlyCached) must keep working. The stand-in of
+overpass_scheduler.py replays the responses of a temporary cache.
+
+    python scripts/test_osm_cache.py
+"""
+
+import tempfile
+import threading
+from http.server import ThreadingHTTPServer
+from pathlib import Path
+
+import ujson
+from OSMPythonTools.cachingStrategy import CachingStrategy
+from OSMPythonTools.cachingStrategy.base import CachingStrategyBase
+from OSMPythonTools.overpass import Overpass
+
+from osm_cache import CachedOverpass, configure_cache, configure_scheduler, normalize_query
+from overpass_scheduler import cache_key, stub_handler
+
+QUERY = '''area(3600000001)->.searchArea;
+    ( node["amenity"="school"](area.searchArea); );
+    out center;'''
+TIMEOUT = 30
+
+
+def response(count):
+    """Raw Overpass response with `count` schools."""
+    return {"version": "1.0", "timestamp": None, "response": {
+        "version": 0.6, "generator": "stand-in", "osm3s": {"timestamp_osm_base": "2026-01-01T00:00:00Z"},
+        "elements": [{"type": "node", "id": i + 1, "lat": -20.2, "lon": 57.5, "tags": {"amenity": "school"}}
+                     for i in range(count)]}}
+
+
+class KeyRecorder(CachingStrategyBase):
+    """Caching strategy recording the keys asked by the library, always a miss."""
+
+    def __init__(self):
+        self.keys = []
+
+    def get(self, key):
+        self.keys.append(key)
+        return None
+
+    def set(self, key, value):
+        pass
+
+
+def library_key(query):
+    """Cache key computed by a plain OSMPythonTools Overpass client."""
+    recorder = CachingStrategy.use(KeyRecorder)
+    assert Overpass().query(query, timeout=TIMEOUT, onlyCached=True) is None
+    return recorder.keys[-1]
+
+
+def serve(replay_dir):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), stub_handler(replay_dir))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def write_entry(path, data):
+    with open(path, "w") as f:
+        ujson.dump(data, f)
+
+
+def test_cache_keys_against_stand_in():
+    with tempfile.TemporaryDirectory() as tmp:
+        replay_dir, cache_dir = Path(tmp) / "replay", Path(tmp) / "cache"
+        replay_dir.mkdir()
+        query_string = Overpass()._queryString(normalize_query(QUERY), timeout=TIMEOUT, settings={})[0]
+        key = library_key(normalize_query(QUERY))
+        assert cache_key(query_string) == key, "the stand-in does not use the library cache key"
+        write_entry(replay_dir / f"{key}.json", response(1))
+
+        server = serve(replay_dir)
+        try:
+            configure_scheduler([f"http://127.0.0.1:{server.server_address[1]}/api/"])
+            configure_cache(cache_dir=cache_dir, ttl_hours=None)
+
+            # Download through the scheduler, cached under the library key
+            assert len(CachedOverpass().query("  " + QUERY, timeout=TIMEOUT).elements()) == 1
+            assert (cache_dir / f"{key}.json").exists(), "not cached under the library key"
+
+            # Library options
+            assert CachedOverpass().query(QUERY + " ", timeout=TIMEOUT, onlyCached=True) is not None
+            assert CachedOverpass().query("node(1); out;", timeout=TIMEOUT, onlyCached=True) is None
+
+            # fresh: downloaded again and cached, the cached entry is used otherwise
+            write_entry(replay_dir / f"{key}.json", response(2))
+            assert len(CachedOverpass().query(QUERY, timeout=TIMEOUT).elements()) == 1
+            assert len(CachedOverpass().query(QUERY, timeout=TIMEOUT, fresh=True).elements()) == 2
+            assert len(CachedOverpass().query(QUERY, timeout=TIMEOUT).elements()) == 2
+
+            # Offline: the cache is replayed even when fresh is asked
+            configure_cache(cache_dir=cache_dir, ttl_hours=None, offline=True)
+            assert len(CachedOverpass().query(QUERY, timeout=TIMEOUT, fresh=True).elements()) == 2
+        finally:
+            server.shutdown()
+            configure_cache()
+
+
+if __name__ == "__main__":
+    test_cache_keys_against_stand_in()
+    print("✔ Overpass cache checks passed")
@@ -0,0 +1,238 @@
+"""
+Out-of-core priority-flood on the DEM band of a raster store.
+
+The single pass of priority_flood.py holds the flood tree of the whole
+mosaic in memory (~300 bytes per land cell), which does not fit for the
+zoom 13/14 DEMs. Here the DEM is flooded by tiles, as in Barnes et al.,
+"Parallel Priority-Flood depression filling for trillion cell digital
+elevation models" (2016):
+
+1. ocean band: the cells at or below the sea level connected to the
+   raster edge, labeled per tile and joined across the tile seams
+2. per tile, a priority-flood from the ocean and from the tile edge: the
+   local filled elevation of every cell and its label, the exit cell of
+   its flood path. 8-neighbour cells with different labels (and the
+   cells on the raster edge, with the ocean) link their labels at the
+   level max(local filled elevations)
+3. the graph of the labels, with the links across the tile seams, is
+   small (edge and coast cells): its minimax levels from the ocean are the
+   spill levels of the labels
+4. per tile, filled elevation = max(local filled, spill level of the label)
+
+This is the same minimax level as the single pass, so the filled DEM is
+bit-identical whatever the tile size. The tiles are sized from the memory
+budget and flooded in a process pool; their local results are kept in
+temporary files between the passes.
+"""
+
+import math
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import numpy as np
+from rasterio.windows import Window
+from scipy.ndimage import label
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
+
+from priority_flood import exit_cells, flood_tree, label_links, min_links, minimax_levels
+from raster_store import CATEGORICAL, TILE_SIZE, create_band, finalize_band, load_manifest, read_band
+
+FLOOD_BYTES_PER_PIXEL = 320  # peak of flood_tree per land cell (measured ~300)
+OCEAN = -1  # label of the ocean (and of the outside of the raster)
+SIDES = ("top", "bottom", "left", "right")
+
+
+def flood_memory_mb(pixels):
+    """Peak memory of a single-pass priority-flood on `pixels` cells."""
+    return pixels * FLOOD_BYTES_PER_PIXEL / 2 ** 20
+
+
+def tile_size_for_budget(memory_budget_mb, height, width):
+    """Side of the flood tiles (multiple of TILE_SIZE) fitting in the budget."""
+    side = int(math.sqrt(memory_budget_mb * 2 ** 20 / FLOOD_BYTES_PER_PIXEL))
+    if side >= max(height, width):
+        return max(height, width)
+    return max(TILE_SIZE, side // TILE_SIZE * TILE_SIZE)
+
+
+def tile_windows(height, width, size):
+    return [Window(col, row, min(size, width - col), min(size, height - row))
+            for row in range(0, height, size) for col in range(0, width, size)]
+
+
+def edge_strips(values):
+    """Values of the first and last rows and columns of a tile."""
+    return {"top": values[0], "bottom": values[-1], "left": values[:, 0], "right": values[:, -1]}
+
+
+def raster_edges(window, height, width):
+    """Sides of a tile lying on the raster edge."""
+    return [side for side, on_edge in (("top", window.row_off == 0),
+                                       ("bottom", window.row_off + window.height == height),
+                                       ("left", window.col_off == 0),
+                                       ("right", window.col_off + window.width == width)) if on_edge]
+
+
+def seam_pairs(windows, strips, height, width):
+    """
+    The 8-neighbour cells on both sides of every tile seam, from the edge
+    strips of the tiles ({side: {field: values}} per tile). Returns
+    ({field: values on one side}, {field: values on the other side}).
+    """
+    first, second = {}, {}
+
+    def seam(side, select, along, length):
+        values = {}
+        for window, tile in zip(windows, strips):
+            if select(window):
+                offset = window.row_off if along == "rows" else window.col_off
+                for field, strip in tile[side].items():
+                    values.setdefault(field, np.empty(length, dtype=strip.dtype))[offset:offset + len(strip)] = strip
+        return values
+
+    def pair(near, far, length):
+        for d in (-1, 0, 1):
+            lo, hi = max(0, -d), min(length, length - d)
+            for field in near:
+                first.setdefault(field, []).append(near[field][lo:hi])
+                second.setdefault(field, []).append(far[field][lo + d:hi + d])
+
+    for col in sorted({w.col_off for w in windows if w.col_off > 0}):
+        pair(seam("right", lambda w: w.col_off + w.width == col, "rows", height),
+             seam("left", lambda w: w.col_off == col, "rows", height), height)
+    for row in sorted({w.row_off for w in windows if w.row_off > 0}):
+        pair(seam("bottom", lambda w: w.row_off + w.height == row, "cols", width),
+             seam("top", lambda w: w.row_off == row, "cols", width), width)
+    return ({field: np.concatenate(values) for field, values in first.items()},
+            {field: np.concatenate(values) for field, values in second.items()})
+
+
+def below_sea_labels(dem, sea_level=0.0):
+    """8-connected components of the cells at or below the sea level (or nodata), 0 elsewhere."""
+    labels, count = label(~(dem > sea_level), structure=np.ones((3, 3)))
+    return labels, count
+
+
+def write_ocean_band(store, windows, sea_level=0.0, layout='tiled'):
+    """
+    "ocean" band: cells at or below the sea level connected to the raster
+    edge (ocean_mask of priority_flood.py, by tiles).
+    """
+    grid = load_manifest(store)["grid"]
+    height, width = grid["height"], grid["width"]
+
+    # Components of every tile (ids offset per tile), joined across the seams
+    offsets, strips, on_edge = [], [], []
+    total = 0
+    for window in windows:
+        labels, count = below_sea_labels(read_band(store, "dem", window), sea_level)
+        ids = np.where(labels > 0, labels.astype(np.int64) + total - 1, -1)
+        tile = edge_strips(ids)
+        strips.append({side: {"id": tile[side]} for side in SIDES})
+        on_edge += [tile[side][tile[side] >= 0] for side in raster_edges(window, height, width)]
+        offsets.append(total)
+        total += count
+
+    near, far = seam_pairs(windows, strips, height, width)
+    joined = (near["id"] >= 0) & (far["id"] >= 0) if near else np.zeros(0, dtype=bool)
+    graph = csr_matrix((np.ones(int(joined.sum())), (near["id"][joined], far["id"][joined])),
+                       shape=(total, total)) if near else csr_matrix((total, total))
+    _, component = connected_components(graph, directed=False)
+    edge_components = np.unique(component[np.concatenate(on_edge)]) if on_edge else np.zeros(0, dtype=np.int64)
+    is_ocean = np.isin(component, edge_components)
+
+    with create_band(store, "ocean", "uint8", layout=layout, description="ocean (below sea level, open)") as dst:
+        for window, offset in zip(windows, offsets):
+            labels, _ = below_sea_labels(read_band(store, "dem", window), sea_level)
+            ocean = np.zeros(labels.shape, dtype=np.uint8)
+            inside = labels > 0
+            ocean[inside] = is_ocean[labels[inside].astype(np.int64) + offset - 1]
+            dst.write(ocean, 1, window=window)
+    finalize_band(store, "ocean", CATEGORICAL)
+
+
+def local_flood(window, context):
+    """
+    Priority-flood of one tile from the ocean and the tile edge. Saves the
+    local filled elevation and the labels (flat index of the exit cell in
+    the raster, OCEAN) of the tile, returns its label links and edge strips.
+    """
+    store, width, height = context["store"], context["width"], context["height"]
+    dem = read_band(store, "dem", window)
+    ocean = read_band(store, "ocean", window) > 0
+
+    tree = flood_tree(dem, ocean)
+    cells = tree["cells"]
+    levels = np.full(dem.shape, -np.inf)
+    levels.ravel()[cells] = tree["filled"]
+    rows, cols = np.divmod(cells[exit_cells(tree)], window.width)
+    labels = np.full(dem.shape, OCEAN, dtype=np.int64)
+    labels.ravel()[cells] = (rows + window.row_off) * width + cols + window.col_off
+    del tree, cells, rows, cols
+
+    a, b, level = label_links(labels, levels)
+    # Cells on the raster edge drain out of the raster, like to the ocean
+    tile_labels, tile_levels = edge_strips(labels), edge_strips(levels)
+    for side in raster_edges(window, height, width):
+        land = tile_labels[side] != OCEAN
+        a = np.concatenate([a, tile_labels[side][land]])
+        b = np.concatenate([b, np.full(int(land.sum()), OCEAN)])
+        level = np.concatenate([level, tile_levels[side][land]])
+
+    np.savez(context["tmp_dir"] / f"{window.row_off}_{window.col_off}.npz", labels=labels, levels=levels)
+    strips = {side: {"label": tile_labels[side].copy(), "level": tile_levels[side].copy()} for side in SIDES}
+    return (a, b, level), strips
+
+
+def write_sea_onset_band(store, memory_budget_mb, workers=1, layout='tiled', tile_size=None):
+    """
+    "sea_onset" band: the filled elevation of every cell, the sea level at
+    which it gets connected to the sea (the ocean cells keep their
+    elevation). Writes the "ocean" band first. Returns the tile size.
+    """
+    grid = load_manifest(store)["grid"]
+    height, width = grid["height"], grid["width"]
+    tile_size = tile_size or tile_size_for_budget(memory_budget_mb, height, width)
+    windows = tile_windows(height, width, tile_size)
+
+    write_ocean_band(store, windows, layout=layout)
+
+    tmp_dir = store / "flood_tiles.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+    context = {"store": store, "width": width, "height": height, "tmp_dir": tmp_dir}
+    try:
+        if workers <= 1 or len(windows) == 1:
+            results = [local_flood(window, context) for window in windows]
+        else:
+            with ProcessPoolExecutor(max_workers=min(workers, len(windows))) as executor:
+                results = list(executor.map(local_flood, windows, repeat(context)))
+
+        # Label graph: links inside the tiles and across the seams
+        links, strips = zip(*results)
+        near, far = seam_pairs(windows, strips, height, width)
+        a = [link[0] for link in links]
+        b = [link[1] for link in links]
+        level = [link[2] for link in links]
+        if near:
+            differ = near["label"] != far["label"]
+            a.append(near["label"][differ])
+            b.append(far["label"][differ])
+            level.append(np.maximum(near["level"][differ], far["level"][differ]))
+        nodes, spill = minimax_levels(*min_links(np.concatenate(a), np.concatenate(b), np.concatenate(level)),
+                                      OCEAN)
+        print(f"Priority-flood: {len(windows)} tiles of {tile_size}px, {len(nodes)} labels")
+
+        with create_band(store, "sea_onset", "float32", layout=layout,
+                         description="flood-onset sea level (m)") as dst:
+            for window in windows:
+                tile = np.load(tmp_dir / f"{window.row_off}_{window.col_off}.npz")
+                filled = np.maximum(tile["levels"], spill[np.searchsorted(nodes, tile["labels"])])
+                ocean = tile["labels"] == OCEAN
+                filled[ocean] = read_band(store, "dem", window)[ocean]
+                dst.write(filled.astype(np.float32), 1, window=window)
+        finalize_band(store, "sea_onset")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return tile_size